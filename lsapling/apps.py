@@ -1,6 +1,7 @@
-from django.apps import AppConfig
-from django.db import connection
-from django.db.models.signals import pre_migrate
+from django.apps import AppConfig, apps
+from django.db import connection, connections
+from django.db.models.signals import post_delete, post_migrate, \
+    post_save, pre_migrate
 
 
 def create_extension_callback(sender, **kwargs):
@@ -15,8 +16,49 @@ def create_extension_callback(sender, **kwargs):
     cursor.execute("CREATE EXTENSION IF NOT EXISTS ltree")
 
 
+def create_indexes_callback(sender, using='default', **kwargs):
+    '''
+    Create the GiST and B-tree indexes of the NodePathFields that request
+    them, if they don't already exist, after syncing the database. The B-tree
+    indexes are created by the migrations, except in the tables created when
+    `db_index` was not the default of the field, as the migrations of the
+    field don't change. The trees without the denormalized `_depth` also get
+    an index on `(nlevel(_path), _path)`, for their breadth-first order.
+    Requires PostgreSQL 9.5 or newer.
+    '''
+    from fields import NodePathField
+    from models import DenormalizedTreeMixin, Tree
+
+    db_connection = connections[using]
+    tables = db_connection.introspection.table_names()
+    with db_connection.schema_editor() as schema_editor:
+        for model in apps.get_models():
+            opts = model._meta
+            if not opts.managed or opts.proxy or opts.swapped or \
+                    opts.db_table not in tables:
+                continue
+            for field in opts.local_fields:
+                if not isinstance(field, NodePathField):
+                    continue
+                if field.gist_index:
+                    schema_editor.execute(
+                        field.get_gist_index_sql(model, schema_editor))
+                if field.db_index and not field.unique:
+                    schema_editor.execute(
+                        field.get_btree_index_sql(model, schema_editor))
+                if field.name == '_path' and issubclass(model, Tree) and \
+                        not issubclass(model, DenormalizedTreeMixin):
+                    schema_editor.execute(
+                        field.get_depth_index_sql(model, schema_editor))
+
+
 class SaplingConfig(AppConfig):
     name = 'lsapling'
 
     def ready(self):
         pre_migrate.connect(create_extension_callback, sender=self)
+        post_migrate.connect(create_indexes_callback, sender=self)
+
+        from cache import invalidate_instance_callback
+        post_save.connect(invalidate_instance_callback)
+        post_delete.connect(invalidate_instance_callback)
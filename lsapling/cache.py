@@ -0,0 +1,248 @@
+'''
+Optional cache of the ascendants, children and subtrees of the nodes, using
+the Django cache configured by `LSAPLING_CACHE` (the alias of one of the
+`CACHES`).
+
+The entries are keyed by path and tagged with a per-model generation:
+- inserting, saving or deleting a node deletes the entries of its path, the
+  children of its parent and the subtrees of its ascendants.
+- moving or rebalancing nodes rewrites the paths of whole subtrees, so it
+  starts a new generation, invalidating all the entries of the model.
+The entries are invalidated right after the writes and, if they run in a
+transaction, again once it is committed, as a concurrent reader can cache the
+rows it sees until then (with `transaction.on_commit()` on Django 1.9+, and at
+the end of the transactions started by the tree operations on Django 1.8).
+The ascendants are cached node by node, as they are shared by all their
+descendants, and fetched together with the generation in a single round
+trip. Paths changed with a raw `update()` are not tracked.
+'''
+import hashlib
+import uuid
+from contextlib import contextmanager
+from threading import Lock, local
+
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils.encoding import force_bytes
+
+import settings
+from ltree import LtreePath
+from subtree import build_subtree
+
+_stats = {}
+_stats_lock = Lock()
+# invalidations to run again at the end of the outermost `atomic()` block,
+# for each database alias
+_deferred = local()
+
+
+def get_tree_cache(model):
+    '''
+    Return the `TreeCache` of `model`, or None if the cache is disabled.
+    '''
+    if not settings.LSAPLING_CACHE:
+        return None
+    return TreeCache(model, caches[settings.LSAPLING_CACHE])
+
+
+class TreeCache(object):
+    def __init__(self, model, cache):
+        self.model = model
+        self.cache = cache
+        self.timeout = settings.LSAPLING_CACHE_TIMEOUT
+        self.generation_key = 'lsapling:%s:generation' % \
+            model._meta.db_table
+
+    def get_ascendants(self, node):
+        '''
+        Return the list of ascendants of `node`, from the root down.
+        '''
+        paths = node._path.ascendants
+        if not paths:
+            return []
+
+        keys = dict((self.make_key('node', path), path) for path in paths)
+        values = self.cache.get_many([self.generation_key] + list(keys))
+        generation = self.get_generation(values)
+        found = {}
+        for key, path in keys.items():
+            entry = values.get(key)
+            if entry is not None and entry[0] == generation:
+                found[path] = entry[1]
+
+        missing = [path for path in paths if path not in found]
+        self.record('ascendants', not missing)
+        if missing:
+            fetched = self.model.objects.filter(_path__in=missing)
+            self.cache.set_many(
+                dict((self.make_key('node', instance._path),
+                      (generation, instance)) for instance in fetched),
+                self.timeout)
+            found.update((instance._path, instance) for instance in fetched)
+        return [found[path] for path in paths if path in found]
+
+    def get_children(self, node):
+        '''
+        Return the list of children of `node`.
+        '''
+        return self.get_list('children', node,
+                             lambda: list(node.get_children()))
+
+    def get_subtree(self, node):
+        '''
+        Return the node and its descendants as an in-memory `SubtreeNode`
+        graph. Raises DoesNotExist if the node doesn't exist anymore.
+        '''
+        queryset = self.model.objects.all()
+        instances = self.get_list(
+            'subtree', node,
+            lambda: list(queryset.filter(_path__descendant=node._path).
+                         order_by(*queryset.subtree_ordering)))
+        roots = build_subtree(instances)
+        if not roots or roots[0].instance._path != node._path:
+            raise queryset._does_not_exist()
+        return roots[0]
+
+    def get_list(self, kind, node, fetch):
+        key = self.make_key(kind, node._path)
+        values = self.cache.get_many([self.generation_key, key])
+        generation = self.get_generation(values)
+        entry = values.get(key)
+        hit = entry is not None and entry[0] == generation
+        self.record(kind, hit)
+        if hit:
+            return entry[1]
+        instances = fetch()
+        self.cache.set(key, (generation, instances), self.timeout)
+        return instances
+
+    def get_generation(self, values):
+        '''
+        Return the current generation from the fetched `values`, starting a
+        new one if it is missing (for example, if it was evicted).
+        '''
+        generation = values.get(self.generation_key)
+        if generation is None:
+            self.cache.add(self.generation_key, uuid.uuid4().hex, None)
+            generation = self.cache.get(self.generation_key)
+        return generation
+
+    def invalidate(self, paths=None, using=DEFAULT_DB_ALIAS):
+        '''
+        Invalidate the entries affected by writing the nodes at `paths`, or
+        all the entries of the model if None, right away and, if the writes
+        run in a transaction, again once it is committed.
+        '''
+        def invalidate():
+            if paths is None:
+                self.invalidate_all()
+            else:
+                self.invalidate_paths(paths)
+        invalidate()
+        if connections[using].in_atomic_block:
+            on_commit(invalidate, using)
+
+    def invalidate_paths(self, paths):
+        '''
+        Delete the entries affected by inserting, saving or deleting the
+        nodes at `paths`.
+        '''
+        keys = set()
+        for path in paths:
+            path = LtreePath(path)
+            keys.add(self.make_key('node', path))
+            keys.add(self.make_key('children', path))
+            if path.depth > 1:
+                keys.add(self.make_key('children', path.parent))
+            for ascendant in path.ascendants + [path]:
+                keys.add(self.make_key('subtree', ascendant))
+        if keys:
+            self.cache.delete_many(list(keys))
+
+    def invalidate_all(self):
+        '''
+        Start a new generation, invalidating all the entries of the model.
+        '''
+        self.cache.set(self.generation_key, uuid.uuid4().hex, None)
+
+    def make_key(self, kind, path):
+        # paths can be longer than the key length limit of some backends
+        return 'lsapling:%s:%s:%s' % (
+            self.model._meta.db_table, kind,
+            hashlib.md5(force_bytes(path)).hexdigest())
+
+    def record(self, kind, hit):
+        with _stats_lock:
+            stats = _stats.setdefault(kind, {'hits': 0, 'misses': 0})
+            stats['hits' if hit else 'misses'] += 1
+
+
+def on_commit(func, using=DEFAULT_DB_ALIAS):
+    '''
+    Run `func` once the current transaction is committed. Without
+    `transaction.on_commit()` (Django 1.8), it is run at the end of the
+    outermost atomic block if that block is an `atomic()` of this module,
+    and dropped otherwise.
+    '''
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(func, using=using)
+    else:
+        pending = getattr(_deferred, using, None)
+        if pending is not None:
+            pending.append(func)
+
+
+@contextmanager
+def atomic(using=DEFAULT_DB_ALIAS):
+    '''
+    `transaction.atomic(savepoint=False)`, running the functions deferred
+    with `on_commit()` on Django 1.8 once the block has committed the
+    transaction, if it is the outermost one.
+    '''
+    outermost = not hasattr(transaction, 'on_commit') and \
+        not connections[using].in_atomic_block
+    if outermost:
+        setattr(_deferred, using, [])
+    try:
+        with transaction.atomic(using=using, savepoint=False):
+            yield
+        pending = getattr(_deferred, using, None) if outermost else None
+    finally:
+        if outermost:
+            delattr(_deferred, using)
+    for func in pending or ():
+        func()
+
+
+def invalidate_instance_callback(sender, instance, using=DEFAULT_DB_ALIAS,
+                                 **kwargs):
+    '''
+    Invalidate the entries affected by saving or deleting a node, at its
+    current path and at the path it was fetched or last saved with, if
+    `save()` changed it.
+    '''
+    from models import Tree
+
+    if isinstance(instance, Tree):
+        tree_cache = get_tree_cache(sender)
+        if tree_cache is not None:
+            paths = [instance._path]
+            saved_path = instance.__dict__.get('_saved_path')
+            if saved_path is not None and saved_path != instance._path:
+                paths.append(saved_path)
+            tree_cache.invalidate(paths, using=using)
+        instance._saved_path = instance._path
+
+
+def get_stats():
+    '''
+    Return the number of `hits` and `misses` of the cache for each kind of
+    entry (`ascendants`, `children` and `subtree`).
+    '''
+    with _stats_lock:
+        return dict((kind, dict(stats)) for kind, stats in _stats.items())
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -1,14 +1,192 @@
 from django.db import models
+from django.utils import six
+
 import lookups
+from ltree import LtreePath, validate_path
+
+
+class LtreePathDescriptor(object):
+    '''
+    Attribute of the `NodePathField`s, converting the strings assigned to it
+    to `LtreePath`s.
+    '''
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.__dict__[self.field.attname]
+
+    def __set__(self, instance, value):
+        if isinstance(value, six.string_types):
+            value = LtreePath(value)
+        instance.__dict__[self.field.attname] = value
 
 
 class NodePathField(models.Field):
+    '''
+    ltree column. By default the column is indexed with a B-tree index (for
+    equality and sorting, via `db_index`) and a GiST index (for the ltree
+    operators), the latter being created by the `post_migrate` callback in
+    `lsapling.apps` (which also creates the B-tree index missing in the
+    tables created when `db_index` was not the default). The values are
+    `lsapling.ltree.LtreePath`s.
+
+    @param gist_index: create a GiST (`gist_ltree_ops`) index for the column.
+    @param gist_siglen: optional signature length in bytes for the GiST index,
+        a multiple of 4 (requires PostgreSQL 13+).
+    '''
+    GIST_SIGLEN_MAX = 2024
+    default_validators = [validate_path]
+
     def db_type(self, connection):
         return 'ltree'
 
+    def contribute_to_class(self, cls, name, **kwargs):
+        super(NodePathField, self).contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.name, LtreePathDescriptor(self))
+
+    def from_db_value(self, value, expression, connection, context):
+        if value is None:
+            return value
+        return LtreePath(value)
+
+    def to_python(self, value):
+        if isinstance(value, six.string_types):
+            return LtreePath(value)
+        return value
+
     def __init__(self, *args, **kwargs):
+        kwargs.setdefault('db_index', True)
+        self.gist_index = kwargs.pop('gist_index', True)
+        self.gist_siglen = kwargs.pop('gist_siglen', None)
+        if self.gist_siglen is not None and \
+                (not 0 < self.gist_siglen <= self.GIST_SIGLEN_MAX or
+                 self.gist_siglen % 4):
+            raise ValueError("'gist_siglen' must be a multiple of 4 between "
+                             "4 and %s" % self.GIST_SIGLEN_MAX)
         super(NodePathField, self).__init__(*args, **kwargs)
 
+    def deconstruct(self):
+        name, path, args, kwargs = super(NodePathField, self).deconstruct()
+        if kwargs.get('db_index'):
+            del kwargs['db_index']
+        else:
+            kwargs['db_index'] = False
+        if not self.gist_index:
+            kwargs['gist_index'] = False
+        if self.gist_siglen is not None:
+            kwargs['gist_siglen'] = self.gist_siglen
+        return name, path, args, kwargs
+
+    def get_gist_index_sql(self, model, schema_editor):
+        '''
+        Return the statement for creating the GiST index of the field.
+        '''
+        opclass = 'gist_ltree_ops'
+        if self.gist_siglen is not None:
+            opclass += '(siglen=%s)' % int(self.gist_siglen)
+        index_name = schema_editor._create_index_name(model, [self.column],
+                                                      suffix='_gist')
+        return 'CREATE INDEX IF NOT EXISTS %s ON %s USING gist (%s %s)' % (
+            schema_editor.quote_name(index_name),
+            schema_editor.quote_name(model._meta.db_table),
+            schema_editor.quote_name(self.column),
+            opclass)
+
+    def get_btree_index_sql(self, model, schema_editor):
+        '''
+        Return the statement for creating the B-tree index of the field
+        requested by `db_index`, named as the schema editor names it, so that
+        it is only created for the tables migrated before it was the default.
+        '''
+        index_name = schema_editor._create_index_name(model, [self.column])
+        return 'CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (
+            schema_editor.quote_name(index_name),
+            schema_editor.quote_name(model._meta.db_table),
+            schema_editor.quote_name(self.column))
+
+    def get_depth_index_sql(self, model, schema_editor):
+        '''
+        Return the statement for creating the B-tree index of the depth and
+        the path, `(nlevel(path), path)`, sorting the nodes breadth-first.
+        '''
+        index_name = schema_editor._create_index_name(model, [self.column],
+                                                      suffix='_nlevel')
+        return 'CREATE INDEX IF NOT EXISTS %s ON %s (nlevel(%s), %s)' % (
+            schema_editor.quote_name(index_name),
+            schema_editor.quote_name(model._meta.db_table),
+            schema_editor.quote_name(self.column),
+            schema_editor.quote_name(self.column))
+
+
+class NodeDepthField(models.PositiveSmallIntegerField):
+    '''
+    Number of labels of the `_path` of the instance, denormalized and kept up
+    to date when saving the instance and when rewriting paths.
+    '''
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('db_index', True)
+        kwargs.setdefault('editable', False)
+        super(NodeDepthField, self).__init__(*args, **kwargs)
+
+    def get_path_value(self, path):
+        return LtreePath(path).depth
+
+    def get_path_expression(self, path):
+        '''
+        Return the expression calculating the value from the path expression
+        `path`, used in UPDATE queries.
+        '''
+        from functions import Nlevel
+        return Nlevel(path, output_field=models.PositiveSmallIntegerField())
+
+    def pre_save(self, model_instance, add):
+        value = self.get_path_value(model_instance._path)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class NodeParentPathField(NodePathField):
+    '''
+    Path of the parent of the instance (empty for root nodes), denormalized
+    and kept up to date when saving the instance and when rewriting paths.
+    Only indexed with a B-tree index, as it is meant for equality lookups.
+    '''
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('gist_index', False)
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('blank', True)
+        super(NodeParentPathField, self).__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(NodeParentPathField,
+                                         self).deconstruct()
+        kwargs.pop('gist_index', None)
+        if self.gist_index:
+            kwargs['gist_index'] = True
+        return name, path, args, kwargs
+
+    def get_path_value(self, path):
+        return LtreePath(path).parent
+
+    def get_path_expression(self, path):
+        '''
+        Return the expression calculating the value from the path expression
+        `path`, used in UPDATE queries.
+        '''
+        from functions import Nlevel, Subpath
+        return Subpath(path, 0,
+                       Nlevel(path, output_field=models.IntegerField()) - 1,
+                       output_field=NodePathField())
+
+    def pre_save(self, model_instance, add):
+        value = self.get_path_value(model_instance._path)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
 NodePathField.register_lookup(lookups.LtreeAscendant)
 NodePathField.register_lookup(lookups.LtreeDescendant)
 NodePathField.register_lookup(lookups.LtreePathLike)
@@ -16,3 +194,4 @@ NodePathField.register_lookup(lookups.LtreePathLikeTxt)
 NodePathField.register_lookup(lookups.LtreePathLikeExact)
 
 NodePathField.register_lookup(lookups.LtreeNlevel)
+NodePathField.register_lookup(lookups.LtreeText)
@@ -1,4 +1,13 @@
-from django.db.models import Func, Value
+from django.db.models import Aggregate, BooleanField, Func, IntegerField, \
+    TextField, Value
+from django.db.models.expressions import Expression
+from django.db.models.sql.query import Query
+from django.db.models.sql.where import AND, ExtraWhere
+
+
+def _path_field():
+    from fields import NodePathField
+    return NodePathField()
 
 
 class Subpath(Func):
@@ -24,3 +33,273 @@ class Subpath(Func):
 
 class Nlevel(Func):
     function = 'NLEVEL'
+
+
+class LtreeConcat(Func):
+    '''
+    ltree || ltree
+    ltree    concatenate ltree paths
+    '''
+    template = '(%(expressions)s)'
+    arg_joiner = ' || '
+
+    def __init__(self, *expressions, **extra):
+        extra.setdefault('output_field', _path_field())
+        super(LtreeConcat, self).__init__(*expressions, **extra)
+
+
+class Subltree(Func):
+    '''
+    subltree(ltree, int start, int end)
+    ltree    subpath of ltree from position start to position end-1 (counting
+             from 0)
+    '''
+    function = 'SUBLTREE'
+
+    def __init__(self, expression, start, end, **extra):
+        if not hasattr(start, 'resolve_expression'):
+            start = Value(start)
+        if not hasattr(end, 'resolve_expression'):
+            end = Value(end)
+        extra.setdefault('output_field', _path_field())
+        super(Subltree, self).__init__(expression, start, end, **extra)
+
+
+class LtreeIndex(Func):
+    '''
+    index(ltree a, ltree b [, int offset])
+    integer    position of first occurrence of b in a (starting at offset,
+               counted from the end if negative); -1 if not found
+
+    @param sub: path to search for, as a string or an expression.
+    '''
+    function = 'INDEX'
+
+    def __init__(self, expression, sub, offset=None, **extra):
+        if not hasattr(sub, 'resolve_expression'):
+            sub = Value(sub)
+        expressions = [expression, sub]
+        if offset is not None:
+            if not hasattr(offset, 'resolve_expression'):
+                offset = Value(offset)
+            expressions.append(offset)
+        extra.setdefault('output_field', IntegerField())
+        super(LtreeIndex, self).__init__(*expressions, **extra)
+
+
+class Text2Ltree(Func):
+    '''
+    text2ltree(text)
+    ltree    cast text to ltree
+    '''
+    function = 'TEXT2LTREE'
+
+    def __init__(self, expression, **extra):
+        extra.setdefault('output_field', _path_field())
+        super(Text2Ltree, self).__init__(expression, **extra)
+
+
+class Ltree2Text(Func):
+    '''
+    ltree2text(ltree)
+    text    cast ltree to text
+    '''
+    function = 'LTREE2TEXT'
+
+    def __init__(self, expression, **extra):
+        extra.setdefault('output_field', TextField())
+        super(Ltree2Text, self).__init__(expression, **extra)
+
+
+class Lca(Func):
+    '''
+    lca(ltree, ltree, ...)
+    ltree    lowest common ancestor, i.e., longest common prefix of paths
+             (up to 8 arguments supported); a path is not its own ancestor,
+             so lca('Top.A', 'Top.A') is 'Top'
+    '''
+    function = 'LCA'
+
+    def __init__(self, *expressions, **extra):
+        if len(expressions) < 2:
+            raise ValueError('Lca() takes at least 2 expressions, use '
+                             'LcaAggregate() for the nodes of a queryset')
+        extra.setdefault('output_field', _path_field())
+        super(Lca, self).__init__(*expressions, **extra)
+
+
+class LcaAggregate(Aggregate):
+    '''
+    lca(ltree[]) of the paths of the aggregated rows, for example
+    `queryset.aggregate(lca=LcaAggregate('_path'))`. It is the empty path
+    for a single root, and None if there are no rows.
+    '''
+    name = 'Lca'
+    template = 'LCA(ARRAY_AGG(%(expressions)s))'
+
+    def __init__(self, expression, **extra):
+        extra.setdefault('output_field', _path_field())
+        super(LcaAggregate, self).__init__(expression, **extra)
+
+
+class LtreeArray(Func):
+    '''
+    Array of paths, from a list of strings: ARRAY[...]::ltree[]
+    '''
+    template = '%(expressions)s::ltree[]'
+
+    def __init__(self, paths, **extra):
+        super(LtreeArray, self).__init__(Value(list(paths)), **extra)
+
+
+class FirstMatch(Func):
+    '''
+    Base class of the ltree[] operators returning the first matching entry
+    of an array of paths (None if there isn't any).
+
+    @param paths: list of paths, or an expression returning an ltree[].
+    @param expression: right operand.
+    '''
+    template = '(%(expressions)s)'
+    rhs_cast = ''  # used for forcing casting of the literal right operands
+
+    def __init__(self, paths, expression, **extra):
+        if not hasattr(paths, 'resolve_expression'):
+            paths = LtreeArray(paths)
+        if self.rhs_cast and not hasattr(expression, 'resolve_expression'):
+            expression = Func(Value(expression),
+                              template='%%(expressions)s%s' % self.rhs_cast)
+        extra.setdefault('output_field', _path_field())
+        super(FirstMatch, self).__init__(paths, expression, **extra)
+
+
+class FirstAscendant(FirstMatch):
+    '''
+    ltree[] ?@> ltree
+    ltree    first array entry that is an ancestor of ltree; NULL if none
+    '''
+    arg_joiner = ' ?@> '
+
+
+class FirstDescendant(FirstMatch):
+    '''
+    ltree[] ?<@ ltree
+    ltree    first array entry that is a descendant of ltree; NULL if none
+    '''
+    arg_joiner = ' ?<@ '
+
+
+class FirstPathLike(FirstMatch):
+    '''
+    ltree[] ?~ lquery
+    ltree    first array entry that matches lquery; NULL if none
+    '''
+    arg_joiner = ' ?~ '
+    rhs_cast = '::lquery'
+
+
+class FirstPathLikeTxt(FirstMatch):
+    '''
+    ltree[] ?@ ltxtquery
+    ltree    first array entry that matches ltxtquery; NULL if none
+    '''
+    arg_joiner = ' ?@ '
+    rhs_cast = '::ltxtquery'
+
+
+class SubtreeAggregate(Expression):
+    '''
+    Aggregate over the subtree of each node, for example
+    `SubtreeAggregate(Count('pk'))` or `SubtreeAggregate(Sum('item__price'))`,
+    compiled as a subquery that joins the nodes on the ltree `<@` operator:
+    (SELECT aggregate FROM tree U0 ... WHERE U0._path <@ tree._path)
+
+    @param aggregate: aggregate expression, resolved against the model of
+        the queryset (it can span relations).
+    @param include_self: include the node itself in its subtree.
+    '''
+    alias = '__subtree_aggregate'
+
+    def __init__(self, aggregate, include_self=True, output_field=None):
+        super(SubtreeAggregate, self).__init__(output_field=output_field)
+        self.aggregate = aggregate
+        self.include_self = include_self
+        self.model = None
+
+    def resolve_expression(self, query=None, allow_joins=True, reuse=None,
+                           summarize=False, for_save=False):
+        c = self.copy()
+        c.is_summary = summarize
+        c.model = query.model
+        return c
+
+    def _resolve_output_field(self):
+        if self._output_field is None:
+            query = Query(self.model)
+            query.add_annotation(self.aggregate, self.alias)
+            self._output_field = query.annotations[self.alias].output_field
+
+    def get_group_by_cols(self):
+        return []
+
+    def as_sql(self, compiler, connection):
+        outer_alias = compiler.query.get_initial_alias()
+        subquery = Query(self.model)
+        subquery.get_initial_alias()
+        subquery.bump_prefix(compiler.query)
+        inner_alias = subquery.get_initial_alias()
+        subquery.add_annotation(self.aggregate, self.alias)
+        subquery.set_annotation_mask([self.alias])
+        subquery.default_cols = False
+
+        subquery_compiler = subquery.get_compiler(connection=connection)
+        column = self.model._meta.get_field('_path').column
+        inner_path = '%s.%s' % (
+            subquery_compiler.quote_name_unless_alias(inner_alias),
+            connection.ops.quote_name(column))
+        outer_path = '%s.%s' % (
+            compiler.quote_name_unless_alias(outer_alias),
+            connection.ops.quote_name(column))
+        conditions = ['%s <@ %s' % (inner_path, outer_path)]
+        if not self.include_self:
+            conditions.append('%s <> %s' % (inner_path, outer_path))
+        subquery.where.add(ExtraWhere(conditions, []), AND)
+
+        sql, params = subquery_compiler.as_sql()
+        return '(%s)' % sql, params
+
+
+class RowComparison(Expression):
+    '''
+    Row-wise comparison of expressions with values, used as a filter:
+    (expression, ...) > (value, ...)
+    Unlike the equivalent combination of comparisons, it is used as a seek
+    (`Index Cond`) by the B-tree indexes whose leading columns are the
+    expressions.
+
+    @param operator: '<', '<=', '>' or '>='.
+    '''
+    def __init__(self, expressions, operator, values):
+        super(RowComparison, self).__init__(output_field=BooleanField())
+        if len(expressions) != len(values):
+            raise ValueError("'expressions' and 'values' must have the same "
+                             "length")
+        self.expressions = list(expressions)
+        self.operator = operator
+        self.values = list(values)
+
+    def get_source_expressions(self):
+        return self.expressions
+
+    def set_source_expressions(self, expressions):
+        self.expressions = expressions
+
+    def as_sql(self, compiler, connection):
+        sql, params = [], []
+        for expression in self.expressions:
+            expression_sql, expression_params = compiler.compile(expression)
+            sql.append(expression_sql)
+            params.extend(expression_params)
+        return '(%s) %s (%s)' % (', '.join(sql), self.operator,
+                                 ', '.join(['%s'] * len(self.values))), \
+            params + self.values
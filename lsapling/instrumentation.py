@@ -0,0 +1,135 @@
+'''
+Instrumentation of the tree operations. When `LSAPLING_INSTRUMENTATION` is
+enabled, the SQL executed by each operation is prefixed with a comment naming
+it (`/* lsapling: Model.operation */`), its queries and time are added to the
+per-process counters returned by `get_stats()`, and the
+`lsapling.signals.operation_executed` signal is sent.
+'''
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from timeit import default_timer
+
+from django.db import DEFAULT_DB_ALIAS, connections, models
+
+import settings
+from signals import operation_executed
+
+_stats = {}
+_stats_lock = Lock()
+
+
+class InstrumentedCursor(object):
+    '''
+    Cursor wrapper tagging the SQL with the operation comment, and counting
+    the queries and their time.
+    '''
+    def __init__(self, cursor, state):
+        self.cursor = cursor
+        self.state = state
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return self.cursor.__exit__(type, value, traceback)
+
+    def execute(self, sql, params=None):
+        return self._run(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._run(self.cursor.executemany, sql, param_list)
+
+    def _run(self, method, sql, params):
+        start = default_timer()
+        try:
+            return method(self.state['comment'] + sql, params)
+        finally:
+            self.state['queries'] += 1
+            self.state['sql_duration'] += default_timer() - start
+
+
+@contextmanager
+def instrument(model, operation, using=None):
+    '''
+    Instrument the queries run on the `using` connection in the block as part
+    of `operation` (not instrumented if None). Nested blocks are accounted to
+    the outermost operation. The signal is only sent if queries were run.
+    '''
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    if operation is None or not settings.LSAPLING_INSTRUMENTATION or \
+            '_lsapling_instrumentation' in connection.__dict__:
+        yield
+        return
+
+    name = '%s.%s' % (model.__name__, operation)
+    state = {'comment': '/* lsapling: %s */ ' % name.replace('*/', ''),
+             'queries': 0,
+             'sql_duration': 0.0}
+    connection._lsapling_instrumentation = state
+    connection.cursor = lambda: InstrumentedCursor(
+        connection.__class__.cursor(connection), state)
+    start = default_timer()
+    try:
+        yield
+    finally:
+        duration = default_timer() - start
+        del connection.cursor
+        del connection._lsapling_instrumentation
+        if state['queries']:
+            with _stats_lock:
+                stats = _stats.setdefault(name, {'calls': 0,
+                                                 'queries': 0,
+                                                 'duration': 0.0,
+                                                 'sql_duration': 0.0})
+                stats['calls'] += 1
+                stats['queries'] += state['queries']
+                stats['duration'] += duration
+                stats['sql_duration'] += state['sql_duration']
+            operation_executed.send(sender=model,
+                                    operation=operation,
+                                    queries=state['queries'],
+                                    duration=duration,
+                                    sql_duration=state['sql_duration'])
+
+
+def instrumented(func):
+    '''
+    Decorator instrumenting a queryset or model method. Querysets returned by
+    the method keep the operation name, and are instrumented when evaluated.
+    '''
+    operation = func.__name__
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if isinstance(self, models.QuerySet):
+            model, using = self.model, self.db
+        else:
+            model, using = self.__class__, self._state.db
+        with instrument(model, operation, using):
+            result = func(self, *args, **kwargs)
+        if isinstance(result, models.QuerySet):
+            result._operation = operation
+        return result
+    return wrapper
+
+
+def get_stats():
+    '''
+    Return the counters of the instrumented operations, as a dictionary of
+    `calls`, `queries`, `duration` and `sql_duration` (in seconds) for each
+    `Model.operation`.
+    '''
+    with _stats_lock:
+        return dict((name, dict(stats)) for name, stats in _stats.items())
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
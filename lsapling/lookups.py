@@ -1,17 +1,48 @@
-from django.db.models import Lookup, Transform, IntegerField
+from django.db.models import Lookup, Transform, IntegerField, TextField
+from django.utils import six
+
+import settings
+from ltree import Lquery, Ltxtquery
+
+# strategies for compiling lookups with a queryset as right-hand side
+ARRAY, JOIN, EXISTS = 'array', 'join', 'exists'
+STRATEGIES = (ARRAY, JOIN, EXISTS)
 
 
 class ArrayLookup(Lookup):
     '''
     Utility class for providing array-based versions of the operators.
+
+    When the right-hand side is a queryset, the lookup is compiled using one
+    of these strategies, chosen by the `with_lookup_strategy()` of the
+    queryset or the `LSAPLING_LOOKUP_STRATEGY` setting:
+    - ARRAY (default): `lhs op array(subquery)`. The array is built once
+      and tested against each row, which is only indexable for some
+      operators.
+    - JOIN: `pk IN (SELECT pk FROM (subquery) JOIN table ON path op
+      lhs)`. The subquery drives the join, probing the GiST index of the
+      lhs once for each of its paths, and the matches are then fetched by
+      primary key. Falls back to EXISTS if the lhs is not a column. Much
+      faster when the planner uses the index, but slower than ARRAY when
+      it doesn't (for example, for the descendants of a few nodes in deep
+      trees, which are a large part of the table).
+    - EXISTS: `EXISTS (SELECT 1 FROM (subquery) WHERE lhs op path)`. The
+      semi-join can't be driven by the subquery, as the ltree operators
+      aren't equalities, so it is only useful for small tables.
     '''
     using_values = False
     cast = ''  # used for forcing casting of the arrays
+    value_cast = '::ltree[]'  # used for casting the lists of values
+    element_cast = ''  # used for forcing casting of the joined paths
+    join_operator = None  # operator of the JOIN/EXISTS version, if different
 
     def __init__(self, lhs, rhs):
         from models import TreeQuerySet
+        self.strategy = ARRAY
         # retrieve the paths if using a queryset as rhs
         if isinstance(rhs, TreeQuerySet):
+            self.strategy = rhs._lookup_strategy or \
+                settings.LSAPLING_LOOKUP_STRATEGY
             if '_overridden_path' in rhs.query.annotation_select.keys():
                 rhs = rhs.values('_overridden_path')
             else:
@@ -26,7 +57,27 @@ class ArrayLookup(Lookup):
         # force the subquery to array() if needed
         if not self.using_values:
             params = lhs_params + rhs_params
+            if isinstance(self.rhs, (list, tuple)):
+                # the lists are adapted as text[]
+                rhs += self.value_cast
             return '%s %s %s' % (lhs, self.sql_operator, rhs), params
+        elif self.strategy == JOIN and hasattr(self.lhs, 'target'):
+            qn = compiler.quote_name_unless_alias
+            opts = self.lhs.target.model._meta
+            params = list(rhs_params)
+            return '%s.%s IN (SELECT ltree_lhs.%s FROM %s AS ltree_rhs ' \
+                '(path) JOIN %s AS ltree_lhs ON ltree_lhs.%s %s ' \
+                'ltree_rhs.path%s)' % \
+                (qn(self.lhs.alias), qn(opts.pk.column), qn(opts.pk.column),
+                 rhs, qn(opts.db_table), qn(self.lhs.target.column),
+                 self.join_operator or self.sql_operator,
+                 self.element_cast), params
+        elif self.strategy in (JOIN, EXISTS):
+            params = list(rhs_params) + lhs_params
+            return 'EXISTS (SELECT 1 FROM %s AS ltree_rhs (path) ' \
+                'WHERE %s %s ltree_rhs.path%s)' % \
+                (rhs, lhs, self.join_operator or self.sql_operator,
+                 self.element_cast), params
         else:
             params = lhs_params + list(rhs_params)
             return '%s %s array(%s)%s' % \
@@ -62,6 +113,12 @@ class LtreePathLike(Lookup):
     '''
     lookup_name = 'path_like'
 
+    def get_prep_lookup(self):
+        # validate the pattern before it reaches the database
+        if isinstance(self.rhs, six.string_types):
+            return Lquery(self.rhs)
+        return super(LtreePathLike, self).get_prep_lookup()
+
     def as_postgresql(self, compiler, connection):
         lhs, lhs_params = self.process_lhs(compiler, connection)
         rhs, rhs_params = self.process_rhs(compiler, connection)
@@ -76,6 +133,12 @@ class LtreePathLikeTxt(Lookup):
     '''
     lookup_name = 'path_like_txt'
 
+    def get_prep_lookup(self):
+        # validate the pattern before it reaches the database
+        if isinstance(self.rhs, six.string_types):
+            return Ltxtquery(self.rhs)
+        return super(LtreePathLikeTxt, self).get_prep_lookup()
+
     def as_postgresql(self, compiler, connection):
         lhs, lhs_params = self.process_lhs(compiler, connection)
         rhs, rhs_params = self.process_rhs(compiler, connection)
@@ -84,9 +147,24 @@ class LtreePathLikeTxt(Lookup):
 
 
 class LtreePathLikeExact(ArrayLookup):
+    '''
+    ltree ? lquery[]
+    boolean    does ltree match any lquery in array?
+    '''
     lookup_name = 'path_like_exact'
     sql_operator = '?'
     cast = '::lquery[]'
+    value_cast = '::lquery[]'
+    # the JOIN version matches each lquery with the ~ operator
+    join_operator = '~'
+    element_cast = '::lquery'
+
+    def get_prep_lookup(self):
+        # validate the patterns before they reach the database
+        if isinstance(self.rhs, (list, tuple)):
+            return [Lquery(pattern) if isinstance(pattern, six.string_types)
+                    else pattern for pattern in self.rhs]
+        return super(LtreePathLikeExact, self).get_prep_lookup()
 
 
 class LtreeNlevel(Transform):
@@ -112,3 +190,24 @@ class LtreeNlevel(Transform):
     @property
     def output_field(self):
         return IntegerField()
+
+
+class LtreeText(Transform):
+    '''
+    ltree2text(ltree)
+    text    cast ltree to text, for using the text lookups on the path,
+            e.g. `_path__text__startswith`
+    '''
+    lookup_name = 'text'
+
+    def as_sql(self, compiler, connection):
+        lhs, params = compiler.compile(self.lhs)
+        return 'ltree2text(%s)' % lhs, params
+
+    def relabeled_clone(self, relabels):
+        return self.__class__(self.lhs.relabeled_clone(relabels),
+                              self.init_lookups)
+
+    @property
+    def output_field(self):
+        return TextField()
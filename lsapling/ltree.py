@@ -0,0 +1,294 @@
+'''
+Value types of the ltree extension:
+- `LtreePath`: the paths returned by the `NodePathField`s, with the label
+  operations done in Python (depth, parent, ancestry, slicing).
+- `Lquery` and `Ltxtquery`: patterns validated when they are built, used by
+  the `path_like`, `path_like_exact` and `path_like_txt` lookups.
+They are subclasses of `str`, so they can be used wherever a path or pattern
+string is expected.
+'''
+import re
+
+from django.core.exceptions import ValidationError
+from django.utils import six
+
+LABEL = r'[\w-]+'
+# label with optional modifiers: @ (case-insensitive), * (prefix) and
+# % (underscore-separated words)
+LABEL_PATTERN = LABEL + r'[@*%]*'
+QUANTIFIER = r'\{(?:\d+|\d*,\d*)\}'
+LQUERY_LEVEL = r'(?:\*|!?%s(?:\|%s)*)(?:%s)?' % (LABEL_PATTERN, LABEL_PATTERN,
+                                                QUANTIFIER)
+
+path_re = re.compile(r'^(?:%s(?:\.%s)*)?$' % (LABEL, LABEL), re.UNICODE)
+lquery_re = re.compile(r'^%s(?:\.%s)*$' % (LQUERY_LEVEL, LQUERY_LEVEL),
+                       re.UNICODE)
+# the bounds of the quantifiers, which labels can't contain
+quantifier_bounds_re = re.compile(r'\{(\d+),(\d+)\}')
+ltxtquery_token_re = re.compile(r'\s*(?:(%s)|([&|!()]))' % LABEL_PATTERN,
+                                re.UNICODE)
+
+
+def _text(value):
+    # match the labels as text, so that non-ASCII letters are word characters
+    if isinstance(value, six.binary_type):
+        return value.decode('utf-8')
+    return value
+
+
+def _str(value):
+    # the values are native strings, as returned by the database driver
+    if six.PY2 and isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
+
+
+class LtreePath(str):
+    '''
+    ltree path, e.g. `LtreePath('Top.Science.Astronomy')`. The labels are
+    split once and cached; the methods returning paths return `LtreePath`s.
+    The empty path (the parent of the roots) has no labels.
+    '''
+    def __new__(cls, value=''):
+        if isinstance(value, LtreePath) and cls is LtreePath:
+            return value
+        return str.__new__(cls, _str(value))
+
+    @classmethod
+    def from_labels(cls, labels):
+        path = cls('.'.join(labels))
+        path._labels = tuple(labels)
+        return path
+
+    @property
+    def labels(self):
+        '''
+        Tuple of the labels of the path.
+        '''
+        try:
+            return self._labels
+        except AttributeError:
+            self._labels = tuple(self.split('.')) if self else ()
+            return self._labels
+
+    @property
+    def depth(self):
+        '''
+        Number of labels of the path, as `nlevel()`.
+        '''
+        return len(self.labels)
+
+    @property
+    def parent(self):
+        '''
+        Path of the parent (the empty path for roots), or None for the empty
+        path.
+        '''
+        if not self:
+            return None
+        return LtreePath.from_labels(self.labels[:-1])
+
+    @property
+    def ascendants(self):
+        '''
+        List of the paths of the ascendants, from the root down.
+        '''
+        labels = self.labels
+        return [LtreePath.from_labels(labels[:i])
+                for i in range(1, len(labels))]
+
+    def child(self, *labels):
+        '''
+        Return the path of the descendant with the given relative labels.
+        '''
+        return LtreePath.from_labels(self.labels + labels)
+
+    def is_ancestor_of(self, other):
+        '''
+        Return whether the path is an ancestor of `other` (or equal), as the
+        `@>` operator.
+        '''
+        return not self or other == self or other.startswith(self + '.')
+
+    def is_descendant_of(self, other):
+        '''
+        Return whether the path is a descendant of `other` (or equal), as the
+        `<@` operator.
+        '''
+        return LtreePath(other).is_ancestor_of(self)
+
+    def subltree(self, start, end):
+        '''
+        Return the labels from position `start` to position `end`-1 (counting
+        from 0), as `subltree()`.
+        '''
+        return LtreePath.from_labels(self.labels[start:end])
+
+    def subpath(self, offset, length=None):
+        '''
+        Return the `length` labels starting at position `offset`, as
+        `subpath()`: a negative offset starts that far from the end, and a
+        negative length leaves that many labels off the end.
+        '''
+        labels = self.labels
+        start = offset if offset >= 0 else len(labels) + offset
+        if length is None:
+            end = None
+        elif length >= 0:
+            end = start + length
+        else:
+            end = len(labels) + length
+        return LtreePath.from_labels(labels[start:end])
+
+    def lca(self, *others):
+        '''
+        Return the lowest common ancestor of the path and `others`, as
+        `lca()`: a path is not its own ancestor.
+        '''
+        paths = [self.labels] + [LtreePath(other).labels for other in others]
+        length = min(len(labels) for labels in paths) - 1
+        common = 0
+        while common < length and \
+                all(labels[common] == paths[0][common] for labels in paths):
+            common += 1
+        return LtreePath.from_labels(paths[0][:common])
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, str.__repr__(self))
+
+
+class Lquery(str):
+    '''
+    lquery pattern, validated when built, e.g. `Lquery('Top.*{1,2}.!Art*')`.
+    Raises ValueError if the pattern is not valid.
+    '''
+    def __new__(cls, pattern):
+        if not lquery_re.match(_text(pattern)) or any(
+                int(low) > int(high) for low, high in
+                quantifier_bounds_re.findall(_text(pattern))):
+            raise ValueError("'%s' is not a valid lquery" % pattern)
+        return str.__new__(cls, _str(pattern))
+
+    @classmethod
+    def from_levels(cls, *levels):
+        '''
+        Return the lquery matching the `levels` (labels, patterns or
+        `star()`s) in sequence.
+        '''
+        return cls('.'.join(levels))
+
+    @staticmethod
+    def star(min=None, max=None):
+        '''
+        Return the level matching any labels: any number of them by default,
+        exactly `min` if `max` is equal to it, or between `min` and `max`
+        (any of them being None meaning unbounded).
+        '''
+        if min is not None and max is not None and min > max:
+            raise ValueError("'min' can't be greater than 'max'")
+        if min is None and max is None:
+            return '*'
+        if min == max:
+            return '*{%d}' % min
+        return '*{%s,%s}' % ('' if min is None else int(min),
+                             '' if max is None else int(max))
+
+    @staticmethod
+    def level(*labels, **kwargs):
+        '''
+        Return the level matching any of the `labels` (or patterns), or any
+        label but them if `negate` is True.
+        '''
+        negate = kwargs.pop('negate', False)
+        if kwargs:
+            raise TypeError('unexpected arguments: %s' % ', '.join(kwargs))
+        return ('!' if negate else '') + '|'.join(labels)
+
+    @classmethod
+    def descendants(cls, path, min_depth=1, max_depth=None):
+        '''
+        Return the lquery matching the descendants of `path` between
+        `min_depth` and `max_depth` levels below it.
+        '''
+        star = cls.star(min_depth, max_depth)
+        return cls.from_levels(path, star) if path else cls(star)
+
+
+class Ltxtquery(str):
+    '''
+    ltxtquery pattern, validated when built, e.g.
+    `Ltxtquery('Europe & Russia*@ & !Transportation')`. Raises ValueError if
+    the pattern is not valid.
+    '''
+    def __new__(cls, pattern):
+        if not cls.is_valid(pattern):
+            raise ValueError("'%s' is not a valid ltxtquery" % pattern)
+        return str.__new__(cls, _str(pattern))
+
+    @staticmethod
+    def is_valid(pattern):
+        '''
+        Return whether `pattern` is made of words combined with `&`, `|`, `!`
+        and parentheses, parsing:
+            expression: term (('&' | '|') term)*
+            term: '!' term | '(' expression ')' | word
+        '''
+        tokens = []
+        pattern = _text(pattern)
+        position = 0
+        while pattern[position:].strip():
+            match = ltxtquery_token_re.match(pattern, position)
+            if not match:
+                return False
+            tokens.append('w' if match.group(1) else match.group(2))
+            position = match.end()
+        tokens.append(None)
+
+        def expression(i):
+            i = term(i)
+            while i is not None and tokens[i] in ('&', '|'):
+                i = term(i + 1)
+            return i
+
+        def term(i):
+            while tokens[i] == '!':
+                i += 1
+            if tokens[i] == 'w':
+                return i + 1
+            if tokens[i] == '(':
+                i = expression(i + 1)
+                if i is not None and tokens[i] == ')':
+                    return i + 1
+            return None
+
+        return expression(0) == len(tokens) - 1
+
+    @classmethod
+    def all(cls, *terms):
+        '''
+        Return the ltxtquery matching all the `terms`.
+        '''
+        return cls(' & '.join('(%s)' % term for term in terms))
+
+    @classmethod
+    def any(cls, *terms):
+        '''
+        Return the ltxtquery matching any of the `terms`.
+        '''
+        return cls(' | '.join('(%s)' % term for term in terms))
+
+    @classmethod
+    def negate(cls, term):
+        '''
+        Return the ltxtquery matching the paths that don't match `term`.
+        '''
+        return cls('!(%s)' % term)
+
+
+def validate_path(value):
+    '''
+    Validator of the `NodePathField`s.
+    '''
+    if not path_re.match(_text(value)):
+        raise ValidationError("'%(value)s' is not a valid ltree path",
+                              code='invalid', params={'value': value})
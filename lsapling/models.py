@@ -1,20 +1,47 @@
-from django.db import models
-from django.db.models.expressions import F
+from contextlib import contextmanager
+
+from django.db import connections, models, transaction
+from django.db.models import DO_NOTHING, Q, sql
+from django.db.models.deletion import get_candidate_relations_to_delete
+from django.db.models.expressions import Case, F, When
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.db.models.sql.where import AND
 from django.db.models.functions import Concat, Value
 
-from fields import NodePathField
-from functions import Subpath, Nlevel
-from ordering.generic import POSITIONS
+from cache import atomic, get_tree_cache
+from fields import NodePathField, NodeDepthField, NodeParentPathField
+from functions import Subpath, Nlevel, LtreeConcat, RowComparison, \
+    SubtreeAggregate
+from instrumentation import instrument, instrumented
+from lookups import STRATEGIES
+from ltree import LtreePath, Lquery
+from ordering.generic import OrderingSpaceExhausted, POSITIONS, \
+    get_orderer_adapter
 from settings import LSAPLING_ORDERER_ADAPTER
+from signals import siblings_rebalanced
+from subtree import BFS, DFS, bfs_events, build_subtree, dfs_events
+
 
-# ascii-art constants
-DT_CORNER, DT_LINE_VER, DT_LINE_HOR, DT_LINE_VER_CONT = (u'\u2514',
-                                                         u'\u2502',
-                                                         u'\u2500',
-                                                         u'\u251c')
+def _validate_depth_range(min_depth, max_depth):
+    if min_depth < 0 or max_depth is not None and max_depth < min_depth:
+        raise ValueError("'min_depth' must not be negative, nor greater than "
+                         "'max_depth'")
 
 
 class TreeQuerySet(models.QuerySet):
+    # ordering used when materializing subtrees, which determines the order of
+    # the children of each node
+    subtree_ordering = ('pk',)
+    # name of the instrumented operation that returned the queryset
+    _operation = None
+    # strategy of the lookups using the queryset as right-hand side
+    _lookup_strategy = None
+    # relations prefetched onto the instances, mapped to their depth
+    _tree_prefetch = {}
+    # fields refreshed from the locked rows of the nodes being written
+    _refresh_fields = ('_path',)
+
+    @instrumented
     def get_ascendants(self):
         '''
         Return all the node's ascendants. The node is excluded.
@@ -23,28 +50,50 @@ class TreeQuerySet(models.QuerySet):
             exclude(pk__in=self.all())
     # get_ascendants.queryset_only = True
 
+    @instrumented
     def get_children(self):
         '''
         Return the node's immediate children.
         '''
+        if self._denormalized:
+            return self.model.objects.filter(
+                _parent_path__in=self.values('_path'))
         parent_paths = self.annotate(_overridden_path=Concat('_path',
                                                              Value('.*{1}')))
         return self.model.objects.filter(_path__path_like_exact=parent_paths)
     # get_children.queryset_only = True
 
-    def get_descendants(self):
+    @instrumented
+    def get_descendants(self, max_depth=None, min_depth=1):
         '''
         Return all the node's descendants (children and descendants of their
         children). The node is excluded.
+
+        @param max_depth: only return the descendants up to `max_depth` levels
+        below the node (all of them if None).
+        @param min_depth: only return the descendants at least `min_depth`
+        levels below the node (0 includes the node).
         '''
-        return self.model.objects.filter(_path__descendant=self.all()).\
-            exclude(pk__in=self.all())
+        _validate_depth_range(min_depth, max_depth)
+        if max_depth is None and min_depth == 1:
+            return self.model.objects.filter(_path__descendant=self.all()).\
+                exclude(pk__in=self.all())
+        # e.g. 'Top.*{1,2}', matched by the GiST index with `~`
+        star = Lquery.star(min_depth, max_depth)
+        patterns = self.annotate(_overridden_path=Concat('_path',
+                                                         Value('.' + star)))
+        return self.model.objects.filter(_path__path_like_exact=patterns)
     # get_descendants.queryset_only = True
 
+    @instrumented
     def get_siblings(self):
         '''
         Return all the node's siblings. The node is excluded.
         '''
+        if self._denormalized:
+            return self.model.objects.filter(
+                _parent_path__in=self.values('_parent_path')).\
+                exclude(pk__in=self.all())
         parent_paths = self.annotate(_overridden_path=Concat(
                                      Subpath(F('_path'),
                                              0,
@@ -55,46 +104,834 @@ class TreeQuerySet(models.QuerySet):
             exclude(pk__in=self.all())
     # get_sibling.queryset_only = True
 
+    def with_lookup_strategy(self, strategy):
+        '''
+        Return a copy of the queryset that, used as the right-hand side of
+        the `ascendant`, `descendant` and `path_like_exact` lookups (as done
+        by `get_ascendants()`, `get_descendants()`, `get_children()`...), is
+        compiled with `strategy` ('array', 'join' or 'exists') instead of
+        the `LSAPLING_LOOKUP_STRATEGY` setting.
+        '''
+        if strategy not in STRATEGIES:
+            raise ValueError("'strategy' must be one of %s" %
+                             ', '.join(STRATEGIES))
+        clone = self._clone()
+        clone._lookup_strategy = strategy
+        return clone
+
+    def prefetch_children(self):
+        '''
+        Return a copy of the queryset that, when evaluated, fetches the
+        children of all the nodes with a single query, so that their
+        `get_children()` don't hit the database.
+        '''
+        return self._with_tree_prefetch('children', 1)
+
+    def prefetch_ascendants(self):
+        '''
+        Return a copy of the queryset that, when evaluated, fetches the
+        ascendants of all the nodes with a single query on their paths, so
+        that their `get_ascendants()` don't hit the database.
+        '''
+        return self._with_tree_prefetch('ascendants', None)
+
+    def prefetch_descendants(self, depth=None):
+        '''
+        Return a copy of the queryset that, when evaluated, fetches the
+        descendants of all the nodes with a single query, so that their
+        `get_descendants()` (if `depth` is None) and `get_children()` don't
+        hit the database.
+
+        @param depth: number of levels fetched below each node, or None for
+        the whole subtrees.
+        '''
+        if depth is not None and depth < 1:
+            raise ValueError("'depth' must be None or a positive integer")
+        return self._with_tree_prefetch('descendants', depth)
+
+    @instrumented
+    def build_tree(self):
+        '''
+        Fetch the nodes and all their descendants in a single query, and
+        return them as a list of in-memory `SubtreeNode` graphs, one for each
+        topmost node.
+        '''
+        nodes = self.model.objects.filter(_path__descendant=self.all()).\
+            order_by(*self.subtree_ordering)
+        return build_subtree(nodes)
+    # build_tree.queryset_only = True
+
+    def annotate_subtree(self, include_self=True, **aggregates):
+        '''
+        Annotate each node with aggregates over its subtree, computed in the
+        same query, for example:
+            annotate_subtree(size=Count('pk'), items=Count('item'),
+                             total=Sum('item__price'))
+
+        @param include_self: include the node itself in its subtree.
+        '''
+        return self.annotate(**dict(
+            (name, SubtreeAggregate(aggregate, include_self))
+            for name, aggregate in aggregates.items()))
+    # annotate_subtree.queryset_only = True
+
+    @instrumented
+    def update_subtree_aggregates(self, include_self=True, **aggregates):
+        '''
+        Store aggregates over the subtree of each node in the fields named
+        after the keyword arguments (for example, denormalized counters),
+        with a single UPDATE. Return the number of nodes updated.
+        '''
+        return self.update(**dict(
+            (name, SubtreeAggregate(aggregate, include_self))
+            for name, aggregate in aggregates.items()))
+
+    def iter_subtree(self, chunk_size=1000, order=DFS, events=False):
+        '''
+        Iterate over the nodes and all their descendants (or over all the
+        nodes, if the queryset is not filtered), fetching them in chunks of
+        `chunk_size` with keyset pagination, so that the memory used does not
+        depend on the size of the subtrees.
+
+        @param order: DFS ('dfs') for depth-first order, each node followed
+            by its descendants and the siblings sorted by path, or BFS
+            ('bfs') for breadth-first order, by depth and path.
+        @param events: yield (ENTER, node) and (LEAVE, node) tuples instead
+            of the nodes, a node being left after its descendants (DFS) or
+            after its children (BFS).
+        '''
+        if order not in (DFS, BFS):
+            raise ValueError("'order' must be '%s' or '%s'" % (DFS, BFS))
+        nodes = self._iter_subtree_chunks(chunk_size, order)
+        if events:
+            return dfs_events(nodes) if order == DFS else bfs_events(nodes)
+        return nodes
+    # iter_subtree.queryset_only = True
+
+    def _iter_subtree_chunks(self, chunk_size, order):
+        queryset = self.model.objects.all()
+        if self.query.has_filters():
+            queryset = queryset.filter(_path__descendant=self.all())
+        ordering = self._get_keyset_ordering(order)
+
+        last = None
+        while True:
+            chunk = queryset
+            if last is not None:
+                chunk = chunk._filter_keyset(order, last._path, last.pk)
+            with instrument(self.model, 'iter_subtree', self.db):
+                nodes = list(chunk.order_by(*ordering)[:chunk_size])
+            for node in nodes:
+                yield node
+            if len(nodes) < chunk_size:
+                return
+            last = nodes[-1]
+
+    def _get_keyset(self, order):
+        '''
+        Return the expressions sorting the nodes in DFS or BFS `order`, the
+        primary key breaking the ties between the nodes with the same path
+        (`_path` is not unique).
+        '''
+        if order == DFS:
+            # ltree sorts label by label, so the path order is depth-first
+            return [F('_path'), F('pk')]
+        # (_depth, _path) and (nlevel(_path), _path) are indexed
+        depth = F('_depth') if self._denormalized else Nlevel('_path')
+        return [depth, F('_path'), F('pk')]
+
+    def _get_keyset_ordering(self, order, reverse=False):
+        '''
+        Return the ordering of the nodes in DFS or BFS `order`.
+        '''
+        return [key.desc() if reverse else key.asc()
+                for key in self._get_keyset(order)]
+
+    def _filter_keyset(self, order, path, pk, reverse=False):
+        '''
+        Return the nodes after the node at `path` with primary key `pk` (or
+        before it, if `reverse`) in DFS or BFS `order`. They are filtered
+        with a row comparison, e.g. `(_depth, _path, id) > (%s, %s, %s)`,
+        which the index of the ordering uses for seeking the node instead of
+        scanning the nodes before it.
+        '''
+        path = LtreePath(path)
+        values = [path, pk] if order == DFS else [path.depth, path, pk]
+        clone = self._clone()
+        clone.query.where.add(RowComparison(
+            self._get_keyset(order), '<' if reverse else '>', values).
+            resolve_expression(clone.query), AND)
+        return clone
+
+    @instrumented
+    def move_to(self, target, position=POSITIONS.LAST):
+        '''
+        Move the nodes and their descendants, as the first or last child of
+        `target` (POSITIONS.FIRST, POSITIONS.LAST) or as its left or right
+        sibling (POSITIONS.LEFT, POSITIONS.RIGHT). Each subtree is moved with
+        a single UPDATE; nodes after the first one are placed to the right of
+        the previously moved node, and nodes that are descendants of another
+        node in the queryset are moved along with it.
+        '''
+        nodes = list(self)
+        paths = [node._path for node in nodes]
+        for node in nodes:
+            if any(path != node._path and path.is_ancestor_of(node._path)
+                   for path in paths):
+                continue
+            self._move_subtree(node, target, position)
+            target, position = node, POSITIONS.RIGHT
+    # move_to.queryset_only = True
+
+    @instrumented
+    def copy_to(self, target, position=POSITIONS.LAST):
+        '''
+        Copy the nodes and their descendants relative to `target`, as
+        `move_to()` does, with a single INSERT ... SELECT for each subtree.
+        The copies keep the relative positions of the nodes. Return the list
+        of the copies of the nodes (excluding the nodes copied as descendants
+        of other nodes in the queryset).
+        '''
+        nodes = list(self)
+        paths = [node._path for node in nodes]
+        copies = []
+        for node in nodes:
+            if any(path != node._path and path.is_ancestor_of(node._path)
+                   for path in paths):
+                continue
+            target = self._copy_subtree(node, target, position)
+            position = POSITIONS.RIGHT
+            copies.append(target)
+        return copies
+    # copy_to.queryset_only = True
+
+    @instrumented
+    def delete_subtrees(self, fallback=False):
+        '''
+        Delete the nodes and all their descendants with a single DELETE
+        (`WHERE _path <@ ...`), without loading them into memory. Return the
+        number of nodes deleted, and a dictionary of the number of nodes
+        deleted at each depth.
+
+        As with `update()`, the delete signals are not sent and the related
+        objects are not collected, so relations to the nodes must be handled
+        by the database.
+
+        @param fallback: if other models have relations to the nodes that
+            need cascades (or the model has parents), delete the nodes with
+            `delete()` instead, which collects the related objects and sends
+            the signals.
+        '''
+        connection = connections[self.db]
+        try:
+            table, where, params = self._get_subtrees_where()
+        except EmptyResultSet:
+            return 0, {}
+        if self._denormalized:
+            depth = connection.ops.quote_name(
+                self.model._meta.get_field('_depth').column)
+        else:
+            depth = 'nlevel(%s)' % connection.ops.quote_name(
+                self.model._meta.get_field('_path').column)
+
+        with atomic(using=self.db):
+            cursor = connection.cursor()
+            if fallback and self._needs_collector():
+                cursor.execute('SELECT %s, COUNT(*) FROM %s WHERE %s '
+                               'GROUP BY 1' % (depth, table, where), params)
+                counts = dict(cursor.fetchall())
+                self.model.objects.filter(
+                    _path__descendant=self.all()).delete()
+            else:
+                cursor.execute('WITH deleted AS (DELETE FROM %s WHERE %s '
+                               'RETURNING %s AS depth) '
+                               'SELECT depth, COUNT(*) FROM deleted '
+                               'GROUP BY depth' % (table, where, depth),
+                               params)
+                counts = dict(cursor.fetchall())
+        self._invalidate_cache()
+        return sum(counts.values()), counts
+    # delete_subtrees.queryset_only = True
+
+    def _clone(self, *args, **kwargs):
+        clone = super(TreeQuerySet, self)._clone(*args, **kwargs)
+        clone._operation = self._operation
+        clone._lookup_strategy = self._lookup_strategy
+        clone._tree_prefetch = self._tree_prefetch
+        return clone
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            with instrument(self.model, self._operation, self.db):
+                super(TreeQuerySet, self)._fetch_all()
+                if self._tree_prefetch:
+                    self._prefetch_tree_relations()
+
+    def count(self):
+        with instrument(self.model, self._operation, self.db):
+            return super(TreeQuerySet, self).count()
+
+    def exists(self):
+        with instrument(self.model, self._operation, self.db):
+            return super(TreeQuerySet, self).exists()
+
+    def aggregate(self, *args, **kwargs):
+        with instrument(self.model, self._operation, self.db):
+            return super(TreeQuerySet, self).aggregate(*args, **kwargs)
+
+    def update(self, **kwargs):
+        with instrument(self.model, self._operation, self.db):
+            return super(TreeQuerySet, self).update(**kwargs)
+
+    def _with_tree_prefetch(self, relation, depth):
+        clone = self._clone()
+        clone._tree_prefetch = dict(self._tree_prefetch)
+        clone._tree_prefetch[relation] = depth
+        return clone
+
+    def _prefetch_tree_relations(self):
+        '''
+        Fetch the relations requested with the `prefetch_*()` methods for the
+        instances in the result cache, and store them in their
+        `_prefetched_tree`.
+        '''
+        instances = [instance for instance in self._result_cache
+                     if isinstance(instance, Tree)]
+        if not instances:
+            return
+        for instance in instances:
+            instance._prefetched_tree = {}
+        queryset = self.model.objects.using(self.db)
+
+        if 'ascendants' in self._tree_prefetch:
+            paths = set()
+            for instance in instances:
+                paths.update(instance._path.ascendants)
+            found = dict((node._path, node) for node in
+                         queryset.filter(_path__in=list(paths)))
+            for instance in instances:
+                instance._prefetched_tree['ascendants'] = [
+                    found[path] for path in instance._path.ascendants
+                    if path in found]
+
+        # the children are the first level of the descendants
+        if 'descendants' in self._tree_prefetch:
+            depth = self._tree_prefetch['descendants']
+        elif 'children' in self._tree_prefetch:
+            depth = 1
+        else:
+            return
+        sources = {}
+        for instance in instances:
+            sources.setdefault(instance._path, []).append(instance)
+            instance._prefetched_tree['descendants'] = (depth, [])
+        # a single GiST-indexed `path ? lquery[]`, matching the levels below
+        # each node
+        patterns = [Lquery.descendants(path, 1, depth) for path in sources]
+        for node in queryset.filter(_path__path_like_exact=patterns):
+            for path in node._path.ascendants:
+                if depth is not None and \
+                        node._path.depth - path.depth > depth:
+                    continue
+                for instance in sources.get(path, ()):
+                    instance._prefetched_tree['descendants'][1].append(node)
+
+    def _get_move_values(self, node, target, position):
+        '''
+        Return the new path of a node moved to `position` relative to
+        `target`, and a dictionary of extra values for the node itself.
+        '''
+        if position in (POSITIONS.FIRST, POSITIONS.LAST):
+            parent_path = target._path
+        else:
+            parent_path = target._path.parent
+        new_path = parent_path.child(node._path.labels[-1])
+
+        if new_path != node._path and \
+                self.model.objects.filter(_path=new_path).exists():
+            raise ValueError("a node with path '%s' already exists" %
+                             new_path)
+        return new_path, {}
+
+    def _move_subtree(self, node, target, position):
+        '''
+        Move a node and its descendants, rewriting their paths in a single
+        UPDATE, and update the node instance.
+        '''
+        with self._lock_subtree(node, target, position):
+            if node._path.is_ancestor_of(target._path):
+                raise ValueError('a node cannot be moved into its own '
+                                 'subtree')
+            new_path, node_values = self._get_move_values(node, target,
+                                                          position)
+            if not self.model.objects.filter(
+                    _path__descendant=node._path).update(
+                    **self._get_subtree_rewrite(node, new_path,
+                                                node_values)):
+                raise self._does_not_exist()
+
+        self._set_path(node, new_path)
+        for name, value in node_values.items():
+            setattr(node, name, value)
+        self._invalidate_cache()
+
+    def _get_subtrees_where(self):
+        '''
+        Return the quoted table name, and the SQL and parameters of the WHERE
+        clause matching the nodes and their descendants in it.
+        '''
+        query = sql.DeleteQuery(self.model)
+        query.where = self.model.objects.filter(
+            _path__descendant=self.all()).query.where
+        compiler = query.get_compiler(self.db)
+        where, params = compiler.compile(query.where)
+        return compiler.quote_name_unless_alias(query.get_initial_alias()), \
+            where, params
+
+    def _needs_collector(self):
+        '''
+        Whether deleting nodes requires the Django collector, for cascading
+        to related or parent models.
+        '''
+        opts = self.model._meta
+        return bool(opts.parents) or any(
+            related.field.rel.on_delete is not DO_NOTHING
+            for related in get_candidate_relations_to_delete(opts))
+
+    def _copy_subtree(self, node, target, position):
+        '''
+        Copy a node and its descendants with a single INSERT ... SELECT,
+        rewriting the prefix of their paths, and return the new node.
+        '''
+        opts = self.model._meta
+        if not isinstance(opts.pk, models.AutoField):
+            raise ValueError('copying nodes requires an auto-incremented '
+                             'primary key')
+        with self._lock_subtree(node, target, position, shared=True):
+            new_path, node_values = self._get_move_values(node, target,
+                                                          position)
+            if new_path == node._path:
+                raise ValueError("a node with path '%s' already exists" %
+                                 new_path)
+
+            values = self._get_subtree_rewrite(node, new_path, node_values)
+            fields = [field for field in opts.concrete_fields
+                      if field is not opts.pk]
+            subtree = self.model.objects.filter(
+                _path__descendant=node._path).order_by()
+            # annotate one by one, keeping the order of the columns
+            for field in fields:
+                subtree = subtree.annotate(**{
+                    '_copy_%s' % field.name: values.get(field.name,
+                                                        F(field.name))})
+            select, params = subtree.values(
+                *['_copy_%s' % field.name for field in fields]).\
+                query.sql_with_params()
+
+            connection = connections[self.db]
+            cursor = connection.cursor()
+            cursor.execute('INSERT INTO %s (%s) %s' % (
+                connection.ops.quote_name(opts.db_table),
+                ', '.join(connection.ops.quote_name(field.column)
+                          for field in fields),
+                select), params)
+            if not cursor.rowcount:
+                raise self._does_not_exist()
+            copy = self.model.objects.get(_path=new_path)
+        self._invalidate_cache([new_path])
+        return copy
+
+    def _get_subtree_rewrite(self, node, new_path, node_values):
+        '''
+        Return the expressions rewriting the paths of the subtree of `node`
+        to start with `new_path`, and setting `node_values` on the node
+        itself, as keyword arguments for `update()`.
+        '''
+        level = node._path.depth
+        values = dict(
+            (name, Case(When(_path=node._path, then=Value(value)),
+                        default=F(name),
+                        output_field=self.model._meta.get_field(name)))
+            for name, value in node_values.items())
+        values.update(self._get_path_updates(Case(
+            When(_path=node._path, then=Value(new_path)),
+            default=LtreeConcat(Value(new_path), Subpath(F('_path'), level)),
+            output_field=NodePathField())))
+        return values
+
+    def _invalidate_cache(self, paths=None):
+        '''
+        Invalidate the cached entries affected by writing the nodes at
+        `paths`, or all the entries of the model if None, right away and once
+        the transaction is committed (see `lsapling.cache`).
+        '''
+        tree_cache = get_tree_cache(self.model)
+        if tree_cache is not None:
+            tree_cache.invalidate(paths, using=self.db)
+
+    @property
+    def _denormalized(self):
+        '''
+        Whether the model has the denormalized `_depth` and `_parent_path`
+        columns.
+        '''
+        return issubclass(self.model, DenormalizedTreeMixin)
+
+    def _get_path_fields(self):
+        '''
+        Return the fields whose values are derived from `_path`.
+        '''
+        return [field for field in self.model._meta.concrete_fields
+                if isinstance(field, (NodeDepthField, NodeParentPathField))]
+
+    def _get_path_updates(self, path):
+        '''
+        Return the keyword arguments for an `update()` setting `_path` to the
+        expression `path`, and the fields derived from it accordingly.
+        '''
+        updates = {'_path': path}
+        for field in self._get_path_fields():
+            updates[field.name] = field.get_path_expression(path)
+        return updates
+
+    def _set_path(self, instance, path):
+        '''
+        Set the `_path` of an instance, as stored in the database, and the
+        fields derived from it.
+        '''
+        instance._path = instance._saved_path = path
+        for field in self._get_path_fields():
+            setattr(instance, field.attname, field.get_path_value(path))
+
+    def _refresh_from_row(self, instance, row):
+        '''
+        Set the `_refresh_fields` of an instance from the values in `row`.
+        '''
+        self._set_path(instance, LtreePath(row[0]))
+        for name, value in zip(self._refresh_fields[1:], row[1:]):
+            setattr(instance, name, value)
+
+    def _does_not_exist(self):
+        return self.model.DoesNotExist(
+            '%s matching query does not exist.' % self.model._meta.object_name)
+
+    def _get_parent_path(self, target, position):
+        '''
+        Return the path of the parent of a node placed at `position` relative
+        to `target`.
+        '''
+        if position in (POSITIONS.FIRST, POSITIONS.LAST):
+            return target._path
+        return target._path.parent
+
+    @contextmanager
+    def _lock_children(self, parent_path):
+        '''
+        Run the block in a transaction holding a share lock on the row of the
+        node at `parent_path` and then an advisory lock on its children (or
+        only the latter for the root nodes, if empty), which serializes the
+        calculation of their paths and positions and the writes across
+        connections. The locks are released when the transaction ends.
+        '''
+        with atomic(using=self.db):
+            if not parent_path or self._lock_path_row(parent_path) is None:
+                self._acquire_children_lock(parent_path)
+            yield
+
+    @contextmanager
+    def _lock_subtree(self, node, target, position, shared=False):
+        '''
+        Run the block in a transaction holding the advisory lock on the
+        children of the parent of a node placed at `position` relative to
+        `target`, a share lock on the rows of `node`, `target` and their
+        ascendants, and then a lock on the rows of the subtree of `node` (FOR
+        UPDATE, or FOR SHARE if `shared`). The advisory lock is taken before
+        any row below that parent, as the inserts and rebalances under it do,
+        and the rebalances of an ascendant, locking their subtree in path
+        order, wait for the row of the ascendant before reaching the rows of
+        the block. The `_path` of `node` and `target` are refreshed, as they
+        may have been rewritten since they were fetched (the locks are then
+        released, rolling back to a savepoint, and taken again for their new
+        paths). Raises DoesNotExist if any of them doesn't exist.
+
+        That error and the ValueErrors of the block (invalid moves and copies,
+        detected before writing) are raised once the transaction has ended, so
+        that they don't break the transaction of the caller.
+        '''
+        error = None
+        with atomic(using=self.db):
+            try:
+                while True:
+                    node_path = node._path
+                    parent_path = self._get_parent_path(target, position)
+                    sid = transaction.savepoint(using=self.db)
+                    self._acquire_children_lock(parent_path)
+                    rows = dict((row[0], row[1:]) for row in self._lock_rows(
+                        self.model.objects.filter(
+                            Q(pk__in=[node.pk, target.pk]) |
+                            Q(_path__ascendant=node_path) |
+                            Q(_path__ascendant=target._path)),
+                        shared=True, fields=self._refresh_fields))
+                    for instance in (node, target):
+                        if instance.pk not in rows:
+                            raise self._does_not_exist()
+                        self._refresh_from_row(instance, rows[instance.pk])
+                    if node._path == node_path and self._get_parent_path(
+                            target, position) == parent_path:
+                        transaction.savepoint_commit(sid, using=self.db)
+                        break
+                    # release the locks taken for the old paths, which may be
+                    # awaited by a writer holding the locks for the new ones
+                    transaction.savepoint_rollback(sid, using=self.db)
+                self._lock_rows(self.model.objects.filter(
+                    _path__descendant=node._path), shared)
+                yield
+            except (ValueError, self.model.DoesNotExist) as e:
+                error = e
+        if error is not None:
+            raise error
+
+    def _acquire_children_lock(self, parent_path):
+        if self.model.lock_siblings:
+            cursor = connections[self.db].cursor()
+            cursor.execute('SELECT pg_advisory_xact_lock('
+                           'hashtext(%s), hashtext(%s))',
+                           [self.model._meta.db_table, parent_path])
+
+    def _lock_row(self, where, params):
+        '''
+        Lock the row of the node matching the SQL condition `where` with
+        `SELECT ... FOR SHARE`, and then the children of its current path, in
+        a single query. The row is locked first, as the other inserts and the
+        rebalances under it do, and the moves under it don't hold any row
+        below it while waiting for the lock of its children. Return the
+        values of the `_refresh_fields` of the node, or None if it doesn't
+        exist.
+        '''
+        opts = self.model._meta
+        qn = connections[self.db].ops.quote_name
+        columns = [qn(opts.get_field(name).column)
+                   for name in self._refresh_fields]
+        params = list(params)
+        children_lock = ''
+        if self.model.lock_siblings:
+            children_lock = ', pg_advisory_xact_lock(hashtext(%%s), ' \
+                'hashtext(node.%s::text))' % columns[0]
+            params.insert(0, opts.db_table)
+        cursor = connections[self.db].cursor()
+        cursor.execute(
+            'SELECT %s%s FROM (SELECT %s FROM %s WHERE %s FOR SHARE) AS node' %
+            (', '.join('node.%s' % column for column in columns),
+             children_lock, ', '.join(columns), qn(opts.db_table), where),
+            params)
+        row = cursor.fetchone()
+        return row[:len(columns)] if row is not None else None
+
+    def _lock_node_row(self, node, parent=False):
+        '''
+        Lock the row of `node` (of its parent if `parent`) and the children of
+        its current path (see `_lock_row()`).
+        '''
+        opts = self.model._meta
+        qn = connections[self.db].ops.quote_name
+        where = '%s = %%s' % qn(opts.pk.column)
+        if parent:
+            path = qn(opts.get_field('_path').column)
+            where = '%s = (SELECT subpath(%s, 0, nlevel(%s) - 1) FROM %s ' \
+                'WHERE %s)' % (path, path, path, qn(opts.db_table), where)
+        return self._lock_row(where, [node.pk])
+
+    def _lock_path_row(self, path):
+        '''
+        Lock the row of the node at `path` and its children (see
+        `_lock_row()`).
+        '''
+        qn = connections[self.db].ops.quote_name
+        return self._lock_row(
+            '%s = %%s' % qn(self.model._meta.get_field('_path').column),
+            [path])
+
+    def _lock_rows(self, queryset, shared=False, fields=()):
+        '''
+        Lock the rows of `queryset` with `SELECT ... FOR UPDATE` (or FOR SHARE
+        if `shared`) in path order, without fetching them unless `fields` are
+        given, in which case a list of tuples of their primary key and those
+        fields is returned. The ascendants are locked before their
+        descendants, which may be locked by a rebalance of their children run
+        by an insert holding the row lock of their parent.
+        '''
+        query = queryset.order_by('_path').values('pk', *fields).query
+        sql, params = query.get_compiler(self.db).as_sql()
+        sql = '%s FOR %s' % (sql, 'SHARE' if shared else 'UPDATE')
+        cursor = connections[self.db].cursor()
+        if fields:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        cursor.execute('SELECT COUNT(*) FROM (%s) AS locked' % sql, params)
+
 
 class Tree(models.Model):
     _path = NodePathField()
     objects = TreeQuerySet.as_manager()
+    # serialize the writes under the same parent (moves, copies, and the
+    # inserts of ordered trees) using advisory locks, so concurrent writers
+    # don't calculate the same path or position
+    lock_siblings = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Tree, cls).from_db(db, field_names, values)
+        # the path the row has in the database, whose cached entries are
+        # also invalidated when saving a new one (unless it was deferred)
+        instance._saved_path = instance.__dict__.get('_path')
+        return instance
 
+    @instrumented
     def get_ascendants(self):
-        return self.__class__.objects.filter(pk=self.pk).get_ascendants()
+        '''
+        Return all the node's ascendants. The node is excluded. The paths of
+        the ascendants are the prefixes of the node path, so they are fetched
+        with a single indexed lookup instead of a subquery.
+        '''
+        queryset = self.__class__.objects.filter(
+            _path__in=self._path.ascendants)
+        return self._get_prefetched(queryset, 'ascendants')
 
     def get_children(self):
-        return self.__class__.objects.filter(pk=self.pk).get_children()
+        queryset = self.__class__.objects.filter(pk=self.pk).get_children()
+        return self._get_prefetched(queryset, 'descendants', 1)
 
-    def get_descendants(self):
-        return self.__class__.objects.filter(pk=self.pk).get_descendants()
+    @instrumented
+    def get_descendants(self, max_depth=None, min_depth=1):
+        '''
+        Return the node's descendants between `min_depth` and `max_depth`
+        levels below it (see `TreeQuerySet.get_descendants()`). If limited,
+        they are fetched with a single indexed lquery on the node path, e.g.
+        `Top.*{1,2}`.
+        '''
+        _validate_depth_range(min_depth, max_depth)
+        if max_depth is None and min_depth == 1:
+            queryset = self.__class__.objects.filter(pk=self.pk).\
+                get_descendants()
+        else:
+            queryset = self.__class__.objects.filter(
+                _path__path_like=Lquery.descendants(self._path, min_depth,
+                                                    max_depth))
+        return self._get_prefetched(queryset, 'descendants', max_depth,
+                                    min_depth)
 
     def get_siblings(self):
         return self.__class__.objects.filter(pk=self.pk).get_siblings()
 
-    def pretty_print(self, last=False, pre=[]):
+    @instrumented
+    def get_subtree(self):
+        '''
+        Return the node and its descendants as an in-memory `SubtreeNode`
+        graph, fetched in a single query. Raises DoesNotExist if the node
+        doesn't exist anymore.
+        '''
+        queryset = self.__class__.objects.all()
+        nodes = queryset.filter(_path__descendant=self._path).\
+            order_by(*queryset.subtree_ordering)
+        roots = build_subtree(nodes)
+        if not roots or roots[0].instance._path != self._path:
+            raise queryset._does_not_exist()
+        return roots[0]
+
+    def get_cached_ascendants(self):
+        '''
+        Return the list of the node's ascendants, from the root down, using
+        the cache if enabled (see `lsapling.cache`).
+        '''
+        tree_cache = get_tree_cache(self.__class__)
+        if tree_cache is None:
+            return sorted(self.get_ascendants(),
+                          key=lambda node: len(node._path))
+        return tree_cache.get_ascendants(self)
+
+    def get_cached_children(self):
+        '''
+        Return the list of the node's immediate children, using the cache if
+        enabled.
+        '''
+        tree_cache = get_tree_cache(self.__class__)
+        if tree_cache is None:
+            return list(self.get_children())
+        return tree_cache.get_children(self)
+
+    def get_cached_subtree(self):
+        '''
+        Return the node and its descendants as an in-memory `SubtreeNode`
+        graph, using the cache if enabled.
+        '''
+        tree_cache = get_tree_cache(self.__class__)
+        if tree_cache is None:
+            return self.get_subtree()
+        return tree_cache.get_subtree(self)
+
+    @instrumented
+    def pretty_print(self):
         '''
         Pretty print the node and its descendants.
         '''
-        ret = ''
-        label = unicode(self)
+        return self.get_subtree().pretty_print()
 
-        # calculate pres
-        if len(pre) == 0:
-            ret += label
-        else:
-            pres = [(DT_LINE_VER if x else u' ') + u' '*3 for x in pre]
-            pres_str = u''.join(pres[:-1])
-            ret += pres_str + (DT_CORNER if last else DT_LINE_VER_CONT) +\
-                DT_LINE_HOR*3 + label
+    @instrumented
+    def delete_subtree(self, fallback=False):
+        '''
+        Delete the node and its descendants with a single DELETE. Return the
+        number of nodes deleted, and the number of nodes deleted at each
+        depth (see `TreeQuerySet.delete_subtrees()`).
+        '''
+        return self.__class__.objects.filter(pk=self.pk).\
+            delete_subtrees(fallback=fallback)
 
-        children = list(self.get_children())
-        for child in children:
-            last = child == children[-1]
+    @instrumented
+    def move_to(self, target, position=POSITIONS.LAST):
+        '''
+        Move the node and its descendants relative to `target`.
+        '''
+        self.__class__.objects.all()._move_subtree(self, target, position)
 
-            ret += '\n' + child.pretty_print(last, pre + [not last])
+    @instrumented
+    def copy_to(self, target, position=POSITIONS.LAST):
+        '''
+        Copy the node and its descendants relative to `target`, with a single
+        INSERT ... SELECT, and return the copy of the node. The save signals
+        are not sent for the copies.
+        '''
+        return self.__class__.objects.all()._copy_subtree(self, target,
+                                                          position)
 
-        return ret
+    def _get_prefetched(self, queryset, relation, max_depth=None,
+                        min_depth=1):
+        '''
+        Return `queryset` evaluated from the nodes prefetched with the
+        `prefetch_*()` methods of the queryset that fetched the node, if any.
+        The descendants are used if they include the nodes between
+        `min_depth` and `max_depth` levels below the node (all of them if
+        None).
+        '''
+        prefetched = getattr(self, '_prefetched_tree', {})
+        if relation not in prefetched:
+            return queryset
+        if relation == 'descendants':
+            fetched_depth, nodes = prefetched[relation]
+            if min_depth < 1 or fetched_depth is not None and \
+                    (max_depth is None or max_depth > fetched_depth):
+                return queryset
+            if max_depth != fetched_depth or min_depth > 1:
+                min_depth += self._path.depth
+                max_depth = None if max_depth is None \
+                    else self._path.depth + max_depth
+                nodes = [node for node in nodes
+                         if node._path.depth >= min_depth and
+                         (max_depth is None or node._path.depth <= max_depth)]
+        else:
+            nodes = prefetched[relation]
+        queryset._result_cache = list(nodes)
+        queryset._prefetch_done = True
+        return queryset
 
     def __unicode__(self):
         return '[%s] %s' % (self.pk, self._path)
@@ -107,70 +944,326 @@ class OrderedTreeQuerySet(TreeQuerySet):
     '''
     Ordered SaplingTree.
     '''
-    def __init__(self, *args, **kwargs):
-        from importlib import import_module
-        # load the ordering adapter based on configuration
-        package, klass = str(LSAPLING_ORDERER_ADAPTER).rsplit('.', 1)
-        module = import_module(package)
-        self.orderer = getattr(module, klass)()
+    subtree_ordering = ('_path',)
+    _refresh_fields = ('_path', '_position')
 
-        super(OrderedTreeQuerySet, self).__init__(*args, **kwargs)
+    @property
+    def orderer(self):
+        '''
+        Ordering adapter, based on the model or the global configuration.
+        '''
+        return get_orderer_adapter(self.model.orderer_adapter or
+                                   LSAPLING_ORDERER_ADAPTER)
 
+    @instrumented
     def add_root(self, *args, **kwargs):
         '''
         Add a root node.
         '''
-        # TODO: check alternatives for UNION support in django
-        right = self.model.objects.filter(_path__nlevel=1).\
-            order_by('-_position').first()
-        new_position = self.orderer.get_position_sibling([None, right, None])
-        new_node = self.create(_path=new_position,
-                               _position=new_position,
-                               *args,
-                               **kwargs)
+        with self._lock_children(''):
+            new_position = self._get_position_child(None, POSITIONS.LAST)
+            new_node = self.create(_path=new_position,
+                                   _position=new_position,
+                                   *args,
+                                   **kwargs)
         return new_node
 
+    @instrumented
     def add_sibling(self, current, position=POSITIONS.RIGHT, *args, **kwargs):
         '''
         Add a sibling.
         '''
-        # TODO: check alternatives for UNION support in django
-        left = current.get_siblings().filter(_position__lt=current._position).\
-            order_by('-_position')
-        right = current.get_siblings().filter(_position__gt=current._position).\
-            order_by('_position')
-        # automatically correct FIRST and LAST cases
-        if position == POSITIONS.FIRST:
-            left = current.get_siblings().order_by('_position')
-        elif position == POSITIONS.LAST:
-            right = current.get_siblings().order_by('-_position')
-
-        new_position = self.orderer.get_position_sibling([left.first(),
-                                                          current,
-                                                          right.first()],
-                                                         position)
-        new_node = self.create(_path=current._path.rsplit('.', 1)[0]
-                               + '.' + new_position,
-                               _position=new_position)
+        with self._lock_node_children(current, siblings=True):
+            new_position = self._get_position_sibling(current, position)
+            new_node = self.create(_path=current._path.parent.child(
+                                       new_position),
+                                   _position=new_position)
         return new_node
 
+    @instrumented
     def add_child(self, parent, position=POSITIONS.RIGHT, *args, **kwargs):
         '''
         Add a child.
         '''
-        # TODO: check alternatives for UNION support in django
-        left = parent.get_children().order_by('_position')
-        right = parent.get_children().order_by('-_position')
-        new_position = self.orderer.get_position_sibling([left.first(),
-                                                          None,
-                                                          right.first()],
-                                                         position)
-        new_node = self.create(_path=parent._path + '.' + new_position,
-                               _position=new_position,
-                               *args,
-                               **kwargs)
+        with self._lock_node_children(parent):
+            new_position = self._get_position_child(parent, position)
+            new_node = self.create(_path=parent._path.child(new_position),
+                                   _position=new_position,
+                                   *args,
+                                   **kwargs)
         return new_node
 
+    @instrumented
+    def bulk_add_children(self, parent, children, position=POSITIONS.LAST,
+                          batch_size=None):
+        '''
+        Add several children to `parent` (or several root nodes if `parent`
+        is None), evenly spaced at `position`. The paths and positions are
+        calculated client-side, and the nodes are inserted with
+        `bulk_create()`.
+
+        @param children: iterable of dictionaries with the fields of each
+            new node.
+        '''
+        children = list(children)
+        with self._lock_node_children(parent):
+            parent_path = parent._path if parent is not None else LtreePath()
+            positions = self._get_positions_child(parent, position,
+                                                  len(children))
+            nodes = [self.model(_path=parent_path.child(new_position),
+                                _position=new_position,
+                                **kwargs)
+                     for kwargs, new_position in zip(children, positions)]
+            nodes = self.bulk_create(nodes, batch_size=batch_size)
+        self._invalidate_cache([node._path for node in nodes])
+        return nodes
+
+    @instrumented
+    def bulk_load_tree(self, data, parent=None, position=POSITIONS.LAST,
+                       batch_size=1000, children_key='children'):
+        '''
+        Load a whole tree under `parent` (or as root nodes if `parent` is
+        None). The paths and positions are calculated client-side, and the
+        nodes are inserted with `bulk_create()` in chunks of `batch_size`.
+        Return the number of nodes created.
+
+        @param data: dictionary or iterable of dictionaries with the fields of
+            each new node, and its children as an iterable under the
+            `children_key` key.
+        '''
+        if isinstance(data, dict):
+            data = [data]
+        data = list(data)
+
+        count = 0
+        with self._lock_node_children(parent):
+            parent_path = parent._path if parent is not None else LtreePath()
+            positions = self._get_positions_child(parent, position, len(data))
+            for nodes in self._build_tree_nodes(parent_path, data, positions,
+                                                batch_size, children_key):
+                self.bulk_create(nodes)
+                self._invalidate_cache([node._path for node in nodes])
+                count += len(nodes)
+        return count
+
+    def _build_tree_nodes(self, parent_path, data, positions, batch_size,
+                          children_key):
+        '''
+        Yield lists of up to `batch_size` new instances for the nodes in
+        `data` and their descendants.
+        '''
+        nodes = []
+        pending = [(parent_path, data, positions)]
+        while pending:
+            parent_path, items, positions = pending.pop()
+            for item, new_position in zip(items, positions):
+                kwargs = dict(item)
+                children = list(kwargs.pop(children_key, None) or [])
+                new_path = parent_path.child(new_position)
+                nodes.append(self.model(_path=new_path,
+                                        _position=new_position,
+                                        **kwargs))
+                if children:
+                    pending.append((new_path, children,
+                                    self.orderer.get_positions_sibling(
+                                        [None, None, None],
+                                        POSITIONS.LAST,
+                                        len(children))))
+                if len(nodes) >= batch_size:
+                    yield nodes
+                    nodes = []
+        if nodes:
+            yield nodes
+
+    @instrumented
+    def rebalance(self, parent_path=None):
+        '''
+        Spread evenly the positions of the children of the node at
+        `parent_path` (or of the root nodes if None), rewriting the paths of
+        their subtrees in a single UPDATE. Return the number of children.
+        '''
+        parent_path = LtreePath(parent_path or '')
+        if parent_path:
+            subtree = self.model.objects.filter(
+                _path__descendant=parent_path).exclude(_path=parent_path)
+        else:
+            subtree = self.model.objects.all()
+        level = parent_path.depth + 1
+        with self._lock_children(parent_path):
+            old_paths = list(self._get_children_of(parent_path).
+                             order_by('_position').
+                             values_list('_path', flat=True))
+            positions = self.orderer.get_positions_sibling(
+                [None, None, None], POSITIONS.LAST, len(old_paths))
+
+            path_whens = []
+            position_whens = []
+            # the inserts under the rewritten nodes (holding a share lock on
+            # them) must be committed before the UPDATE takes its snapshot
+            self._lock_rows(subtree)
+            for old_path, new_position in zip(old_paths, positions):
+                new_path = parent_path.child(new_position)
+                path_whens += [
+                    When(_path=old_path, then=Value(new_path)),
+                    When(_path__descendant=old_path,
+                         then=LtreeConcat(Value(new_path),
+                                          Subpath(F('_path'), level)))]
+                position_whens.append(When(_path=old_path,
+                                           then=Value(new_position)))
+            if old_paths:
+                subtree.update(
+                    _position=Case(*position_whens, default=F('_position'),
+                                   output_field=models.CharField()),
+                    **self._get_path_updates(
+                        Case(*path_whens, default=F('_path'),
+                             output_field=NodePathField())))
+
+        self._invalidate_cache()
+        siblings_rebalanced.send(sender=self.model,
+                                 parent_path=parent_path or None,
+                                 count=len(old_paths))
+        return len(old_paths)
+
+    @contextmanager
+    def _lock_node_children(self, node, siblings=False):
+        '''
+        Like `_lock_children()` for the children of `node` (of its parent if
+        `siblings`, or the root nodes if `node` is None), the row of that
+        parent being found from `node` instead of by path. The moves and
+        rebalances lock the rows they rewrite before their UPDATE, so the
+        path of the parent can't change while the block inserts under it.
+        The `_path` and `_position` of `node` are refreshed, as they may have
+        been rewritten since it was fetched.
+        '''
+        with atomic(using=self.db):
+            if node is None:
+                self._acquire_children_lock('')
+            elif not siblings:
+                row = self._lock_node_row(node)
+                if row is None:
+                    raise self._does_not_exist()
+                self._refresh_from_row(node, row)
+            else:
+                # the parent is found from the path of the node, so it is
+                # missed if it was rewritten while waiting for its row lock
+                while node._path.depth > 1 and \
+                        self._lock_node_row(node, parent=True) is None:
+                    old_path = node._path
+                    node.refresh_from_db(fields=['_path', '_position'])
+                    if node._path == old_path:
+                        raise self._does_not_exist()
+                if node._path.depth <= 1:
+                    self._acquire_children_lock('')
+                node.refresh_from_db(fields=['_path', '_position'])
+            yield
+
+    def _get_position_sibling(self, current, position, refresh=()):
+        '''
+        Return the position for a new sibling of `current`, rebalancing the
+        siblings if there is no room left. In that case, `current` and the
+        instances in `refresh` are reloaded from the database.
+        '''
+        try:
+            return self.orderer.get_position_sibling(
+                self._get_sibling_neighbours(current, position), position)
+        except OrderingSpaceExhausted:
+            self.rebalance(current._path.parent)
+            for instance in [current] + list(refresh):
+                instance.refresh_from_db(fields=['_path', '_position'])
+            return self.orderer.get_position_sibling(
+                self._get_sibling_neighbours(current, position), position)
+
+    def _get_sibling_neighbours(self, current, position):
+        '''
+        Return the siblings of `current` that delimit `position`, in the
+        format expected by the orderer.
+        '''
+        neighbours = self._get_neighbours(current._path.parent, current)
+        # for FIRST and LAST, the first and last siblings can be the current
+        # node itself, which is then used as the bound
+        if position == POSITIONS.FIRST:
+            return [neighbours['first'], current, None]
+        elif position == POSITIONS.LAST:
+            return [None, current, neighbours['last']]
+        return [neighbours['previous'], current, neighbours['next']]
+
+    def _get_position_child(self, parent, position, refresh=()):
+        '''
+        Return the position for a new child of `parent`.
+        '''
+        return self._get_positions_child(parent, position, 1, refresh)[0]
+
+    def _get_positions_child(self, parent, position, count, refresh=()):
+        '''
+        Return the positions for `count` new children of `parent` (or new
+        root nodes if `parent` is None), rebalancing the children if there is
+        no room left. In that case, the instances in `refresh` are reloaded
+        from the database.
+        '''
+        try:
+            return self.orderer.get_positions_sibling(
+                self._get_child_neighbours(parent), position, count)
+        except OrderingSpaceExhausted:
+            self.rebalance(parent._path if parent is not None else None)
+            for instance in refresh:
+                instance.refresh_from_db(fields=['_path', '_position'])
+            return self.orderer.get_positions_sibling(
+                self._get_child_neighbours(parent), position, count)
+
+    def _get_child_neighbours(self, parent):
+        '''
+        Return the first and last children of `parent` (or the first and
+        last root nodes if `parent` is None), in the format expected by the
+        orderer.
+        '''
+        neighbours = self._get_neighbours(parent._path if parent else '')
+        return [neighbours['first'], None, neighbours['last']]
+
+    def _get_neighbours(self, parent_path, current=None):
+        '''
+        Return the first and last children of the node at `parent_path` (or
+        the root nodes if empty) and, if `current` is given, its previous and
+        next siblings, fetched in a single query. The nodes only have their
+        `_position` populated, and are None if they don't exist.
+        '''
+        aggregates = {'first': models.Min('_position'),
+                      'last': models.Max('_position')}
+        if current is not None:
+            aggregates['previous'] = models.Max(Case(
+                When(_position__lt=current._position, then=F('_position'))))
+            aggregates['next'] = models.Min(Case(
+                When(_position__gt=current._position, then=F('_position'))))
+        positions = self._get_children_of(parent_path).aggregate(**aggregates)
+        return dict((name, self.model(_position=value) if value else None)
+                    for name, value in positions.items())
+
+    def _get_children_of(self, parent_path):
+        '''
+        Return the children of the node at `parent_path`, or the root nodes
+        if empty.
+        '''
+        if self._denormalized:
+            return self.model.objects.filter(_parent_path=parent_path or '')
+        if parent_path:
+            return self.model.objects.filter(
+                _path__path_like=Lquery.descendants(parent_path, 1, 1))
+        return self.model.objects.filter(_path__nlevel=1)
+
+    def _get_move_values(self, node, target, position):
+        '''
+        Return the new path of a node moved to `position` relative to
+        `target`, using the orderer for calculating its new position.
+        '''
+        if position in (POSITIONS.FIRST, POSITIONS.LAST):
+            parent_path = target._path
+            new_position = self._get_position_child(target, position,
+                                                    refresh=[node])
+        else:
+            parent_path = target._path.parent
+            new_position = self._get_position_sibling(target, position,
+                                                      refresh=[node])
+        return parent_path.child(new_position), {'_position': new_position}
+
 
 class OrderedTree(Tree):
     '''
@@ -181,6 +1274,8 @@ class OrderedTree(Tree):
     _position = models.CharField(max_length=64,
                                  db_index=True)
     objects = OrderedTreeQuerySet.as_manager()
+    # dotted path of the ordering adapter, overriding LSAPLING_ORDERER_ADAPTER
+    orderer_adapter = None
 
     def add_child(self, position=POSITIONS.LAST, *args, **kwargs):
         # TODO: raise exception on RIGHT, LEFT - here or on manager?
@@ -206,3 +1301,37 @@ class OrderedTree(Tree):
 #     class Meta:
 #         unique_together = ('_path', '_position',)
 #         TODO: unique between (path[-1], position)
+
+
+class DenormalizedTreeMixin(models.Model):
+    '''
+    Mixin adding the `_depth` and `_parent_path` columns to a tree, derived
+    from `_path` and kept up to date on save, `bulk_create()` and when moving
+    or rebalancing nodes. Children, siblings and depth queries then use plain
+    indexed comparisons instead of computing `nlevel()` and `lquery` patterns
+    for each row. Paths changed with a raw `update()` are not tracked.
+    '''
+    _depth = NodeDepthField()
+    _parent_path = NodeParentPathField()
+
+    class Meta:
+        abstract = True
+
+
+class DenormalizedTree(DenormalizedTreeMixin, Tree):
+    '''
+    SaplingTree with denormalized depth and parent path.
+    '''
+    class Meta:
+        abstract = True
+
+
+class DenormalizedOrderedTree(DenormalizedTreeMixin, OrderedTree):
+    '''
+    Ordered SaplingTree with denormalized depth and parent path, ordered using
+    the indexed depth.
+    '''
+    class Meta(OrderedTree.Meta):
+        abstract = True
+        ordering = ['_depth', '_path', '_position']
+        index_together = [('_depth', '_path')]
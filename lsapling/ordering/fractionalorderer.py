@@ -0,0 +1,182 @@
+from generic import BaseOrdererAdapter, OrderingSpaceExhausted, POSITIONS, \
+    get_sibling_bounds
+
+
+class FractionalOrdererAdapter(BaseOrdererAdapter):
+    def get_backend(self):
+        return FractionalOrderer()
+
+    def get_position_sibling(self, siblings, position=POSITIONS.RIGHT):
+        return self.backend.get_position_sibling(siblings, position)
+
+    def get_positions_sibling(self, siblings, position=POSITIONS.RIGHT,
+                              count=1):
+        return self.backend.get_positions_sibling(siblings, position, count)
+
+
+class FractionalOrderer(object):
+    '''
+    Orderer implementing variable-length, lexicographically sortable keys
+    (fractional indexing). A key is composed of an integer part and an
+    optional fractional part:
+    - the integer part is a head character, that encodes the number of digits
+      that follow it, and the digits themselves. Inserting before the first
+      or after the last sibling decrements or increments it, which keeps the
+      keys short for prepend and append-heavy workloads.
+    - the fractional part allows inserting a key between any two keys, by
+      taking the midpoint of their digits.
+    Only digits and lowercase letters are used, so the keys are valid ltree
+    labels and sort the same way as bytes and as text under most collations.
+    '''
+    DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+    # heads [0, ZERO_HEAD) are negative integers, longest first; heads
+    # [ZERO_HEAD, len(DIGITS)) are non-negative integers, shortest first
+    ZERO_HEAD = 18
+    MAX_LENGTH = 64  # max_length of OrderedTree._position
+
+    def __init__(self):
+        self.smallest_integer = self.DIGITS[0] * \
+            (self.get_integer_length(self.DIGITS[0]) + 1)
+        self.largest_integer = self.DIGITS[-1] * \
+            (self.get_integer_length(self.DIGITS[-1]) + 1)
+
+    def get_position_sibling(self, siblings, position):
+        return self.get_positions_sibling(siblings, position, 1)[0]
+
+    def get_positions_sibling(self, siblings, position, count):
+        lower, upper = get_sibling_bounds(siblings, position)
+        keys = self.get_keys_between(lower._position if lower else None,
+                                     upper._position if upper else None,
+                                     count)
+        if any(len(key) > self.MAX_LENGTH for key in keys):
+            raise OrderingSpaceExhausted('not enough space for inserting %s '
+                                         'nodes' % count)
+        return keys
+
+    def get_keys_between(self, a, b, count):
+        '''
+        Return `count` keys between the keys `a` and `b` (None meaning
+        unbounded), evenly distributed.
+        '''
+        if count == 0:
+            return []
+        if count == 1:
+            return [self.get_key_between(a, b)]
+        if b is None:
+            keys = []
+            for _ in range(count):
+                a = self.get_key_between(a, b)
+                keys.append(a)
+            return keys
+        if a is None:
+            keys = []
+            for _ in range(count):
+                b = self.get_key_between(a, b)
+                keys.append(b)
+            return list(reversed(keys))
+
+        middle = count // 2
+        key = self.get_key_between(a, b)
+        return (self.get_keys_between(a, key, middle) + [key] +
+                self.get_keys_between(key, b, count - middle - 1))
+
+    def get_key_between(self, a, b):
+        '''
+        Return a key between the keys `a` and `b` (None meaning unbounded).
+        '''
+        if a is not None and b is not None and a >= b:
+            raise ValueError("'%s' is not smaller than '%s'" % (a, b))
+
+        if a is None:
+            if b is None:
+                return self.DIGITS[self.ZERO_HEAD] + self.DIGITS[0]
+            integer_b, fraction_b = self.split_key(b)
+            if integer_b == self.smallest_integer:
+                return integer_b + self.midpoint('', fraction_b)
+            if fraction_b:
+                return integer_b
+            return self.decrement_integer(integer_b)
+
+        integer_a, fraction_a = self.split_key(a)
+        if b is None:
+            if integer_a == self.largest_integer:
+                return integer_a + self.midpoint(fraction_a, None)
+            return self.increment_integer(integer_a)
+
+        integer_b, fraction_b = self.split_key(b)
+        if integer_a == integer_b:
+            return integer_a + self.midpoint(fraction_a, fraction_b)
+        if integer_a != self.largest_integer:
+            integer = self.increment_integer(integer_a)
+            if integer < b:
+                return integer
+        return integer_a + self.midpoint(fraction_a, None)
+
+    def midpoint(self, a, b):
+        '''
+        Return the digits of a fraction between the fractions `a` and `b`
+        (None meaning 1). Fractions never end with the zero digit.
+        '''
+        if b is not None:
+            # skip the common prefix
+            n = 0
+            while (a[n] if n < len(a) else self.DIGITS[0]) == b[n]:
+                n += 1
+            if n > 0:
+                return b[:n] + self.midpoint(a[n:], b[n:])
+
+        digit_a = self.DIGITS.index(a[0]) if a else 0
+        digit_b = self.DIGITS.index(b[0]) if b is not None else \
+            len(self.DIGITS)
+        if digit_b - digit_a > 1:
+            return self.DIGITS[(digit_a + digit_b + 1) // 2]
+        # consecutive digits
+        if b is not None and len(b) > 1:
+            return b[0]
+        return self.DIGITS[digit_a] + self.midpoint(a[1:], None)
+
+    def get_integer_length(self, head):
+        '''
+        Return the number of digits of an integer part, given its head.
+        '''
+        index = self.DIGITS.index(head)
+        if index >= self.ZERO_HEAD:
+            return index - self.ZERO_HEAD + 1
+        return self.ZERO_HEAD - index
+
+    def split_key(self, key):
+        '''
+        Return the integer and fractional parts of a key.
+        '''
+        length = self.get_integer_length(key[0]) + 1
+        return key[:length], key[length:]
+
+    def increment_integer(self, integer):
+        '''
+        Return the integer part following `integer`.
+        '''
+        head, digits = integer[0], list(integer[1:])
+        for i in reversed(range(len(digits))):
+            index = self.DIGITS.index(digits[i]) + 1
+            if index < len(self.DIGITS):
+                digits[i] = self.DIGITS[index]
+                return head + ''.join(digits)
+            digits[i] = self.DIGITS[0]
+        # overflow: move to the next head, with one digit more (or less)
+        head = self.DIGITS[self.DIGITS.index(head) + 1]
+        return head + self.DIGITS[0] * self.get_integer_length(head)
+
+    def decrement_integer(self, integer):
+        '''
+        Return the integer part preceding `integer`.
+        '''
+        head, digits = integer[0], list(integer[1:])
+        for i in reversed(range(len(digits))):
+            index = self.DIGITS.index(digits[i]) - 1
+            if index >= 0:
+                digits[i] = self.DIGITS[index]
+                return head + ''.join(digits)
+            digits[i] = self.DIGITS[-1]
+        # underflow: move to the previous head, with one digit more (or less)
+        head = self.DIGITS[self.DIGITS.index(head) - 1]
+        return head + self.DIGITS[-1] * self.get_integer_length(head)
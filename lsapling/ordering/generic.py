@@ -12,6 +12,52 @@ class POSITIONS(object):
     RIGHT = RIGHT
 
 
+# indexes of the (left, current, right) siblings that delimit the lower and
+# upper bounds of the available space, for each position, by priority
+SIBLING_BOUNDS = {FIRST: ([],        [0, 1, 2]),
+                  LAST:  ([2, 1, 0], []),
+                  LEFT:  ([0],       [1, 2]),
+                  RIGHT: ([1, 0],    [2])}
+
+
+def get_sibling_bounds(siblings, position):
+    '''
+    Return the siblings that delimit the space where a node would be inserted
+    at `position`, as a (lower, upper) tuple. Any of them can be None if the
+    space is not bounded on that side.
+    '''
+    min_indexes, max_indexes = SIBLING_BOUNDS[position]
+    lower = next((siblings[x] for x in min_indexes if siblings[x]), None)
+    upper = next((siblings[x] for x in max_indexes if siblings[x]), None)
+    return lower, upper
+
+
+# adapter instances, by dotted path
+_adapters = {}
+
+
+def get_orderer_adapter(path):
+    '''
+    Return the orderer adapter instance for a dotted path, importing and
+    instantiating it only the first time.
+    '''
+    adapter = _adapters.get(path)
+    if adapter is None:
+        from importlib import import_module
+        package, klass = str(path).rsplit('.', 1)
+        module = import_module(package)
+        adapter = _adapters[path] = getattr(module, klass)()
+    return adapter
+
+
+class OrderingSpaceExhausted(ValueError):
+    '''
+    Raised by the orderers when there is no room left between two siblings
+    for inserting new positions.
+    '''
+    pass
+
+
 class BaseOrdererAdapter(object):
     '''
     Base adapter for an Orderer.
@@ -29,3 +75,16 @@ class BaseOrdererAdapter(object):
             relative to the current node.
         '''
         raise NotImplementedError
+
+    def get_positions_sibling(self, siblings, position=RIGHT, count=1):
+        '''
+        Get the positional values where `count` consecutive siblings would be
+        inserted, evenly spaced if possible.
+
+        @param siblings: iterator of the existing siblings (left, current,
+            right), ordered by position.
+        @param position: position where the siblings should be inserted,
+            relative to the current node.
+        @param count: number of siblings to be inserted.
+        '''
+        raise NotImplementedError
@@ -1,4 +1,5 @@
-from generic import BaseOrdererAdapter, POSITIONS
+from generic import BaseOrdererAdapter, OrderingSpaceExhausted, POSITIONS, \
+    get_sibling_bounds
 
 
 class SimpleBinaryOrdererAdapter(BaseOrdererAdapter):
@@ -8,6 +9,10 @@ class SimpleBinaryOrdererAdapter(BaseOrdererAdapter):
     def get_position_sibling(self, siblings, position=POSITIONS.RIGHT):
         return self.backend.get_position_sibling(siblings, position)
 
+    def get_positions_sibling(self, siblings, position=POSITIONS.RIGHT,
+                              count=1):
+        return self.backend.get_positions_sibling(siblings, position, count)
+
 
 class SimpleBinaryOrderer(object):
     '''
@@ -18,29 +23,27 @@ class SimpleBinaryOrderer(object):
     NUM_SLOTS = 16
     CHAR_SIZE = 16  # 0..f
     MAX_POS = CHAR_SIZE ** NUM_SLOTS
-    NODE_MAPPER = {POSITIONS.FIRST: ([],        [0, 1, 2]),
-                   POSITIONS.LAST:  ([2, 1, 0], []),
-                   POSITIONS.LEFT:  ([0],       [1, 2]),
-                   POSITIONS.RIGHT: ([1, 0],    [2])}
 
     def __init__(self):
         pass
 
     def get_position_sibling(self, siblings, position):
-        min_indexes, max_indexes = self.NODE_MAPPER[position]
+        return self.get_positions_sibling(siblings, position, 1)[0]
 
-        # iterate over the nodes to find the min and max positions
+    def get_positions_sibling(self, siblings, position, count):
+        # find the min and max positions
+        lower, upper = get_sibling_bounds(siblings, position)
         min_position = 0
         max_position = self.MAX_POS
-        for node in [siblings[x] for x in min_indexes]:
-            if node:
-                min_position = int(node._position, self.CHAR_SIZE)
-                break
-        for node in [siblings[x] for x in max_indexes]:
-            if node:
-                max_position = int(node._position, self.CHAR_SIZE)
-                break
-
-        # calculate the new position
-        new_position = min_position + (max_position - min_position) / 2
-        return '%%0%sx' % self.NUM_SLOTS % new_position
+        if lower:
+            min_position = int(lower._position, self.CHAR_SIZE)
+        if upper:
+            max_position = int(upper._position, self.CHAR_SIZE)
+
+        # split the available space in count + 1 equal parts
+        step = (max_position - min_position) // (count + 1)
+        if step == 0:
+            raise OrderingSpaceExhausted('not enough space for inserting %s '
+                                         'nodes' % count)
+        return ['%%0%sx' % self.NUM_SLOTS % (min_position + step * i)
+                for i in range(1, count + 1)]
@@ -0,0 +1,130 @@
+'''
+Keyset (cursor) pagination of the tree querysets. The pages are fetched
+after (or before) the path and primary key of the last (or first) node of the
+previous page, instead of with an OFFSET, so that fetching a page seeks the
+index of the order instead of scanning and sorting the earlier pages:
+- DFS order (document order: each node followed by its descendants, the
+  siblings of ordered trees sorted by position) seeks the B-tree index of the
+  path.
+- BFS order (by depth and path, as the ordering of `OrderedTree`) seeks the
+  `(_depth, _path)` index of the denormalized trees, or the
+  `(nlevel(_path), _path)` index created by the `post_migrate` callback in
+  `lsapling.apps` for the other trees.
+
+The cursors are opaque, URL-safe tokens, signed with the `SECRET_KEY`.
+'''
+import collections
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+
+from instrumentation import instrument
+from ltree import LtreePath
+from subtree import BFS, DFS
+
+SALT = 'lsapling.pagination'
+NEXT, PREVIOUS = 'n', 'p'
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorPaginator(object):
+    '''
+    Paginator of the nodes of a `TreeQuerySet` in DFS or BFS order, e.g.:
+        paginator = CursorPaginator(Node.objects.all(), 50)
+        page = paginator.page(request.GET.get('cursor'))
+        ... page.next_cursor ...
+    '''
+    def __init__(self, queryset, per_page, order=DFS):
+        if order not in (DFS, BFS):
+            raise ValueError("'order' must be '%s' or '%s'" % (DFS, BFS))
+        if per_page < 1:
+            raise ValueError("'per_page' must be a positive integer")
+        self.queryset = queryset
+        self.per_page = per_page
+        self.order = order
+
+    def page(self, cursor=None):
+        '''
+        Return the `CursorPage` pointed by `cursor` (the first page if None).
+        Raises InvalidCursor if the cursor is not valid for the paginator.
+        '''
+        direction, path, pk = self.decode_cursor(cursor) if cursor \
+            else (NEXT, None, None)
+        reverse = direction == PREVIOUS
+        queryset = self.queryset
+        if path is not None:
+            queryset = queryset._filter_keyset(self.order, path, pk, reverse)
+        queryset = queryset.order_by(
+            *queryset._get_keyset_ordering(self.order, reverse))
+        with instrument(queryset.model, 'paginate', queryset.db):
+            nodes = list(queryset[:self.per_page + 1])
+
+        # the extra node tells whether there is a page further in the
+        # direction of the cursor
+        has_more = len(nodes) > self.per_page
+        nodes = nodes[:self.per_page]
+        if reverse:
+            nodes.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = path is not None, has_more
+        return CursorPage(
+            nodes, self,
+            next_cursor=self.encode_cursor(NEXT, nodes[-1])
+            if has_next and nodes else None,
+            previous_cursor=self.encode_cursor(PREVIOUS, nodes[0])
+            if has_previous and nodes else None)
+
+    def encode_cursor(self, direction, node):
+        return signing.dumps([self.order, direction, node._path, node.pk],
+                             salt=SALT, compress=True)
+
+    def decode_cursor(self, cursor):
+        '''
+        Return the direction, and the path and primary key of the node of
+        `cursor`.
+        '''
+        try:
+            order, direction, path, pk = signing.loads(cursor, salt=SALT)
+            pk = self.queryset.model._meta.pk.to_python(pk)
+        except (signing.BadSignature, TypeError, ValueError,
+                ValidationError):
+            raise InvalidCursor('Invalid cursor')
+        if order != self.order or direction not in (NEXT, PREVIOUS):
+            raise InvalidCursor('Invalid cursor')
+        return direction, LtreePath(path), pk
+
+
+class CursorPage(collections.Sequence):
+    '''
+    Page of nodes, with the cursors of the next and previous pages (None if
+    there are none).
+    '''
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Page of %d nodes>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
@@ -1,6 +1,34 @@
 from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
 
 LSAPLING_ORDERER_ADAPTER = getattr(
     settings,
     'LSAPLING_ORDERER_ADAPTER',
     'lsapling.ordering.simplebinaryorderer.SimpleBinaryOrdererAdapter')
+
+# tag the SQL of the tree operations with their name, and collect their
+# queries and time (see lsapling.instrumentation)
+LSAPLING_INSTRUMENTATION = getattr(
+    settings,
+    'LSAPLING_INSTRUMENTATION',
+    False)
+
+# alias of the Django cache used for caching the ascendants, children and
+# subtrees of the nodes (see lsapling.cache), or None for disabling it
+LSAPLING_CACHE = getattr(
+    settings,
+    'LSAPLING_CACHE',
+    None)
+
+LSAPLING_CACHE_TIMEOUT = getattr(
+    settings,
+    'LSAPLING_CACHE_TIMEOUT',
+    DEFAULT_TIMEOUT)
+
+# strategy for compiling the ascendant, descendant and path_like_exact
+# lookups with a queryset as right-hand side: 'array', 'join' or 'exists'
+# (see lsapling.lookups.ArrayLookup)
+LSAPLING_LOOKUP_STRATEGY = getattr(
+    settings,
+    'LSAPLING_LOOKUP_STRATEGY',
+    'array')
@@ -0,0 +1,11 @@
+from django.dispatch import Signal
+
+# sent after the positions of a set of siblings have been spread evenly,
+# with the path of their parent (None for root nodes) and their number
+siblings_rebalanced = Signal(providing_args=['parent_path', 'count'])
+
+# sent after an instrumented tree operation ran queries, with the operation
+# name, the number of queries and the time spent in the operation and in
+# the database, in seconds (see lsapling.instrumentation)
+operation_executed = Signal(providing_args=['operation', 'queries',
+                                            'duration', 'sql_duration'])
@@ -0,0 +1,173 @@
+import json
+from collections import deque
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.forms.models import model_to_dict
+
+# ascii-art constants
+DT_CORNER, DT_LINE_VER, DT_LINE_HOR, DT_LINE_VER_CONT = (u'\u2514',
+                                                         u'\u2502',
+                                                         u'\u2500',
+                                                         u'\u251c')
+
+# traversal orders and events of TreeQuerySet.iter_subtree()
+DFS, BFS = 'dfs', 'bfs'
+ENTER, LEAVE = 'enter', 'leave'
+
+
+class SubtreeNode(object):
+    '''
+    In-memory node of a materialized subtree, holding the model instance and
+    the links to its parent and children. Walking the graph does not hit the
+    database.
+    '''
+    __slots__ = ('instance', 'parent', 'children')
+
+    def __init__(self, instance, parent=None):
+        self.instance = instance
+        self.parent = parent
+        self.children = []
+
+    @property
+    def is_root(self):
+        return self.parent is None
+
+    @property
+    def is_leaf(self):
+        return not self.children
+
+    @property
+    def level(self):
+        '''
+        Depth of the node relative to the root of the materialized subtree.
+        '''
+        level = 0
+        node = self.parent
+        while node is not None:
+            level += 1
+            node = node.parent
+        return level
+
+    def walk(self):
+        '''
+        Yield the node and its descendants, depth-first (document order).
+        '''
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def pretty_print(self):
+        '''
+        Pretty print the node and its descendants.
+        '''
+        lines = []
+        # each entry: (node, is last child, list of "line continues" flags)
+        stack = [(self, False, [])]
+        while stack:
+            node, last, pre = stack.pop()
+            label = unicode(node.instance)
+            if len(pre) == 0:
+                lines.append(label)
+            else:
+                pres = [(DT_LINE_VER if x else u' ') + u' '*3 for x in pre]
+                pres_str = u''.join(pres[:-1])
+                lines.append(pres_str +
+                             (DT_CORNER if last else DT_LINE_VER_CONT) +
+                             DT_LINE_HOR*3 + label)
+
+            for child in reversed(node.children):
+                child_last = child is node.children[-1]
+                stack.append((child, child_last, pre + [not child_last]))
+
+        return u'\n'.join(lines)
+
+    def to_dict(self, fields=None, exclude=None):
+        '''
+        Return the node and its descendants as nested dictionaries, suitable
+        for serialization. The instance fields are serialized using
+        `model_to_dict()`, and the children are stored under `children`.
+        '''
+        ret = model_to_dict(self.instance, fields=fields, exclude=exclude)
+        ret['children'] = [child.to_dict(fields, exclude)
+                           for child in self.children]
+        return ret
+
+    def to_json(self, fields=None, exclude=None, **kwargs):
+        '''
+        Return the node and its descendants serialized as JSON.
+        '''
+        kwargs.setdefault('cls', DjangoJSONEncoder)
+        return json.dumps(self.to_dict(fields, exclude), **kwargs)
+
+    def __iter__(self):
+        return iter(self.children)
+
+    def __repr__(self):
+        return '<%s: %r>' % (self.__class__.__name__, self.instance)
+
+
+def build_subtree(instances):
+    '''
+    Assemble a list of model instances into a graph of `SubtreeNode`, linking
+    each node to its parent by path. Children keep the relative order of
+    `instances`. Return the list of nodes whose parent is not present in
+    `instances`.
+    '''
+    nodes = [SubtreeNode(instance) for instance in instances]
+    by_path = dict((node.instance._path, node) for node in nodes)
+
+    roots = []
+    for node in nodes:
+        parent = by_path.get(node.instance._path.parent)
+        if parent is None:
+            roots.append(node)
+        else:
+            node.parent = parent
+            parent.children.append(node)
+
+    return roots
+
+
+def dfs_events(instances):
+    '''
+    Yield (ENTER, instance) and (LEAVE, instance) events for the instances,
+    given in depth-first order, an instance being left after its
+    descendants. Only the chain of the current ascendants is kept in memory.
+    '''
+    stack = []
+    for instance in instances:
+        while stack and (stack[-1]._path == instance._path or
+                         not stack[-1]._path.is_ancestor_of(instance._path)):
+            yield LEAVE, stack.pop()
+        yield ENTER, instance
+        stack.append(instance)
+    while stack:
+        yield LEAVE, stack.pop()
+
+
+def bfs_events(instances):
+    '''
+    Yield (ENTER, instance) and (LEAVE, instance) events for the instances,
+    given in breadth-first order (by depth and path), an instance being left
+    after its children. At most two levels are kept in memory.
+    '''
+    pending = deque()
+    for instance in instances:
+        level = instance._path.depth
+        parent_path = instance._path.parent
+        # the children of a level come in the order of their parents, which
+        # ltree compares label by label ('a.z' < 'a-b.c', unlike the strings)
+        while pending:
+            pending_level = pending[0]._path.depth
+            if pending_level < level - 1 or \
+                    (pending_level == level - 1 and
+                     pending[0]._path.labels < parent_path.labels):
+                yield LEAVE, pending.popleft()
+            else:
+                break
+        yield ENTER, instance
+        pending.append(instance)
+    while pending:
+        yield LEAVE, pending.popleft()
@@ -0,0 +1,68 @@
+'''
+Stress benchmark of concurrent add_child() calls on the same parent, with
+and without the advisory locks of OrderedTreeQuerySet. A test database is
+created for the run, using the connection settings of the project.
+
+Usage (from the tests directory):
+    python -m benchmarks.concurrent_inserts [threads] [inserts per thread]
+'''
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+import django  # noqa
+django.setup()
+
+from django.db import connection  # noqa
+from lsapling.ordering.generic import POSITIONS  # noqa
+from testapp.models import NoCustomFieldsOrderedTree  # noqa
+
+
+def run_threads(root, num_threads, num_inserts):
+    '''
+    Run the inserts, returning the elapsed time and the number of failed
+    inserts.
+    '''
+    errors = []
+
+    def insert():
+        try:
+            for i in range(num_inserts):
+                try:
+                    root.add_child(position=[POSITIONS.FIRST,
+                                             POSITIONS.LAST][i % 2])
+                except Exception as e:
+                    errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=insert) for _ in range(num_threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start, len(errors)
+
+
+def run(num_threads=16, num_inserts=100):
+    for lock_siblings in (True, False):
+        NoCustomFieldsOrderedTree.lock_siblings = lock_siblings
+        root = NoCustomFieldsOrderedTree.objects.add_root()
+        elapsed, errors = run_threads(root, num_threads, num_inserts)
+        positions = list(root.get_children().
+                         values_list('_position', flat=True))
+        print('lock_siblings=%-5s %6d inserts %8.1f inserts/s '
+              '%6d failed %6d duplicated positions' %
+              (lock_siblings, len(positions), len(positions) / elapsed,
+               errors, len(positions) - len(set(positions))))
+
+
+if __name__ == '__main__':
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        run(*[int(arg) for arg in sys.argv[1:]])
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,94 @@
+'''
+Benchmark of the strategies for compiling the lookups with a queryset as
+right-hand side (see lsapling.lookups.ArrayLookup), as the number of source
+nodes grows, using the NoCustomFieldsTree test model. A test database is
+created for the run, using the connection settings of the project.
+
+For each tree shape, a tree is loaded with COPY, and `get_ascendants()`,
+`get_descendants()` and `get_children()` are run on querysets of an
+increasing number of random nodes with each strategy, recording the median
+latency and whether the GiST index was used.
+
+Usage (from the tests directory):
+    python -m benchmarks.lookup_strategies [--size 100000]
+        [--shapes deep,wide,random] [--sources 1,10,100,1000] [--repeat 5]
+'''
+import argparse
+import random
+import sys
+from timeit import default_timer
+
+from benchmarks.tree_operations import SEED, SHAPES, load_tree, percentile
+from django.db import connection  # noqa
+from testapp.models import NoCustomFieldsTree  # noqa
+
+STRATEGIES = ('array', 'join', 'exists')
+OPERATIONS = ('get_ascendants', 'get_descendants', 'get_children')
+
+
+def measure(queryset, repeat):
+    '''
+    Return the median latency (in milliseconds) of evaluating the queryset,
+    and whether its plan uses a GiST index.
+    '''
+    cursor = connection.cursor()
+    sql, params = queryset.query.sql_with_params()
+    cursor.execute('EXPLAIN ' + sql, params)
+    plan = '\n'.join(row[0] for row in cursor.fetchall())
+    latencies = []
+    for _ in range(repeat):
+        start = default_timer()
+        list(queryset.all())
+        latencies.append((default_timer() - start) * 1000)
+    latencies.sort()
+    return percentile(latencies, 50), '_gist' in plan
+
+
+def run(size, shapes, sources, repeat):
+    model = NoCustomFieldsTree
+    print('%-40s %s' % ('operation', ' '.join('%16s' % strategy
+                                               for strategy in STRATEGIES)))
+    for shape in shapes:
+        load_tree(model, shape, size, 0)
+        pks = list(model.objects.values_list('pk', flat=True))
+        for num_sources in sources:
+            sample = random.Random(SEED).sample(pks, min(num_sources,
+                                                         len(pks)))
+            src = model.objects.filter(pk__in=sample)
+            for operation in OPERATIONS:
+                line = '%-40s' % ('%s/%s/%s' % (shape, num_sources,
+                                                operation))
+                for strategy in STRATEGIES:
+                    queryset = getattr(src.with_lookup_strategy(strategy),
+                                       operation)()
+                    latency, gist = measure(queryset, repeat)
+                    line += ' %10.2f %5s' % (latency,
+                                             'gist' if gist else '')
+                print(line)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the lookup strategies.')
+    parser.add_argument('--size', type=int, default=100000,
+                        help='tree size')
+    parser.add_argument('--shapes', default=','.join(SHAPES),
+                        help='comma separated tree shapes (%s)' %
+                        ', '.join(SHAPES))
+    parser.add_argument('--sources', default='1,10,100,1000',
+                        help='comma separated numbers of source nodes')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of runs per query')
+    args = parser.parse_args(argv)
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        run(args.size, args.shapes.split(','),
+            [int(n) for n in args.sources.split(',')], args.repeat)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
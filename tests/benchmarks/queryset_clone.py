@@ -0,0 +1,53 @@
+'''
+Micro-benchmark of the cost of creating the querysets used by the
+add_child() and add_sibling() paths of OrderedTreeQuerySet, without hitting
+the database.
+
+Usage (from the tests directory):
+    python -m benchmarks.queryset_clone
+'''
+import os
+import timeit
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+import django  # noqa
+django.setup()
+
+from testapp.models import NoCustomFieldsOrderedTree  # noqa
+
+
+def build_sibling_querysets(node):
+    '''
+    Build (without evaluating) the querysets of the add_sibling() path.
+    '''
+    siblings = node.get_siblings()
+    return (siblings.filter(_position__lt=node._position).
+            order_by('-_position'),
+            siblings.filter(_position__gt=node._position).
+            order_by('_position'))
+
+
+def build_child_querysets(node):
+    '''
+    Build (without evaluating) the querysets of the add_child() path.
+    '''
+    children = node.get_children()
+    return children.order_by('_position'), children.order_by('-_position')
+
+
+def run(number=2000):
+    node = NoCustomFieldsOrderedTree(pk=1,
+                                     _path='8000000000000000.4000000000000000',
+                                     _position='4000000000000000')
+    results = [
+        ('queryset clone', lambda: NoCustomFieldsOrderedTree.objects.all()),
+        ('add_sibling() querysets', lambda: build_sibling_querysets(node)),
+        ('add_child() querysets', lambda: build_child_querysets(node)),
+    ]
+    for name, func in results:
+        elapsed = min(timeit.repeat(func, number=number, repeat=3))
+        print('%-25s %8.1f us' % (name, elapsed / number * 1e6))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,268 @@
+'''
+Benchmark of the tree operations on generated trees of increasing size, using
+the NoCustomFieldsTree and NoCustomFieldsOrderedTree test models. A test
+database is created for the run, using the connection settings of the
+project.
+
+For each model, tree shape and size, the trees are loaded with COPY, and the
+operations are run on a fixed random sample of nodes, recording the latency
+percentiles, the number of queries and the EXPLAIN plans of the queries. The
+results can be saved as a baseline, and later runs compared against it:
+operations whose p50 or p95 latency grow more than the threshold, or which
+run more queries, are reported as regressions (and the exit status is 1).
+
+Usage (from the tests directory):
+    python -m benchmarks.tree_operations [--sizes 1000,10000,100000]
+        [--shapes deep,wide,random] [--samples 20] [--repeat 5]
+        [--save results.json] [--baseline baseline.json] [--threshold 1.25]
+        [--explain]
+'''
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+from cStringIO import StringIO
+from timeit import default_timer
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+import django  # noqa
+django.setup()
+
+from django.db import connection  # noqa
+from django.test.utils import CaptureQueriesContext  # noqa
+from lsapling.models import OrderedTree  # noqa
+from lsapling.ordering.generic import POSITIONS  # noqa
+from testapp.models import NoCustomFieldsOrderedTree, \
+    NoCustomFieldsTree  # noqa
+
+SEED = 20161018
+BATCH_SIZE = 10000
+
+# shape: (children per node, maximum depth, breadth-first)
+SHAPES = collections.OrderedDict([
+    # binary tree grown depth-first, reaching the maximum depth quickly
+    ('deep', (lambda rng: 2, 64, False)),
+    # 1000 children per node
+    ('wide', (lambda rng: 1000, None, True)),
+    # random number of children per node
+    ('random', (lambda rng: rng.randint(0, 12), None, True)),
+])
+
+OPERATIONS = collections.OrderedDict([
+    ('get_descendants', lambda node: list(node.get_descendants())),
+    ('get_children', lambda node: list(node.get_children())),
+    ('get_siblings', lambda node: list(node.get_siblings())),
+    ('pretty_print', lambda node: node.pretty_print()),
+    # the inserts are run last, as they modify the tree
+    ('add_child', lambda node: node.add_child()),
+    ('add_sibling', lambda node: node.add_sibling(position=POSITIONS.LEFT)),
+])
+
+
+def generate_nodes(model, shape, size):
+    '''
+    Yield the (path, position) of the `size` nodes of a tree of the given
+    shape, parents first. The positions are calculated with the orderer of
+    ordered trees, and are None otherwise.
+    '''
+    get_fanout, max_depth, breadth_first = SHAPES[shape]
+    orderer = model.objects.all().orderer \
+        if issubclass(model, OrderedTree) else None
+    rng = random.Random(SEED)
+    pending = collections.deque([('', 0)])
+    count = 0
+    while pending and count < size:
+        parent_path, depth = pending.popleft() if breadth_first \
+            else pending.pop()
+        if max_depth is not None and depth >= max_depth:
+            continue
+        fanout = min(get_fanout(rng) if parent_path else 1, size - count)
+        if not fanout:
+            continue
+        if orderer is not None:
+            labels = positions = orderer.get_positions_sibling(
+                [None, None, None], POSITIONS.LAST, fanout)
+        else:
+            labels = ['n%d' % i for i in range(count, count + fanout)]
+            positions = [None] * fanout
+
+        children = []
+        for label, position in zip(labels, positions):
+            path = parent_path + '.' + label if parent_path else label
+            children.append((path, depth + 1))
+            yield path, position
+        count += fanout
+        pending.extend(children if breadth_first else reversed(children))
+
+
+def load_tree(model, shape, size, num_samples):
+    '''
+    Replace the contents of the table of `model` with a generated tree, and
+    return a sample of its nodes.
+    '''
+    table = model._meta.db_table
+    ordered = issubclass(model, OrderedTree)
+    columns = ('_path', '_position') if ordered else ('_path',)
+    rng = random.Random(SEED)
+    sample = []
+
+    cursor = connection.cursor()
+    cursor.execute('TRUNCATE %s RESTART IDENTITY CASCADE' % table)
+    buf = StringIO()
+    for i, (path, position) in enumerate(generate_nodes(model, shape, size)):
+        # reservoir sampling
+        if len(sample) < num_samples:
+            sample.append(path)
+        elif rng.randint(0, i) < num_samples:
+            sample[rng.randint(0, num_samples - 1)] = path
+        buf.write(path + ('\t' + position if ordered else '') + '\n')
+        if (i + 1) % BATCH_SIZE == 0:
+            buf.seek(0)
+            cursor.copy_from(buf, table, columns=columns)
+            buf = StringIO()
+    buf.seek(0)
+    cursor.copy_from(buf, table, columns=columns)
+    cursor.execute('ANALYZE %s' % table)
+    return list(model.objects.filter(_path__in=sample).order_by('_path'))
+
+
+def explain(queries):
+    '''
+    Return the EXPLAIN plans of the captured queries.
+    '''
+    cursor = connection.cursor()
+    plans = []
+    for query in queries:
+        sql = query['sql']
+        if sql.split(None, 1)[0].upper() not in ('SELECT', 'INSERT',
+                                                 'UPDATE', 'DELETE'):
+            continue
+        cursor.execute('EXPLAIN ' + sql)
+        plans.append('\n'.join(row[0] for row in cursor.fetchall()))
+    return plans
+
+
+def percentile(values, percent):
+    '''
+    Return the percentile of the sorted `values`, using the nearest rank.
+    '''
+    index = max(int(round(percent / 100.0 * len(values))) - 1, 0)
+    return values[index]
+
+
+def measure(operation, nodes, repeat):
+    '''
+    Run the operation on each node `repeat` times, and return its latency
+    percentiles (in milliseconds), queries per call and query plans.
+    '''
+    with CaptureQueriesContext(connection) as queries:
+        operation(nodes[0])
+    plans = explain(queries)
+
+    latencies = []
+    num_queries = 0
+    for _ in range(repeat):
+        for node in nodes:
+            with CaptureQueriesContext(connection) as queries:
+                start = default_timer()
+                operation(node)
+                latencies.append((default_timer() - start) * 1000)
+            num_queries += len(queries)
+    latencies.sort()
+    return {'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1],
+            'queries': float(num_queries) / len(latencies),
+            'plans': plans}
+
+
+def compare(result, baseline, threshold):
+    '''
+    Return the list of regressions of `result` over `baseline`.
+    '''
+    regressions = []
+    for key in ('p50', 'p95'):
+        if result[key] > baseline[key] * threshold:
+            regressions.append('%s x%.2f' % (key,
+                                             result[key] / baseline[key]))
+    if result['queries'] > baseline['queries']:
+        regressions.append('queries %.1f -> %.1f' % (baseline['queries'],
+                                                     result['queries']))
+    return regressions
+
+
+def run(sizes, shapes, num_samples, repeat, baseline=None, threshold=1.25,
+        show_plans=False):
+    results = collections.OrderedDict()
+    regressions = 0
+    print('%-56s %9s %9s %9s %9s %7s' % ('operation', 'p50 ms', 'p95 ms',
+                                         'p99 ms', 'max ms', 'queries'))
+    for model in (NoCustomFieldsTree, NoCustomFieldsOrderedTree):
+        for shape in shapes:
+            for size in sizes:
+                nodes = load_tree(model, shape, size, num_samples)
+                for name, operation in OPERATIONS.items():
+                    if not hasattr(model, name):
+                        continue
+                    key = '%s/%s/%s/%s' % (model.__name__, shape, size, name)
+                    result = results[key] = measure(operation, nodes, repeat)
+                    line = '%-56s %9.2f %9.2f %9.2f %9.2f %7.1f' % (
+                        key, result['p50'], result['p95'], result['p99'],
+                        result['max'], result['queries'])
+                    if baseline and key in baseline:
+                        found = compare(result, baseline[key], threshold)
+                        if found:
+                            regressions += 1
+                            line += '  REGRESSION: ' + ', '.join(found)
+                    print(line)
+                    if show_plans:
+                        for plan in result['plans']:
+                            print('    ' + plan.replace('\n', '\n    '))
+    return results, regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the tree operations.')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='comma separated tree sizes (up to 10000000)')
+    parser.add_argument('--shapes', default=','.join(SHAPES),
+                        help='comma separated tree shapes (%s)' %
+                        ', '.join(SHAPES))
+    parser.add_argument('--samples', type=int, default=20,
+                        help='number of nodes the operations are run on')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of runs per node')
+    parser.add_argument('--save', help='file to write the results to')
+    parser.add_argument('--baseline', help='results file to compare with')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='latency ratio reported as a regression')
+    parser.add_argument('--explain', action='store_true',
+                        help='print the query plans')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        results, regressions = run(
+            [int(size) for size in args.sizes.split(',')],
+            args.shapes.split(','), args.samples, args.repeat, baseline,
+            args.threshold, args.explain)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
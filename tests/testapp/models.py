@@ -1,4 +1,6 @@
-from lsapling.models import Tree, OrderedTree
+from django.db import models
+from lsapling.models import Tree, OrderedTree, DenormalizedTree, \
+    DenormalizedOrderedTree
 
 
 class NoCustomFieldsTree(Tree):
@@ -7,3 +9,25 @@ class NoCustomFieldsTree(Tree):
 
 class NoCustomFieldsOrderedTree(OrderedTree):
     pass
+
+
+class FractionalOrderedTree(OrderedTree):
+    orderer_adapter = \
+        'lsapling.ordering.fractionalorderer.FractionalOrdererAdapter'
+
+
+class NoCustomFieldsDenormalizedTree(DenormalizedTree):
+    pass
+
+
+class NoCustomFieldsDenormalizedOrderedTree(DenormalizedOrderedTree):
+    pass
+
+
+class NoCustomFieldsTreeItem(models.Model):
+    node = models.ForeignKey(NoCustomFieldsTree, related_name='items')
+    price = models.IntegerField()
+
+
+class SubtreeCountsTree(Tree):
+    descendant_count = models.IntegerField(default=0)
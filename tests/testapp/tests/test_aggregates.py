@@ -0,0 +1,73 @@
+from django.db.models import Count, Sum
+from django.test.testcases import TestCase
+
+from testapp.models import NoCustomFieldsTree, NoCustomFieldsTreeItem, \
+    SubtreeCountsTree
+
+
+class SubtreeAggregatesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        paths = ['Top',
+                 'Top.Science',
+                 'Top.Science.Astronomy',
+                 'Top.Science.Astronomy.Astrophysics',
+                 'Top.Science.Astronomy.Cosmology',
+                 'Top.Hobbies',
+                 'Top.Hobbies.Amateurs_Astronomy']
+        for path in paths:
+            node = NoCustomFieldsTree.objects.create(_path=path)
+            SubtreeCountsTree.objects.create(_path=path)
+            for price in range(path.count('.')):
+                NoCustomFieldsTreeItem.objects.create(node=node, price=price)
+
+    def test_001_annotate_subtree(self):
+        '''
+        Counts and sums over the subtrees, including related models.
+        '''
+        with self.assertNumQueries(1):
+            nodes = list(NoCustomFieldsTree.objects.filter(
+                _path__nlevel__lte=2).annotate_subtree(
+                size=Count('pk'),
+                item_count=Count('items'),
+                total=Sum('items__price')).order_by('_path'))
+
+        self.assertEqual(
+            [(node._path, node.size, node.item_count, node.total)
+             for node in nodes],
+            [('Top', 7, 12, 8),
+             ('Top.Hobbies', 2, 3, 1),
+             ('Top.Science', 4, 9, 7)])
+
+        node = NoCustomFieldsTree.objects.annotate_subtree(
+            include_self=False, descendants=Count('pk'),
+            total=Sum('items__price')).get(_path='Top.Hobbies')
+        self.assertEqual((node.descendants, node.total), (1, 1))
+        # the annotations can be filtered on
+        self.assertEqual(
+            set(NoCustomFieldsTree.objects.annotate_subtree(
+                include_self=False, descendants=Count('pk')).
+                filter(descendants=0).values_list('_path', flat=True)),
+            set(['Top.Science.Astronomy.Astrophysics',
+                 'Top.Science.Astronomy.Cosmology',
+                 'Top.Hobbies.Amateurs_Astronomy']))
+
+    def test_002_update_subtree_aggregates(self):
+        '''
+        Store the aggregates in denormalized columns.
+        '''
+        with self.assertNumQueries(1):
+            count = SubtreeCountsTree.objects.exclude(_path='Top').\
+                update_subtree_aggregates(include_self=False,
+                                          descendant_count=Count('pk'))
+        self.assertEqual(count, 6)
+        self.assertEqual(
+            dict(SubtreeCountsTree.objects.values_list('_path',
+                                                       'descendant_count')),
+            {'Top': 0,
+             'Top.Science': 3,
+             'Top.Science.Astronomy': 2,
+             'Top.Science.Astronomy.Astrophysics': 0,
+             'Top.Science.Astronomy.Cosmology': 0,
+             'Top.Hobbies': 1,
+             'Top.Hobbies.Amateurs_Astronomy': 0})
@@ -0,0 +1,167 @@
+import threading
+
+from django.core.cache import caches
+from django.db import connection
+from django.test.testcases import TestCase, TransactionTestCase
+from lsapling import cache, settings
+from lsapling.ltree import LtreePath
+from lsapling.ordering.generic import POSITIONS
+
+from testapp.models import NoCustomFieldsOrderedTree
+
+
+class CacheTestCase(TestCase):
+    def setUp(self):
+        settings.LSAPLING_CACHE = 'default'
+        self.addCleanup(setattr, settings, 'LSAPLING_CACHE', None)
+        caches['default'].clear()
+        cache.reset_stats()
+
+        self.root = NoCustomFieldsOrderedTree.objects.add_root()
+        self.a = self.root.add_child()
+        self.b = self.root.add_child()
+        self.a1 = self.a.add_child()
+        self.a11 = self.a1.add_child()
+
+    def test_001_ascendants(self):
+        '''
+        The ascendants are cached node by node, and shared by the siblings.
+        '''
+        expected = [self.root, self.a, self.a1]
+        with self.assertNumQueries(1):
+            self.assertEqual(self.a11.get_cached_ascendants(), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.a11.get_cached_ascendants(), expected)
+        # only the missing ascendant is fetched
+        a12 = self.a1.add_sibling()
+        with self.assertNumQueries(0):
+            self.assertEqual(a12.get_cached_ascendants(),
+                             [self.root, self.a])
+        self.assertEqual(cache.get_stats()['ascendants'],
+                         {'hits': 2, 'misses': 1})
+
+        # saving a node invalidates its entry
+        self.a.save()
+        with self.assertNumQueries(1):
+            self.a11.get_cached_ascendants()
+
+    def test_002_children_and_subtree(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.root.get_cached_children(),
+                             [self.a, self.b])
+            self.assertEqual(self.root.get_cached_children(),
+                             [self.a, self.b])
+        with self.assertNumQueries(1):
+            self.root.get_cached_subtree()
+            subtree = self.root.get_cached_subtree()
+        self.assertEqual([node.instance for node in subtree.walk()],
+                         [self.root, self.a, self.a1, self.a11, self.b])
+        self.assertEqual(cache.get_stats()['children'],
+                         {'hits': 1, 'misses': 1})
+
+        # adding a grandchild keeps the children of the root, but not the
+        # subtree
+        self.a.add_child()
+        with self.assertNumQueries(0):
+            self.root.get_cached_children()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(self.root.get_cached_subtree().walk())),
+                             6)
+        # adding and deleting children invalidate the list
+        c = self.b.add_sibling()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.root.get_cached_children(),
+                             [self.a, self.b, c])
+        c.delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.root.get_cached_children(),
+                             [self.a, self.b])
+
+        # deleted nodes have no subtree
+        self.a11.delete()
+        self.assertRaises(NoCustomFieldsOrderedTree.DoesNotExist,
+                          self.a11.get_cached_subtree)
+
+    def test_003_moves(self):
+        '''
+        Moves invalidate all the entries of the model.
+        '''
+        self.root.get_cached_children()
+        self.a11.get_cached_ascendants()
+        self.a.move_to(self.b, position=POSITIONS.RIGHT)
+        self.a11.refresh_from_db()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.root.get_cached_children(),
+                             [self.b, self.a])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.a11.get_cached_ascendants(),
+                             [self.root, self.a, self.a1])
+
+    def test_004_disabled(self):
+        settings.LSAPLING_CACHE = None
+        with self.assertNumQueries(1):
+            self.assertEqual(self.a11.get_cached_ascendants(),
+                             [self.root, self.a, self.a1])
+        with self.assertNumQueries(1):
+            self.a11.get_cached_ascendants()
+        self.assertEqual(cache.get_stats(), {})
+
+    def test_005_non_ascii_paths(self):
+        '''
+        The keys of the paths with non-ASCII labels (allowed by ltree in
+        UTF-8 locales) are built from their UTF-8 bytes.
+        '''
+        tree_cache = cache.get_tree_cache(NoCustomFieldsOrderedTree)
+        paths = [LtreePath(u'T\xf3p.Ni\xf1o'), u'T\xf3p.Ni\xf1o']
+        keys = [tree_cache.make_key('node', path) for path in paths]
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(keys[0], tree_cache.make_key('node', 'Top.Nino'))
+        tree_cache.invalidate_paths(paths)
+
+    def test_006_saved_path(self):
+        '''
+        Saving a node with a new path also invalidates the entries of the
+        path it was fetched with.
+        '''
+        self.assertEqual(self.root.get_cached_children(), [self.a, self.b])
+        self.assertEqual(self.a.get_cached_children(), [self.a1])
+        b = NoCustomFieldsOrderedTree.objects.get(pk=self.b.pk)
+        b._path = self.a._path.child(b._position)
+        b.save()
+        with self.assertNumQueries(2):
+            self.assertEqual(self.root.get_cached_children(), [self.a])
+            self.assertEqual(self.a.get_cached_children(), [self.a1, b])
+
+
+class CacheTransactionTestCase(TransactionTestCase):
+    available_apps = ['lsapling', 'testapp']
+
+    def setUp(self):
+        settings.LSAPLING_CACHE = 'default'
+        self.addCleanup(setattr, settings, 'LSAPLING_CACHE', None)
+        caches['default'].clear()
+
+    def test_001_invalidate_on_commit(self):
+        '''
+        The entries are invalidated again once the transaction of the writes
+        is committed, dropping the rows cached meanwhile by other
+        connections.
+        '''
+        root = NoCustomFieldsOrderedTree.objects.add_root()
+        a = root.add_child()
+
+        def read():
+            try:
+                NoCustomFieldsOrderedTree.objects.get(pk=root.pk).\
+                    get_cached_children()
+            finally:
+                connection.close()
+
+        with cache.atomic():
+            b = root.add_child()
+            # a concurrent reader caches the children it sees before the
+            # commit
+            thread = threading.Thread(target=read)
+            thread.start()
+            thread.join()
+        self.assertEqual(root.get_cached_children(), [a, b])
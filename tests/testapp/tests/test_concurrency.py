@@ -0,0 +1,173 @@
+import threading
+
+from django.db import connection
+from django.test.testcases import TransactionTestCase
+from lsapling.ordering.generic import POSITIONS
+
+from testapp.models import NoCustomFieldsOrderedTree, NoCustomFieldsTree
+
+
+class ConcurrencyTestCase(TransactionTestCase):
+    '''
+    Tests that run several writers concurrently, each one in its own thread
+    and database connection.
+    '''
+    available_apps = ['lsapling', 'testapp']
+    NUM_THREADS = 8
+    NUM_INSERTS = 20
+
+    def run_threads(self, target):
+        errors = []
+
+        def wrapper():
+            try:
+                target()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=wrapper)
+                   for _ in range(self.NUM_THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def assertUniquePositions(self, nodes):
+        positions = [node._position for node in nodes]
+        self.assertEqual(len(positions), len(set(positions)))
+
+    def test_001_concurrent_add_child(self):
+        '''
+        Concurrent add_child() on the same parent produce unique positions.
+        '''
+        root = NoCustomFieldsOrderedTree.objects.add_root()
+
+        def insert():
+            for i in range(self.NUM_INSERTS):
+                root.add_child(position=[POSITIONS.FIRST,
+                                         POSITIONS.LAST][i % 2])
+        self.run_threads(insert)
+
+        children = root.get_children()
+        self.assertEqual(len(children), self.NUM_THREADS * self.NUM_INSERTS)
+        self.assertUniquePositions(children)
+
+    def test_002_concurrent_add_sibling(self):
+        '''
+        Concurrent add_sibling() next to the same node produce unique
+        positions, including the rebalancing of the siblings.
+        '''
+        root = NoCustomFieldsOrderedTree.objects.add_root()
+        current = root.add_child()
+
+        def insert():
+            for _ in range(self.NUM_INSERTS):
+                NoCustomFieldsOrderedTree.objects.get(pk=current.pk).\
+                    add_sibling(position=POSITIONS.RIGHT)
+        self.run_threads(insert)
+
+        children = root.get_children()
+        self.assertEqual(len(children),
+                         self.NUM_THREADS * self.NUM_INSERTS + 1)
+        self.assertUniquePositions(children)
+
+    def test_003_add_child_during_rebalance(self):
+        '''
+        add_child() under a grandchild and add_sibling() next to it, while
+        the children of its grandparent are rebalanced (rewriting the path of
+        the grandchild), don't leave orphaned nodes at the old paths.
+        '''
+        model = NoCustomFieldsOrderedTree
+        root = model.objects.add_root()
+        child = root.add_child()
+        grandchild = child.add_child()
+        threads = iter(range(self.NUM_THREADS))
+
+        def write():
+            if next(threads) % 2:
+                node = model.objects.get(pk=grandchild.pk)
+                for _ in range(self.NUM_INSERTS):
+                    node.add_child()
+                    node.add_sibling()
+            else:
+                for _ in range(self.NUM_INSERTS):
+                    root.add_child(position=POSITIONS.FIRST)
+                    model.objects.rebalance(root._path)
+        self.run_threads(write)
+
+        paths = set(model.objects.values_list('_path', flat=True))
+        orphans = [path for path in paths
+                   if path.parent and path.parent not in paths]
+        self.assertEqual(orphans, [])
+        grandchild.refresh_from_db()
+        self.assertEqual(len(grandchild.get_children()),
+                         self.NUM_THREADS // 2 * self.NUM_INSERTS)
+        child.refresh_from_db()
+        self.assertEqual(len(child.get_children()),
+                         self.NUM_THREADS // 2 * self.NUM_INSERTS + 1)
+
+    def test_004_move_to_during_rebalance(self):
+        '''
+        move_to() of subtrees between two nodes, with instances of the nodes
+        and targets fetched before the children of their parent are
+        rebalanced (rewriting their paths) and while nodes are inserted
+        under them, doesn't leave orphaned nodes at the old paths.
+        '''
+        model = NoCustomFieldsOrderedTree
+        root = model.objects.add_root()
+        a = root.add_child()
+        b = root.add_child()
+        threads = iter(range(self.NUM_THREADS))
+        nodes = []
+        for _ in range(self.NUM_THREADS // 2):
+            node = a.add_child()
+            node.add_child()
+            nodes.append(node)
+
+        def write():
+            thread = next(threads)
+            if thread % 2:
+                node = nodes[thread // 2]
+                for i in range(self.NUM_INSERTS):
+                    node.move_to([b, a][i % 2], position=POSITIONS.FIRST)
+            else:
+                for _ in range(self.NUM_INSERTS):
+                    a.add_child(position=POSITIONS.FIRST)
+                    model.objects.rebalance(root._path)
+        self.run_threads(write)
+
+        paths = set(model.objects.values_list('_path', flat=True))
+        orphans = [path for path in paths
+                   if path.parent and path.parent not in paths]
+        self.assertEqual(orphans, [])
+        self.assertEqual(len(paths), 3 + self.NUM_THREADS // 2 *
+                         (2 + self.NUM_INSERTS))
+        for node in nodes:
+            node.refresh_from_db()
+            self.assertEqual(node._path.parent, a._path)
+            self.assertEqual(len(node.get_children()), 1)
+
+    def test_005_concurrent_copy_to(self):
+        '''
+        Concurrent copy_to() of the same node to the same parent of a tree
+        without positions copy it only once.
+        '''
+        node = NoCustomFieldsTree.objects.create(_path='a.x')
+        NoCustomFieldsTree.objects.create(_path='a.x.y')
+        target = NoCustomFieldsTree.objects.create(_path='b')
+        copies = []
+
+        def copy():
+            try:
+                copies.append(node.copy_to(target))
+            except ValueError:
+                pass
+        self.run_threads(copy)
+
+        self.assertEqual(len(copies), 1)
+        self.assertEqual(sorted(NoCustomFieldsTree.objects.filter(
+            _path__descendant='b').values_list('_path', flat=True)),
+            ['b', 'b.x', 'b.x.y'])
@@ -0,0 +1,108 @@
+from django.db import connection
+from django.test.testcases import TestCase
+from django.test.utils import CaptureQueriesContext
+from lsapling.ordering.generic import POSITIONS
+
+from testapp.models import NoCustomFieldsDenormalizedOrderedTree, \
+    NoCustomFieldsDenormalizedTree, NoCustomFieldsTree
+
+
+class DenormalizedTestCase(TestCase):
+    '''
+    Trees with denormalized depth and parent path columns.
+    '''
+    paths = ['Top',
+             'Top.Science',
+             'Top.Science.Astronomy',
+             'Top.Science.Astronomy.Astrophysics',
+             'Top.Science.Astronomy.Cosmology',
+             'Top.Hobbies',
+             'Top.Hobbies.Amateurs_Astronomy',
+             'Top.Collections',
+             'Top.Collections.Pictures']
+
+    @classmethod
+    def setUpTestData(cls):
+        for path in cls.paths:
+            NoCustomFieldsTree.objects.create(_path=path)
+        NoCustomFieldsDenormalizedTree.objects.bulk_create(
+            [NoCustomFieldsDenormalizedTree(_path=path)
+             for path in cls.paths[:4]])
+        for path in cls.paths[4:]:
+            NoCustomFieldsDenormalizedTree.objects.create(_path=path)
+
+    def assertDenormalized(self, model):
+        for node in model.objects.all():
+            self.assertEqual(node._depth, node._path.count('.') + 1)
+            self.assertEqual(node._parent_path, node._path.rpartition('.')[0])
+
+    def test_001_save(self):
+        '''
+        The columns are populated by save() and bulk_create().
+        '''
+        self.assertDenormalized(NoCustomFieldsDenormalizedTree)
+        top = NoCustomFieldsDenormalizedTree.objects.get(_path='Top')
+        self.assertEqual((top._depth, top._parent_path), (1, ''))
+
+    def test_002_same_results(self):
+        '''
+        The queries return the same nodes as without the columns, using
+        equality lookups on the parent path.
+        '''
+        for path in self.paths[1:]:
+            expected = NoCustomFieldsTree.objects.get(_path=path)
+            node = NoCustomFieldsDenormalizedTree.objects.get(_path=path)
+            for method in ['get_children', 'get_siblings']:
+                self.assertEqual(
+                    sorted(n._path for n in getattr(node, method)()),
+                    sorted(n._path for n in getattr(expected, method)()))
+        top = NoCustomFieldsDenormalizedTree.objects.get(_path='Top')
+        self.assertEqual(list(top.get_siblings()), [])
+
+        with CaptureQueriesContext(connection) as queries:
+            list(NoCustomFieldsDenormalizedTree.objects.
+                 filter(_path='Top').get_children())
+        self.assertIn('"_parent_path" IN', queries[0]['sql'])
+        self.assertNotIn('?', queries[0]['sql'])
+
+    def test_003_move_to(self):
+        '''
+        Moving a subtree updates the columns of all its nodes.
+        '''
+        astronomy = NoCustomFieldsDenormalizedTree.objects.get(
+            _path='Top.Science.Astronomy')
+        pictures = NoCustomFieldsDenormalizedTree.objects.get(
+            _path='Top.Collections.Pictures')
+        astronomy.move_to(pictures)
+        self.assertEqual((astronomy._depth, astronomy._parent_path),
+                         (4, 'Top.Collections.Pictures'))
+        self.assertDenormalized(NoCustomFieldsDenormalizedTree)
+
+        astronomy.move_to(pictures, position=POSITIONS.RIGHT)
+        self.assertEqual((astronomy._depth, astronomy._parent_path),
+                         (3, 'Top.Collections'))
+        self.assertDenormalized(NoCustomFieldsDenormalizedTree)
+
+    def test_004_ordered(self):
+        '''
+        Ordered trees keep the columns up to date on inserts, moves and
+        rebalances, and are ordered by the depth column.
+        '''
+        model = NoCustomFieldsDenormalizedOrderedTree
+        root = model.objects.add_root()
+        last = root.add_child()
+        last.add_child().add_child()
+        for _ in range(70):
+            root.add_child(position=POSITIONS.FIRST)
+        model.objects.bulk_load_tree({'children': [{}, {'children': [{}]}]},
+                                     parent=last)
+        self.assertDenormalized(model)
+
+        last.refresh_from_db()
+        last.move_to(root, position=POSITIONS.FIRST)
+        self.assertDenormalized(model)
+        self.assertEqual(root.get_children()[0], last)
+
+        depths = [node._depth for node in model.objects.all()]
+        self.assertEqual(depths, sorted(depths))
+        self.assertNotIn('NLEVEL', str(model.objects.all().query))
@@ -0,0 +1,177 @@
+from django.db import connection
+from django.test.testcases import TestCase
+from lsapling import settings
+from lsapling.fields import NodePathField
+from testapp.models import NoCustomFieldsTree
+
+
+class IndexesTestCase(TestCase):
+    '''
+    Tests that check that the ltree indexes are created and used by the
+    lookups generated by the library.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        paths = ['Top',
+                 'Top.Science',
+                 'Top.Science.Astronomy',
+                 'Top.Science.Astronomy.Astrophysics',
+                 'Top.Science.Astronomy.Cosmology',
+                 'Top.Hobbies',
+                 'Top.Hobbies.Amateurs_Astronomy',
+                 'Top.Collections',
+                 'Top.Collections.Pictures',
+                 'Top.Collections.Pictures.Astronomy',
+                 'Top.Collections.Pictures.Astronomy.Stars',
+                 'Top.Collections.Pictures.Astronomy.Galaxies',
+                 'Top.Collections.Pictures.Astronomy.Astronauts']
+        for path in paths:
+            NoCustomFieldsTree.objects.create(_path=path)
+
+    def get_indexes(self):
+        cursor = connection.cursor()
+        cursor.execute('SELECT indexname, indexdef FROM pg_indexes '
+                       'WHERE tablename = %s',
+                       [NoCustomFieldsTree._meta.db_table])
+        return dict(cursor.fetchall())
+
+    def explain(self, qs):
+        '''
+        Return the plan of a queryset, disabling sequential scans so the
+        planner picks the indexes even on a small table.
+        '''
+        sql, params = qs.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('EXPLAIN ' + sql, params)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def test_001_indexes_created(self):
+        '''
+        Both the B-tree and the GiST indexes are created for the column.
+        '''
+        indexes = self.get_indexes().values()
+        self.assertTrue(any('USING btree (_path)' in index
+                            for index in indexes))
+        self.assertTrue(any('USING gist (_path)' in index
+                            for index in indexes))
+
+    def test_002_lookups_use_gist(self):
+        '''
+        The ltree lookups are resolved using the GiST index.
+        '''
+        gist_index = [name for name, index in self.get_indexes().items()
+                      if 'USING gist' in index][0]
+        querysets = [
+            NoCustomFieldsTree.objects.filter(_path__descendant='Top.Science'),
+            NoCustomFieldsTree.objects.filter(
+                _path__ascendant='Top.Science.Astronomy'),
+            NoCustomFieldsTree.objects.filter(_path__path_like='*.Astronomy'),
+            NoCustomFieldsTree.objects.filter(
+                _path__path_like_txt='Astro* & !pictures@'),
+            NoCustomFieldsTree.objects.get(_path='Top').get_children(),
+        ]
+        for qs in querysets:
+            self.assertIn(gist_index, self.explain(qs))
+
+    def test_003_lookup_strategies(self):
+        '''
+        The lookups with a queryset as right-hand side return the same nodes
+        with all the strategies, ARRAY being the default, and the JOIN
+        strategy uses the GiST index.
+        '''
+        gist_index = [name for name, index in self.get_indexes().items()
+                      if 'USING gist' in index][0]
+        src = NoCustomFieldsTree.objects.filter(
+            _path__in=['Top.Science', 'Top.Collections.Pictures.Astronomy'])
+        for method in ['get_ascendants', 'get_descendants', 'get_children',
+                       'get_siblings']:
+            results = {}
+            for strategy in ['array', 'join', 'exists']:
+                qs = getattr(src.with_lookup_strategy(strategy), method)()
+                self.assertEqual(strategy == 'join', 'JOIN' in str(qs.query))
+                self.assertEqual(strategy == 'exists',
+                                 'EXISTS' in str(qs.query))
+                results[strategy] = set(qs.values_list('_path', flat=True))
+            self.assertTrue(results['array'])
+            self.assertEqual(results['array'], results['join'])
+            self.assertEqual(results['array'], results['exists'])
+
+        connection.cursor().execute('ANALYZE %s' %
+                                    NoCustomFieldsTree._meta.db_table)
+        for method in ['get_ascendants', 'get_descendants', 'get_children']:
+            self.assertIn('array(', str(getattr(src, method)().query))
+            qs = getattr(src.with_lookup_strategy('join'), method)()
+            self.assertIn(gist_index, self.explain(qs))
+
+        settings.LSAPLING_LOOKUP_STRATEGY = 'join'
+        self.addCleanup(setattr, settings, 'LSAPLING_LOOKUP_STRATEGY',
+                        'array')
+        self.assertIn('JOIN', str(src.get_descendants().query))
+
+        for strategy in ['lateral', 'auto']:
+            with self.assertRaises(ValueError):
+                src.with_lookup_strategy(strategy)
+
+    def test_004_btree_index_upgrade(self):
+        '''
+        The post_migrate callback creates the B-tree index missing in the
+        tables migrated when `db_index` was not the default, once.
+        '''
+        from lsapling.apps import create_indexes_callback
+
+        def btree_indexes():
+            return [name for name, index in self.get_indexes().items()
+                    if 'USING btree (_path)' in index]
+
+        index_name = btree_indexes()[0]
+        connection.cursor().execute('DROP INDEX %s' % index_name)
+        self.assertEqual(btree_indexes(), [])
+        create_indexes_callback(None)
+        create_indexes_callback(None)
+        self.assertEqual(btree_indexes(), [index_name])
+
+    def test_005_keyset_seek(self):
+        '''
+        The keyset pages seek the index of their order from the node of the
+        cursor, instead of scanning and filtering the nodes before it.
+        '''
+        indexes = self.get_indexes()
+        btree_index = [name for name, index in indexes.items()
+                       if 'USING btree (_path)' in index][0]
+        nlevel_index = [name for name, index in indexes.items()
+                        if 'USING btree (nlevel(_path), _path)' in index][0]
+        src = NoCustomFieldsTree.objects.get(_path='Top.Science')
+        queryset = NoCustomFieldsTree.objects.all()
+        for order, index, seek in [
+                ('dfs', btree_index, "_path %s 'Top.Science'::ltree"),
+                ('bfs', nlevel_index,
+                 "ROW(nlevel(_path), _path) %s ROW(2, 'Top.Science'::ltree)")]:
+            for reverse, operator in [(False, '>='), (True, '<=')]:
+                page = queryset._filter_keyset(order, src._path, src.pk,
+                                               reverse).\
+                    order_by(*queryset._get_keyset_ordering(order, reverse))
+                plan = self.explain(page[:5])
+                self.assertIn(index, plan)
+                self.assertIn('Index Cond: (%s)' % (seek % operator), plan)
+
+    def test_006_gist_siglen(self):
+        '''
+        The GiST signature length is validated as PostgreSQL does, and the
+        index created with it.
+        '''
+        gist_index = [name for name, index in self.get_indexes().items()
+                      if 'USING gist' in index][0]
+        connection.cursor().execute('DROP INDEX %s' % gist_index)
+        field = NodePathField(gist_siglen=12)
+        field.set_attributes_from_name('_path')
+        connection.cursor().execute(field.get_gist_index_sql(
+            NoCustomFieldsTree, connection.schema_editor()))
+        self.assertIn("siglen='12'",
+                      self.get_indexes()[gist_index])
+
+        NodePathField(gist_siglen=4)
+        NodePathField(gist_siglen=NodePathField.GIST_SIGLEN_MAX)
+        for siglen in [0, 1, 6, 2023, 2028]:
+            with self.assertRaises(ValueError):
+                NodePathField(gist_siglen=siglen)
@@ -0,0 +1,80 @@
+from django.db import connection
+from django.test.testcases import TestCase
+from django.test.utils import CaptureQueriesContext
+from lsapling import instrumentation, settings
+from lsapling.signals import operation_executed
+
+from testapp.models import NoCustomFieldsOrderedTree
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        settings.LSAPLING_INSTRUMENTATION = True
+        self.addCleanup(setattr, settings, 'LSAPLING_INSTRUMENTATION', False)
+        instrumentation.reset_stats()
+
+        self.operations = []
+
+        def callback(sender, operation, queries, duration, sql_duration,
+                     **kwargs):
+            self.operations.append((sender, operation, queries))
+        operation_executed.connect(callback)
+        self.addCleanup(operation_executed.disconnect, callback)
+
+    def test_001_tagged_queries(self):
+        '''
+        The queries of each operation are tagged with its name, including
+        the ones of lazy querysets, which are instrumented when evaluated.
+        '''
+        root = NoCustomFieldsOrderedTree.objects.add_root()
+        with CaptureQueriesContext(connection) as queries:
+            root.add_child()
+        self.assertEqual(len(queries), 3)
+        for query in queries:
+            self.assertTrue(query['sql'].startswith(
+                '/* lsapling: NoCustomFieldsOrderedTree.add_child */ '))
+
+        children = root.get_children()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(children.filter(pk__gt=0)), 1)
+            self.assertEqual(root.get_descendants().count(), 1)
+        self.assertIn('lsapling: NoCustomFieldsOrderedTree.get_children',
+                      queries[0]['sql'])
+        self.assertIn('lsapling: NoCustomFieldsOrderedTree.get_descendants',
+                      queries[1]['sql'])
+
+        with CaptureQueriesContext(connection) as queries:
+            NoCustomFieldsOrderedTree.objects.count()
+        self.assertNotIn('lsapling', queries[0]['sql'])
+
+    def test_002_stats_and_signal(self):
+        '''
+        Nested operations are accounted to the outermost one.
+        '''
+        root = NoCustomFieldsOrderedTree.objects.add_root()
+        root.add_child()
+        root.add_child()
+        list(root.get_children())
+
+        model = NoCustomFieldsOrderedTree
+        self.assertEqual(self.operations,
+                         [(model, 'add_root', 3),
+                          (model, 'add_child', 3),
+                          (model, 'add_child', 3),
+                          (model, 'get_children', 1)])
+        stats = instrumentation.get_stats()
+        self.assertEqual(stats['NoCustomFieldsOrderedTree.add_child']['calls'],
+                         2)
+        self.assertEqual(
+            stats['NoCustomFieldsOrderedTree.add_child']['queries'], 6)
+        self.assertGreater(
+            stats['NoCustomFieldsOrderedTree.add_child']['duration'], 0)
+
+    def test_003_disabled(self):
+        settings.LSAPLING_INSTRUMENTATION = False
+        root = NoCustomFieldsOrderedTree.objects.add_root()
+        with CaptureQueriesContext(connection) as queries:
+            list(root.get_children())
+        self.assertNotIn('lsapling', queries[0]['sql'])
+        self.assertEqual(self.operations, [])
+        self.assertEqual(instrumentation.get_stats(), {})
@@ -0,0 +1,116 @@
+import pickle
+
+from django.core.exceptions import ValidationError
+from django.test.testcases import TestCase
+from lsapling.ltree import LtreePath, Lquery, Ltxtquery
+
+from testapp.models import NoCustomFieldsTree
+
+
+class LtreeTestCase(TestCase):
+    '''
+    LtreePath, Lquery and Ltxtquery value types.
+    '''
+    def test_001_path(self):
+        path = LtreePath('Top.Science.Astronomy')
+        self.assertEqual(path, 'Top.Science.Astronomy')
+        self.assertEqual(path.labels, ('Top', 'Science', 'Astronomy'))
+        self.assertEqual(path.depth, 3)
+        self.assertEqual(path.parent, 'Top.Science')
+        self.assertIsInstance(path.parent, LtreePath)
+        self.assertEqual(path.parent.parent.parent, '')
+        self.assertEqual(path.parent.parent.parent.depth, 0)
+        self.assertIsNone(LtreePath('').parent)
+        self.assertEqual(path.ascendants, ['Top', 'Top.Science'])
+        self.assertEqual(path.child('Stars', 'Sun'),
+                         'Top.Science.Astronomy.Stars.Sun')
+        self.assertEqual(LtreePath('').child('Top'), 'Top')
+
+        self.assertTrue(path.is_ancestor_of(path))
+        self.assertTrue(path.parent.is_ancestor_of(path))
+        self.assertTrue(LtreePath('').is_ancestor_of(path))
+        self.assertFalse(path.is_ancestor_of(path.parent))
+        self.assertFalse(LtreePath('Top.Sci').is_ancestor_of(path))
+        self.assertTrue(path.is_descendant_of('Top'))
+        self.assertFalse(path.is_descendant_of('Top.Hobbies'))
+
+        path = LtreePath('Top.Child1.Child2')
+        self.assertEqual(path.subltree(1, 2), 'Child1')
+        self.assertEqual(path.subpath(0, 2), 'Top.Child1')
+        self.assertEqual(path.subpath(1), 'Child1.Child2')
+        self.assertEqual(path.subpath(-1), 'Child2')
+        self.assertEqual(path.subpath(0, -1), 'Top.Child1')
+        self.assertEqual(LtreePath('1.2.3').lca('1.2.3.4.5.6'), '1.2')
+        self.assertEqual(LtreePath('1.2.3').lca('1.2.3'), '1.2')
+        self.assertEqual(LtreePath('1.2.3').lca('1.2.4', '1.5'), '1')
+
+        restored = pickle.loads(pickle.dumps(path, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual((restored, restored.depth), (path, 3))
+
+    def test_002_field(self):
+        '''
+        The field returns LtreePaths, and converts the assigned strings.
+        '''
+        NoCustomFieldsTree.objects.create(_path='Top')
+        node = NoCustomFieldsTree.objects.create(_path=u'Top.Science')
+        self.assertIsInstance(node._path, LtreePath)
+        node = NoCustomFieldsTree.objects.get(pk=node.pk)
+        self.assertIsInstance(node._path, LtreePath)
+        self.assertEqual(node._path.parent, 'Top')
+        paths = NoCustomFieldsTree.objects.values_list('_path', flat=True)
+        self.assertTrue(all(isinstance(path, LtreePath) for path in paths))
+
+        node._path = 'Top.Bad-Label!'
+        with self.assertRaises(ValidationError):
+            node.full_clean()
+
+    def test_003_lquery(self):
+        for pattern in ['*.Astronomy.*', 'Top.*{0,2}.sport*@.!football|tennis',
+                        'Top.*{1}', '*{,3}.Astro*%', 'Top.Science{1,}',
+                        'Top.*{,}', 'Top.*{2,2}']:
+            self.assertEqual(Lquery(pattern), pattern)
+        for pattern in ['', 'Top..Science', 'Top.*{}', 'Top.*{a}', 'Top.',
+                        "Top'; DROP TABLE x; --", 'Top.!', 'Top.*{3,1}',
+                        'Top.Science{10,9}']:
+            with self.assertRaises(ValueError):
+                Lquery(pattern)
+
+        self.assertEqual(Lquery.from_levels('Top', Lquery.star(1, 3),
+                                            Lquery.level('a*', 'b',
+                                                         negate=True)),
+                         'Top.*{1,3}.!a*|b')
+        self.assertEqual(Lquery.star(), '*')
+        self.assertEqual(Lquery.star(2, 2), '*{2}')
+        self.assertEqual(Lquery.star(2), '*{2,}')
+        self.assertRaises(ValueError, Lquery.star, 3, 1)
+        self.assertEqual(Lquery.descendants('Top', 1, 1), 'Top.*{1}')
+        self.assertEqual(Lquery.descendants('', 1, 1), '*{1}')
+
+        # the lookups validate the patterns
+        with self.assertRaises(ValueError):
+            NoCustomFieldsTree.objects.filter(_path__path_like='Top..*')
+        with self.assertRaises(ValueError):
+            NoCustomFieldsTree.objects.filter(
+                _path__path_like_exact=['Top.*', 'Top.{1}'])
+        # the open quantifier matches any number of levels, as '*'
+        self.assertEqual(
+            NoCustomFieldsTree.objects.filter(
+                _path__path_like='Top.*{,}').count(),
+            NoCustomFieldsTree.objects.filter(
+                _path__path_like='Top.*').count())
+
+    def test_004_ltxtquery(self):
+        for pattern in ['Astro*% & !pictures@', 'Europe & Russia*@ & !Trans',
+                        '!(a | b) & c', 'a', '((a))']:
+            self.assertEqual(Ltxtquery(pattern), pattern)
+        for pattern in ['', 'a &', '& a', '(a', 'a)', 'a b', 'a & !',
+                        'a.b']:
+            with self.assertRaises(ValueError):
+                Ltxtquery(pattern)
+
+        self.assertEqual(Ltxtquery.all('a', Ltxtquery.any('b*', 'c')),
+                         '(a) & ((b*) | (c))')
+        self.assertEqual(Ltxtquery.negate('a & b'), '!(a & b)')
+
+        with self.assertRaises(ValueError):
+            NoCustomFieldsTree.objects.filter(_path__path_like_txt='a & ')
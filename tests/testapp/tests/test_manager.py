@@ -1,5 +1,11 @@
+from django.db import connection
+from django.db.models.signals import post_delete
 from django.test.testcases import TestCase
-from testapp.models import NoCustomFieldsTree
+from django.test.utils import CaptureQueriesContext
+from lsapling.ordering.generic import POSITIONS
+
+from testapp.models import NoCustomFieldsDenormalizedTree, \
+    NoCustomFieldsTree, NoCustomFieldsTreeItem
 
 
 class ManagerTestCase(TestCase):
@@ -112,6 +118,12 @@ class ManagerTestCase(TestCase):
                               'Top.Collections',
                               'Top.Collections.Pictures',
                               'Top.Collections.Pictures.Astronomy']))
+        # the paths are expanded client-side, without subqueries
+        self.assertNotIn('SELECT', str(qs.query).split('WHERE')[1])
+        self.assertEqual(set(qs), set(NoCustomFieldsTree.objects.filter(
+            pk=src.pk).get_ascendants()))
+        self.assertEqual(list(NoCustomFieldsTree.objects.get(
+            _path='Top').get_ascendants()), [])
 
         # several nodes
         src = NoCustomFieldsTree.objects.filter(_path__nlevel=2)
@@ -148,3 +160,314 @@ class ManagerTestCase(TestCase):
                          set(['Top.Collections.Pictures.Astronomy.Galaxies',
                               'Top.Collections.Pictures.Astronomy.Astronauts'])
                          )
+
+    def test_005_move_to(self):
+        '''
+        Manager move_to().
+        '''
+        # only one node: savepoint, lock of the children, refreshed paths of
+        # the share-locked rows, release, lock of the subtree, check of the
+        # new path and a single UPDATE for the whole subtree
+        src = NoCustomFieldsTree.objects.get(_path='Top.Collections.Pictures')
+        target = NoCustomFieldsTree.objects.get(_path='Top.Hobbies')
+        with self.assertNumQueries(7):
+            src.move_to(target)
+
+        self.assertEqual(src._path, 'Top.Hobbies.Pictures')
+        self.assertEqual(set(src.get_descendants().values_list('_path',
+                                                               flat=True)),
+                         set(['Top.Hobbies.Pictures.Astronomy',
+                              'Top.Hobbies.Pictures.Astronomy.Stars',
+                              'Top.Hobbies.Pictures.Astronomy.Galaxies',
+                              'Top.Hobbies.Pictures.Astronomy.Astronauts']))
+        self.assertFalse(NoCustomFieldsTree.objects.get(
+            _path='Top.Collections').get_descendants().exists())
+
+        # several nodes, as siblings
+        src = NoCustomFieldsTree.objects.filter(
+            _path__in=['Top.Science.Astronomy',
+                       'Top.Hobbies.Amateurs_Astronomy'])
+        target = NoCustomFieldsTree.objects.get(_path='Top.Science')
+        src.move_to(target, position=POSITIONS.RIGHT)
+
+        self.assertEqual(set(NoCustomFieldsTree.objects.filter(
+            _path__nlevel=2).values_list('_path', flat=True)),
+            set(['Top.Science',
+                 'Top.Hobbies',
+                 'Top.Collections',
+                 'Top.Astronomy',
+                 'Top.Amateurs_Astronomy']))
+        self.assertEqual(set(NoCustomFieldsTree.objects.get(
+            _path='Top.Astronomy').get_children().values_list('_path',
+                                                              flat=True)),
+            set(['Top.Astronomy.Astrophysics',
+                 'Top.Astronomy.Cosmology']))
+
+    def test_006_move_to_invalid(self):
+        '''
+        Manager move_to() with invalid targets.
+        '''
+        src = NoCustomFieldsTree.objects.get(_path='Top.Science')
+        # into its own subtree
+        target = NoCustomFieldsTree.objects.get(_path='Top.Science.Astronomy')
+        self.assertRaises(ValueError, src.move_to, target)
+        self.assertRaises(ValueError, src.move_to, src)
+        # duplicated path
+        src = NoCustomFieldsTree.objects.get(_path='Top.Science.Astronomy')
+        target = NoCustomFieldsTree.objects.get(
+            _path='Top.Collections.Pictures')
+        self.assertRaises(ValueError, src.move_to, target)
+
+    def test_007_delete_subtrees(self):
+        '''
+        Manager delete_subtrees() with a single DELETE, and with the
+        collector fallback for the related items.
+        '''
+        deleted = []
+
+        def receiver(sender, instance, **kwargs):
+            if sender is NoCustomFieldsTree:
+                deleted.append(instance._path)
+        post_delete.connect(receiver)
+        self.addCleanup(post_delete.disconnect, receiver)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = NoCustomFieldsTree.objects.filter(
+                _path__in=['Top.Science.Astronomy', 'Top.Hobbies',
+                           'Top.Hobbies.Amateurs_Astronomy']).\
+                delete_subtrees()
+        self.assertEqual(result, (5, {2: 1, 3: 2, 4: 2}))
+        self.assertEqual(len(queries), 1)
+        self.assertIn('DELETE', queries[0]['sql'])
+        self.assertEqual(deleted, [])
+        self.assertEqual(
+            set(NoCustomFieldsTree.objects.filter(
+                _path__descendant='Top.Science').values_list('_path',
+                                                              flat=True)),
+            set(['Top.Science']))
+
+        # the related items need the collector
+        pictures = NoCustomFieldsTree.objects.get(
+            _path='Top.Collections.Pictures')
+        stars = NoCustomFieldsTree.objects.get(
+            _path='Top.Collections.Pictures.Astronomy.Stars')
+        NoCustomFieldsTreeItem.objects.create(node=stars, price=1)
+        self.assertEqual(pictures.delete_subtree(fallback=True),
+                         (5, {3: 1, 4: 1, 5: 3}))
+        self.assertEqual(len(deleted), 5)
+        self.assertFalse(NoCustomFieldsTreeItem.objects.exists())
+        self.assertEqual(NoCustomFieldsTree.objects.count(), 3)
+
+        self.assertEqual(NoCustomFieldsTree.objects.none().delete_subtrees(),
+                         (0, {}))
+
+    def test_008_delete_subtrees_denormalized(self):
+        '''
+        Manager delete_subtrees() on trees with a denormalized depth, without
+        related models.
+        '''
+        for path in ['Top', 'Top.Science', 'Top.Science.Astronomy',
+                     'Top.Hobbies']:
+            NoCustomFieldsDenormalizedTree.objects.create(_path=path)
+        science = NoCustomFieldsDenormalizedTree.objects.get(
+            _path='Top.Science')
+        with CaptureQueriesContext(connection) as queries:
+            result = science.delete_subtree(fallback=True)
+        self.assertEqual(result, (2, {2: 1, 3: 1}))
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"_depth"', queries[0]['sql'])
+        self.assertEqual(NoCustomFieldsDenormalizedTree.objects.count(), 2)
+
+    def test_009_copy_to(self):
+        '''
+        Manager copy_to() with a single INSERT for the whole subtree.
+        '''
+        science = NoCustomFieldsTree.objects.get(_path='Top.Science')
+        pictures = NoCustomFieldsTree.objects.get(
+            _path='Top.Collections.Pictures')
+        # savepoint, lock of the children, refreshed paths of the
+        # share-locked rows, release, lock of the subtree, check of the new
+        # path, INSERT ... SELECT and fetching the copy
+        with self.assertNumQueries(8):
+            copy = science.copy_to(pictures)
+        self.assertEqual(copy._path, 'Top.Collections.Pictures.Science')
+        self.assertEqual(
+            set(copy.get_descendants().values_list('_path', flat=True)),
+            set(['Top.Collections.Pictures.Science.Astronomy',
+                 'Top.Collections.Pictures.Science.Astronomy.Astrophysics',
+                 'Top.Collections.Pictures.Science.Astronomy.Cosmology']))
+        self.assertEqual(NoCustomFieldsTree.objects.filter(
+            _path__descendant='Top.Science').count(), 4)
+
+        # duplicated paths
+        self.assertRaises(ValueError, science.copy_to, pictures)
+        top = NoCustomFieldsTree.objects.get(_path='Top')
+        self.assertRaises(ValueError, science.copy_to, top)
+
+    def test_010_prefetch(self):
+        '''
+        Manager prefetch_children(), prefetch_ascendants() and
+        prefetch_descendants() with a single query each.
+        '''
+        qs = NoCustomFieldsTree.objects.filter(_path__nlevel__lte=2).\
+            order_by('_path')
+        with self.assertNumQueries(3):
+            nodes = list(qs.prefetch_children().prefetch_ascendants())
+            children = dict((node._path, set(child._path for child in
+                                             node.get_children()))
+                            for node in nodes)
+            ascendants = dict((node._path, [ascendant._path for ascendant in
+                                            node.get_ascendants()])
+                              for node in nodes)
+        self.assertEqual(children, {
+            'Top': set(['Top.Science', 'Top.Hobbies', 'Top.Collections']),
+            'Top.Science': set(['Top.Science.Astronomy']),
+            'Top.Hobbies': set(['Top.Hobbies.Amateurs_Astronomy']),
+            'Top.Collections': set(['Top.Collections.Pictures'])})
+        self.assertEqual(ascendants, {'Top': [],
+                                      'Top.Science': ['Top'],
+                                      'Top.Hobbies': ['Top'],
+                                      'Top.Collections': ['Top']})
+
+        # depth-limited descendants also provide the children
+        qs = NoCustomFieldsTree.objects.filter(
+            _path__in=['Top.Science', 'Top.Collections'])
+        with self.assertNumQueries(2):
+            nodes = dict((node._path, node)
+                         for node in qs.prefetch_descendants(depth=2))
+            self.assertEqual(
+                set(node._path for node in
+                    nodes['Top.Collections'].get_children()),
+                set(['Top.Collections.Pictures']))
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                nodes['Top.Science'].get_descendants().count(), 3)
+
+        with self.assertNumQueries(2):
+            nodes = dict((node._path, node)
+                         for node in qs.prefetch_descendants())
+            self.assertEqual(
+                set(node._path for node in
+                    nodes['Top.Collections'].get_descendants()),
+                set(['Top.Collections.Pictures',
+                     'Top.Collections.Pictures.Astronomy',
+                     'Top.Collections.Pictures.Astronomy.Stars',
+                     'Top.Collections.Pictures.Astronomy.Galaxies',
+                     'Top.Collections.Pictures.Astronomy.Astronauts']))
+            self.assertEqual(len(nodes['Top.Science'].get_children()), 1)
+
+        # chained querysets are not prefetched
+        with self.assertNumQueries(1):
+            self.assertEqual(nodes['Top.Science'].get_children().filter(
+                _path__nlevel=3).count(), 1)
+        self.assertRaises(ValueError, qs.prefetch_descendants, 0)
+
+    def test_011_get_descendants_depth(self):
+        '''
+        Manager get_descendants() limited to a range of depths.
+        '''
+        collections = NoCustomFieldsTree.objects.get(_path='Top.Collections')
+        qs = collections.get_descendants(max_depth=2)
+        self.assertIn('~', str(qs.query))
+        self.assertEqual(set(qs.values_list('_path', flat=True)),
+                         set(['Top.Collections.Pictures',
+                              'Top.Collections.Pictures.Astronomy']))
+        self.assertEqual(
+            set(collections.get_descendants(min_depth=3).
+                values_list('_path', flat=True)),
+            set(['Top.Collections.Pictures.Astronomy.Stars',
+                 'Top.Collections.Pictures.Astronomy.Galaxies',
+                 'Top.Collections.Pictures.Astronomy.Astronauts']))
+        self.assertEqual(
+            collections.get_descendants(max_depth=0, min_depth=0).get(),
+            collections)
+
+        src = NoCustomFieldsTree.objects.filter(
+            _path__in=['Top.Science', 'Top.Hobbies'])
+        for strategy in ('array', 'join', 'exists'):
+            qs = src.with_lookup_strategy(strategy).get_descendants(
+                max_depth=2, min_depth=2)
+            self.assertEqual(set(qs.values_list('_path', flat=True)),
+                             set(['Top.Science.Astronomy.Astrophysics',
+                                  'Top.Science.Astronomy.Cosmology']))
+
+        # served from the prefetched descendants
+        with self.assertNumQueries(2):
+            science = src.prefetch_descendants(depth=2).get(
+                _path='Top.Science')
+            self.assertEqual(
+                sorted(node._path for node in
+                       science.get_descendants(max_depth=2, min_depth=2)),
+                ['Top.Science.Astronomy.Astrophysics',
+                 'Top.Science.Astronomy.Cosmology'])
+        self.assertRaises(ValueError, collections.get_descendants, 1, 2)
+        self.assertRaises(ValueError, src.get_descendants, min_depth=-1)
+
+    def test_012_move_to_stale(self):
+        '''
+        Manager move_to() with instances whose path was rewritten since they
+        were fetched.
+        '''
+        src = NoCustomFieldsTree.objects.get(_path='Top.Science.Astronomy')
+        target = NoCustomFieldsTree.objects.get(_path='Top.Collections')
+        # both moved through other instances
+        NoCustomFieldsTree.objects.get(_path='Top.Science').move_to(
+            NoCustomFieldsTree.objects.get(_path='Top.Hobbies'))
+        NoCustomFieldsTree.objects.get(_path='Top.Collections').move_to(
+            NoCustomFieldsTree.objects.get(_path='Top.Hobbies.Science'))
+        src.move_to(target)
+
+        self.assertEqual(src._path,
+                         'Top.Hobbies.Science.Collections.Astronomy')
+        self.assertEqual(target._path, 'Top.Hobbies.Science.Collections')
+        self.assertEqual(set(NoCustomFieldsTree.objects.filter(
+            _path__descendant='Top.Hobbies.Science').values_list(
+            '_path', flat=True)),
+            set(['Top.Hobbies.Science',
+                 'Top.Hobbies.Science.Collections',
+                 'Top.Hobbies.Science.Collections.Astronomy',
+                 'Top.Hobbies.Science.Collections.Astronomy.Astrophysics',
+                 'Top.Hobbies.Science.Collections.Astronomy.Cosmology',
+                 'Top.Hobbies.Science.Collections.Pictures',
+                 'Top.Hobbies.Science.Collections.Pictures.Astronomy',
+                 'Top.Hobbies.Science.Collections.Pictures.Astronomy.Stars',
+                 'Top.Hobbies.Science.Collections.Pictures.Astronomy.'
+                 'Galaxies',
+                 'Top.Hobbies.Science.Collections.Pictures.Astronomy.'
+                 'Astronauts']))
+
+        # deleted since fetched
+        src = NoCustomFieldsTree.objects.get(_path='Top.Hobbies.'
+                                             'Amateurs_Astronomy')
+        NoCustomFieldsTree.objects.filter(pk=src.pk).delete()
+        target = NoCustomFieldsTree.objects.get(_path='Top')
+        self.assertRaises(NoCustomFieldsTree.DoesNotExist, src.move_to,
+                          target)
+        self.assertRaises(NoCustomFieldsTree.DoesNotExist, target.move_to,
+                          src, position=POSITIONS.RIGHT)
+
+    def test_013_copy_to_stale(self):
+        '''
+        Manager copy_to() with instances whose path was rewritten since they
+        were fetched.
+        '''
+        src = NoCustomFieldsTree.objects.get(_path='Top.Science.Astronomy')
+        target = NoCustomFieldsTree.objects.get(_path='Top.Hobbies')
+        NoCustomFieldsTree.objects.get(_path='Top.Science').move_to(
+            NoCustomFieldsTree.objects.get(_path='Top.Collections'))
+        NoCustomFieldsTree.objects.get(_path='Top.Hobbies').move_to(
+            NoCustomFieldsTree.objects.get(_path='Top.Collections.Pictures'))
+        copy = src.copy_to(target)
+
+        self.assertEqual(src._path, 'Top.Collections.Science.Astronomy')
+        self.assertEqual(copy._path,
+                         'Top.Collections.Pictures.Hobbies.Astronomy')
+        self.assertEqual(set(copy.get_descendants().values_list(
+            '_path', flat=True)),
+            set(['Top.Collections.Pictures.Hobbies.Astronomy.Astrophysics',
+                 'Top.Collections.Pictures.Hobbies.Astronomy.Cosmology']))
+
+        # deleted since fetched
+        NoCustomFieldsTree.objects.filter(pk=src.pk).delete()
+        self.assertRaises(NoCustomFieldsTree.DoesNotExist, src.copy_to,
+                          target)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from django.test.testcases import TestCase
+from lsapling.functions import Nlevel
 from testapp.models import NoCustomFieldsTree
 
 PRETTY_UPSTREAM = u'''[%s] Top
@@ -48,3 +49,162 @@ class MiscTestCase(TestCase):
         ids = range(root.pk, root.pk+13)
         pretty = root.pretty_print()
         self.assertEqual(pretty, PRETTY_UPSTREAM % tuple(ids))
+
+    def test_002_get_subtree(self):
+        '''
+        Test the get_subtree() function.
+        '''
+        root = NoCustomFieldsTree.objects.get(_path='Top.Collections')
+        with self.assertNumQueries(1):
+            subtree = root.get_subtree()
+            pretty = subtree.pretty_print()
+
+        self.assertEqual(subtree.instance, root)
+        self.assertTrue(subtree.is_root)
+        self.assertEqual([node.instance._path for node in subtree.walk()],
+                         ['Top.Collections',
+                          'Top.Collections.Pictures',
+                          'Top.Collections.Pictures.Astronomy',
+                          'Top.Collections.Pictures.Astronomy.Stars',
+                          'Top.Collections.Pictures.Astronomy.Galaxies',
+                          'Top.Collections.Pictures.Astronomy.Astronauts'])
+        leaf = list(subtree.walk())[-1]
+        self.assertTrue(leaf.is_leaf)
+        self.assertEqual(leaf.level, 3)
+        self.assertEqual(leaf.parent.instance._path,
+                         'Top.Collections.Pictures.Astronomy')
+        self.assertEqual(pretty.splitlines()[-1],
+                         u'        └───[%s] '
+                         u'Top.Collections.Pictures.Astronomy.Astronauts' %
+                         leaf.instance.pk)
+
+        # deleted since fetched, alone or with its descendants
+        pictures = NoCustomFieldsTree.objects.get(
+            _path='Top.Collections.Pictures')
+        NoCustomFieldsTree.objects.filter(pk=pictures.pk).delete()
+        self.assertRaises(NoCustomFieldsTree.DoesNotExist,
+                          pictures.get_subtree)
+        root.delete_subtree()
+        self.assertRaises(NoCustomFieldsTree.DoesNotExist, root.get_subtree)
+
+    def test_003_build_tree(self):
+        '''
+        Test the build_tree() function on several nodes.
+        '''
+        src = NoCustomFieldsTree.objects.filter(_path__path_like='*.Astronomy')
+        with self.assertNumQueries(1):
+            roots = src.build_tree()
+
+        self.assertEqual([root.instance._path for root in roots],
+                         ['Top.Science.Astronomy',
+                          'Top.Collections.Pictures.Astronomy'])
+        self.assertEqual([[child.instance._path for child in root]
+                          for root in roots],
+                         [['Top.Science.Astronomy.Astrophysics',
+                           'Top.Science.Astronomy.Cosmology'],
+                          ['Top.Collections.Pictures.Astronomy.Stars',
+                           'Top.Collections.Pictures.Astronomy.Galaxies',
+                           'Top.Collections.Pictures.Astronomy.Astronauts']])
+
+    def test_004_subtree_serialization(self):
+        '''
+        Test the serialization of a subtree.
+        '''
+        import json
+
+        root = NoCustomFieldsTree.objects.get(_path='Top.Science')
+        subtree = root.get_subtree()
+        expected = {
+            'id': root.pk,
+            '_path': 'Top.Science',
+            'children': [{
+                'id': root.pk+1,
+                '_path': 'Top.Science.Astronomy',
+                'children': [{
+                    'id': root.pk+2,
+                    '_path': 'Top.Science.Astronomy.Astrophysics',
+                    'children': []
+                }, {
+                    'id': root.pk+3,
+                    '_path': 'Top.Science.Astronomy.Cosmology',
+                    'children': []
+                }]
+            }]
+        }
+        self.assertEqual(subtree.to_dict(), expected)
+        self.assertEqual(json.loads(subtree.to_json()), expected)
+
+    def test_005_iter_subtree(self):
+        '''
+        Test the iter_subtree() function, in both orders.
+        '''
+        from lsapling.subtree import ENTER, LEAVE
+
+        src = NoCustomFieldsTree.objects.filter(_path='Top.Science')
+        with self.assertNumQueries(3):
+            nodes = list(src.iter_subtree(chunk_size=2))
+        self.assertEqual([node._path for node in nodes],
+                         ['Top.Science',
+                          'Top.Science.Astronomy',
+                          'Top.Science.Astronomy.Astrophysics',
+                          'Top.Science.Astronomy.Cosmology'])
+
+        # the whole table, breadth-first
+        with self.assertNumQueries(5):
+            nodes = list(NoCustomFieldsTree.objects.iter_subtree(
+                chunk_size=3, order='bfs'))
+        self.assertEqual([node._path for node in nodes],
+                         [node._path for node in
+                          NoCustomFieldsTree.objects.order_by(
+                              Nlevel('_path'), '_path')])
+
+        events = [(event, node._path) for event, node in
+                  src.iter_subtree(chunk_size=2, events=True)]
+        self.assertEqual(events,
+                         [(ENTER, 'Top.Science'),
+                          (ENTER, 'Top.Science.Astronomy'),
+                          (ENTER, 'Top.Science.Astronomy.Astrophysics'),
+                          (LEAVE, 'Top.Science.Astronomy.Astrophysics'),
+                          (ENTER, 'Top.Science.Astronomy.Cosmology'),
+                          (LEAVE, 'Top.Science.Astronomy.Cosmology'),
+                          (LEAVE, 'Top.Science.Astronomy'),
+                          (LEAVE, 'Top.Science')])
+
+        events = [(event, node._path) for event, node in
+                  src.iter_subtree(chunk_size=2, order='bfs', events=True)]
+        self.assertEqual(events,
+                         [(ENTER, 'Top.Science'),
+                          (ENTER, 'Top.Science.Astronomy'),
+                          (LEAVE, 'Top.Science'),
+                          (ENTER, 'Top.Science.Astronomy.Astrophysics'),
+                          (ENTER, 'Top.Science.Astronomy.Cosmology'),
+                          (LEAVE, 'Top.Science.Astronomy'),
+                          (LEAVE, 'Top.Science.Astronomy.Astrophysics'),
+                          (LEAVE, 'Top.Science.Astronomy.Cosmology')])
+
+        with self.assertRaises(ValueError):
+            src.iter_subtree(order='random')
+
+    def test_006_bfs_events_labels(self):
+        '''
+        The breadth-first events compare the paths label by label, as ltree
+        orders them, not as strings ('-' sorts before the '.' separator).
+        '''
+        from lsapling.subtree import ENTER, LEAVE
+
+        for path in ['a', 'a-b', 'a.z', 'a-b.c', 'a-b.c.x']:
+            NoCustomFieldsTree.objects.create(_path=path)
+        src = NoCustomFieldsTree.objects.filter(_path__in=['a', 'a-b'])
+        events = [(event, node._path) for event, node in
+                  src.iter_subtree(order='bfs', events=True)]
+        self.assertEqual(events,
+                         [(ENTER, 'a'),
+                          (ENTER, 'a-b'),
+                          (ENTER, 'a.z'),
+                          (LEAVE, 'a'),
+                          (ENTER, 'a-b.c'),
+                          (LEAVE, 'a-b'),
+                          (LEAVE, 'a.z'),
+                          (ENTER, 'a-b.c.x'),
+                          (LEAVE, 'a-b.c'),
+                          (LEAVE, 'a-b.c.x')])
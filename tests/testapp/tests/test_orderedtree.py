@@ -1,7 +1,7 @@
 from django.test.testcases import TestCase
 from lsapling.ordering.generic import POSITIONS
 
-from testapp.models import NoCustomFieldsOrderedTree
+from testapp.models import FractionalOrderedTree, NoCustomFieldsOrderedTree
 
 
 class OrderedTestCase(TestCase):
@@ -85,3 +85,213 @@ class OrderedTestCase(TestCase):
         # check positions individually
         for a, b in zip(root.get_children(), root.get_children()[1:]):
             self.assertLess(a._position, b._position)
+
+    def test_003_move_to(self):
+        '''
+        Move subtrees around, checking that the order and positions are kept.
+        '''
+        root = NoCustomFieldsOrderedTree.objects.add_root()
+        a = root.add_child()
+        b = root.add_child()
+        c = root.add_child()
+        a1 = a.add_child()
+        a2 = a.add_child()
+        a21 = a2.add_child()
+
+        # as last child: savepoint, lock of the children, refreshed paths of
+        # the share-locked rows, release, lock of the subtree, neighbours,
+        # and one UPDATE for the subtree
+        with self.assertNumQueries(7):
+            a.move_to(c)
+        self.assertEqual(list(root.get_children()), [b, c])
+        self.assertEqual(list(c.get_children()), [a])
+        self.assertEqual(list(a.get_children()), [a1, a2])
+        self.assertEqual(list(a2.get_children()), [a21])
+        a21.refresh_from_db()
+        self.assertEqual(a21._path.split('.')[:3], a._path.split('.'))
+        self.assertEqual(a._path.rsplit('.', 1)[-1], a._position)
+
+        # as siblings
+        a.move_to(b, position=POSITIONS.LEFT)
+        self.assertEqual(list(root.get_children()), [a, b, c])
+        NoCustomFieldsOrderedTree.objects.filter(pk__in=[a1.pk, a2.pk]).\
+            move_to(c, position=POSITIONS.FIRST)
+        self.assertEqual(list(c.get_children()), [a1, a2])
+        self.assertEqual(list(a2.get_descendants()), [a21])
+
+    def test_004_bulk_add_children(self):
+        '''
+        Add several children at once, next to the existing ones.
+        '''
+        root = NoCustomFieldsOrderedTree.objects.add_root()
+        middle = root.add_child()
+
+        with self.assertNumQueries(3):
+            NoCustomFieldsOrderedTree.objects.bulk_add_children(
+                root, [{}] * 3, position=POSITIONS.LAST)
+        NoCustomFieldsOrderedTree.objects.bulk_add_children(
+            root, [{}] * 2, position=POSITIONS.FIRST)
+
+        children = list(root.get_children())
+        self.assertEqual(len(children), 6)
+        self.assertEqual(children[2], middle)
+        for a, b in zip(children, children[1:]):
+            self.assertLess(a._position, b._position)
+
+    def test_005_bulk_load_tree(self):
+        '''
+        Load a nested tree at once, in several chunks.
+        '''
+        data = {'children': [{'children': [{}, {}]},
+                             {},
+                             {'children': [{'children': [{}]}]}]}
+        with self.assertNumQueries(2 + 3):
+            count = NoCustomFieldsOrderedTree.objects.bulk_load_tree(
+                data, batch_size=3)
+        self.assertEqual(count, 8)
+
+        root = NoCustomFieldsOrderedTree.objects.get(_path__nlevel=1)
+        subtree = root.get_subtree()
+        self.assertEqual([len(node.children) for node in subtree.walk()],
+                         [3, 2, 0, 0, 0, 1, 1, 0])
+        for node in subtree.walk():
+            self.assertEqual(node.instance._path.rsplit('.', 1)[-1],
+                             node.instance._position)
+
+    def test_006_rebalance(self):
+        '''
+        Insert siblings at the same spot until the space between them is
+        exhausted, which triggers a rebalance of the positions.
+        '''
+        from lsapling.signals import siblings_rebalanced
+
+        rebalances = []
+
+        def callback(sender, parent_path, count, **kwargs):
+            rebalances.append((parent_path, count))
+        siblings_rebalanced.connect(callback,
+                                    sender=NoCustomFieldsOrderedTree)
+        self.addCleanup(siblings_rebalanced.disconnect, callback,
+                        sender=NoCustomFieldsOrderedTree)
+
+        root = NoCustomFieldsOrderedTree.objects.add_root()
+        last = root.add_child()
+        grandchild = last.add_child()
+        expected = [last]
+        for _ in range(80):
+            expected.insert(0, root.add_child(position=POSITIONS.FIRST))
+        # the rebalance changed the position of the instance
+        last.refresh_from_db()
+        for _ in range(80):
+            expected.insert(-1, last.add_sibling(position=POSITIONS.LEFT))
+
+        self.assertEqual(len(rebalances), 2)
+        self.assertEqual(rebalances[0], (root._path, 64))
+        self.assertSequenceEqual(expected, root.get_children())
+        positions = [node._position for node in root.get_children()]
+        self.assertEqual(positions, sorted(set(positions)))
+        # the descendants are moved along with their ancestors
+        self.assertEqual(list(last.get_children()), [grandchild])
+
+    def test_007_orderer_adapter(self):
+        '''
+        The orderer adapter is shared by the querysets, and can be overridden
+        per model.
+        '''
+        from lsapling.ordering.fractionalorderer import \
+            FractionalOrdererAdapter
+
+        orderer = NoCustomFieldsOrderedTree.objects.all().orderer
+        self.assertIs(orderer,
+                      NoCustomFieldsOrderedTree.objects.filter(pk=1).
+                      order_by('_position').orderer)
+        self.assertIsInstance(FractionalOrderedTree.objects.all().orderer,
+                              FractionalOrdererAdapter)
+
+        root = FractionalOrderedTree.objects.add_root()
+        middle = root.add_child()
+        last = middle.add_sibling()
+        first = middle.add_sibling(position=POSITIONS.FIRST)
+        self.assertSequenceEqual([first, middle, last], root.get_children())
+        self.assertEqual(middle._position, 'i0')
+
+    def test_008_neighbours_single_query(self):
+        '''
+        Adding a node fetches the neighbour positions in a single query.
+        '''
+        root = NoCustomFieldsOrderedTree.objects.add_root()
+        children = [root.add_child() for _ in range(3)]
+
+        # locks (and the refreshed position of the sibling), neighbours and
+        # INSERT
+        for position in [POSITIONS.FIRST, POSITIONS.LAST,
+                         POSITIONS.LEFT, POSITIONS.RIGHT]:
+            with self.assertNumQueries(4):
+                new_node = children[1].add_sibling(position=position)
+            with self.assertNumQueries(3):
+                new_node.add_child(position=position)
+        self.assertEqual(len(root.get_children()), 7)
+
+    def test_009_copy_to(self):
+        '''
+        Copy subtrees with a single INSERT, keeping the relative positions.
+        '''
+        root = NoCustomFieldsOrderedTree.objects.add_root()
+        a = root.add_child()
+        b = root.add_child()
+        a1 = a.add_child()
+        a2 = a.add_child()
+        a2.add_child()
+        a2.add_child(position=POSITIONS.FIRST)
+
+        # savepoint, lock of the children, refreshed paths of the
+        # share-locked rows, release, lock of the subtree, neighbours,
+        # INSERT ... SELECT and fetching the copy
+        with self.assertNumQueries(8):
+            copy = a.copy_to(b)
+        self.assertEqual(copy._path.parent, b._path)
+        self.assertEqual(copy._path.labels[-1], copy._position)
+        self.assertEqual(list(b.get_children()), [copy])
+        self.assertEqual(
+            [(node._path.subpath(copy._path.depth), node._position)
+             for node in copy.get_descendants()],
+            [(node._path.subpath(a._path.depth), node._position)
+             for node in a.get_descendants()])
+        self.assertEqual(len(copy.get_descendants()), 4)
+        # the original subtree is unchanged
+        self.assertEqual(list(a.get_children()), [a1, a2])
+
+        # as siblings, and into its own subtree
+        copies = NoCustomFieldsOrderedTree.objects.filter(
+            pk__in=[a1.pk, a2.pk]).copy_to(a1, position=POSITIONS.LEFT)
+        self.assertEqual([node._path.parent for node in copies],
+                         [a._path, a._path])
+        self.assertEqual(list(a.get_children()),
+                         [copies[0], copies[1], a1, a2])
+        copy = a.copy_to(a2, position=POSITIONS.FIRST)
+        self.assertEqual(a2.get_children()[0], copy)
+        self.assertEqual(len(copy.get_descendants()), 8)
+
+    def test_010_add_sibling_first_last(self):
+        '''
+        add_sibling() as FIRST on the first sibling and as LAST on the last
+        one, bounded by the node itself.
+        '''
+        for model in (NoCustomFieldsOrderedTree, FractionalOrderedTree):
+            root = model.objects.add_root()
+            a = root.add_child()
+            b = root.add_child()
+            # the new nodes become the first and last siblings in turn
+            first = a.add_sibling(position=POSITIONS.FIRST)
+            first2 = first.add_sibling(position=POSITIONS.FIRST)
+            last = b.add_sibling(position=POSITIONS.LAST)
+            last2 = last.add_sibling(position=POSITIONS.LAST)
+            self.assertEqual(list(root.get_children()),
+                             [first2, first, a, b, last, last2])
+
+            # the only child is both the first and the last sibling
+            root = model.objects.add_root()
+            only = root.add_child()
+            first = only.add_sibling(position=POSITIONS.FIRST)
+            last = only.add_sibling(position=POSITIONS.LAST)
+            self.assertEqual(list(root.get_children()), [first, only, last])
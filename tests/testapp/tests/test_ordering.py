@@ -0,0 +1,68 @@
+from random import choice, randint, seed
+
+from django.test.testcases import SimpleTestCase
+from lsapling.ordering.fractionalorderer import FractionalOrdererAdapter
+from lsapling.ordering.generic import POSITIONS
+
+
+class Node(object):
+    def __init__(self, position):
+        self._position = position
+
+
+class FractionalOrdererTestCase(SimpleTestCase):
+    '''
+    Tests for the fractional indexing orderer, independent of the database.
+    '''
+    def setUp(self):
+        self.orderer = FractionalOrdererAdapter()
+
+    def test_001_append_prepend(self):
+        '''
+        Appending and prepending keeps the keys short.
+        '''
+        nodes = [Node(self.orderer.get_position_sibling([None, None, None]))]
+        for _ in range(2000):
+            nodes.append(Node(self.orderer.get_position_sibling(
+                [nodes[0], None, nodes[-1]], POSITIONS.LAST)))
+            nodes.insert(0, Node(self.orderer.get_position_sibling(
+                [nodes[0], None, nodes[-1]], POSITIONS.FIRST)))
+
+        positions = [node._position for node in nodes]
+        self.assertEqual(positions, sorted(set(positions)))
+        self.assertLessEqual(max(len(position) for position in positions), 4)
+
+    def test_002_random_siblings(self):
+        '''
+        Insert keys randomly, checking the order and the allowed characters.
+        '''
+        seed(123321)
+        positions = [self.orderer.get_position_sibling([None, None, None])]
+        for _ in range(2000):
+            index = randint(0, len(positions) - 1)
+            current = Node(positions[index])
+            left = Node(positions[index - 1]) if index > 0 else None
+            right = Node(positions[index + 1]) \
+                if index + 1 < len(positions) else None
+            position = choice([POSITIONS.LEFT, POSITIONS.RIGHT])
+            new_position = self.orderer.get_position_sibling(
+                [left, current, right], position)
+            positions.insert(index + (position == POSITIONS.RIGHT),
+                             new_position)
+
+        self.assertEqual(positions, sorted(set(positions)))
+        for position in positions:
+            self.assertRegexpMatches(position, r'^[0-9a-z]+$')
+            self.assertLessEqual(len(position), 64)
+
+    def test_003_evenly_spaced(self):
+        '''
+        Several keys inserted at once are spread between the bounds.
+        '''
+        left, right = Node('i0'), Node('i1')
+        positions = self.orderer.get_positions_sibling([left, None, right],
+                                                       POSITIONS.LEFT, 20)
+        self.assertEqual(positions, sorted(set(positions)))
+        self.assertLess(left._position, positions[0])
+        self.assertLess(positions[-1], right._position)
+        self.assertLessEqual(max(len(position) for position in positions), 4)
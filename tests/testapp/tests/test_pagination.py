@@ -0,0 +1,128 @@
+from django.test.testcases import TestCase
+from lsapling.functions import Nlevel
+from lsapling.pagination import CursorPaginator, InvalidCursor
+
+from testapp.models import NoCustomFieldsDenormalizedOrderedTree, \
+    NoCustomFieldsTree
+
+
+class PaginationTestCase(TestCase):
+    '''
+    Keyset pagination with CursorPaginator.
+    '''
+    @classmethod
+    def setUpTestData(cls):
+        paths = ['Top',
+                 'Top.Science',
+                 'Top.Science.Astronomy',
+                 'Top.Science.Astronomy.Astrophysics',
+                 'Top.Science.Astronomy.Cosmology',
+                 'Top.Hobbies',
+                 'Top.Hobbies.Amateurs_Astronomy',
+                 'Top.Collections',
+                 'Top.Collections.Pictures',
+                 'Top.Collections.Pictures.Astronomy',
+                 'Top.Collections.Pictures.Astronomy.Stars',
+                 'Top.Collections.Pictures.Astronomy.Galaxies',
+                 'Top.Collections.Pictures.Astronomy.Astronauts']
+        for path in paths:
+            NoCustomFieldsTree.objects.create(_path=path)
+
+    def paginate(self, paginator):
+        '''
+        Return the paths of all the pages, following the next cursors, and
+        the last page.
+        '''
+        pages = []
+        page = paginator.page()
+        while True:
+            pages.append([node._path for node in page])
+            if not page.has_next():
+                return pages, page
+            page = paginator.page(page.next_cursor)
+
+    def test_001_dfs(self):
+        queryset = NoCustomFieldsTree.objects.all()
+        paginator = CursorPaginator(queryset, 4)
+        with self.assertNumQueries(4):
+            pages, last = self.paginate(paginator)
+        self.assertEqual([len(page) for page in pages], [4, 4, 4, 1])
+        self.assertEqual(sum(pages, []), sorted(queryset.values_list(
+            '_path', flat=True)))
+
+        # back to the first page
+        page = paginator.page(last.previous_cursor)
+        self.assertEqual([node._path for node in page], pages[2])
+        page = paginator.page(paginator.page(page.previous_cursor).
+                              previous_cursor)
+        self.assertEqual([node._path for node in page], pages[0])
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+
+        # filtered querysets
+        paginator = CursorPaginator(
+            queryset.filter(_path__descendant='Top.Collections'), 3)
+        self.assertEqual(self.paginate(paginator)[0],
+                         [['Top.Collections',
+                           'Top.Collections.Pictures',
+                           'Top.Collections.Pictures.Astronomy'],
+                          ['Top.Collections.Pictures.Astronomy.Astronauts',
+                           'Top.Collections.Pictures.Astronomy.Galaxies',
+                           'Top.Collections.Pictures.Astronomy.Stars']])
+
+    def test_002_bfs(self):
+        queryset = NoCustomFieldsTree.objects.all()
+        paginator = CursorPaginator(queryset, 5, order='bfs')
+        pages, last = self.paginate(paginator)
+        self.assertEqual(sum(pages, []), [
+            node._path for node in queryset.order_by(Nlevel('_path'),
+                                                     '_path')])
+        page = paginator.page(last.previous_cursor)
+        self.assertEqual([node._path for node in page], pages[1])
+
+        # ordered trees, in the order of their Meta.ordering
+        model = NoCustomFieldsDenormalizedOrderedTree
+        top = model.objects.add_root()
+        for _ in range(3):
+            top.add_child().add_child()
+        paginator = CursorPaginator(model.objects.all(), 2, order='bfs')
+        with self.assertNumQueries(4):
+            pages = self.paginate(paginator)[0]
+        self.assertEqual(sum(pages, []), [node._path for node in
+                                          model.objects.all()])
+        self.assertEqual(paginator.page(paginator.page().next_cursor)[0].
+                         _path.depth, 2)
+
+    def test_003_duplicated_paths(self):
+        '''
+        The nodes sharing a path across the pages are ordered by primary key,
+        and neither skipped nor repeated.
+        '''
+        for _ in range(3):
+            NoCustomFieldsTree.objects.create(_path='Top.Science')
+        queryset = NoCustomFieldsTree.objects.all()
+        for order in ['dfs', 'bfs']:
+            paginator = CursorPaginator(queryset, 2, order=order)
+            pks = []
+            page = paginator.page()
+            while True:
+                pks += [node.pk for node in page]
+                if not page.has_next():
+                    break
+                page = paginator.page(page.next_cursor)
+            self.assertEqual(sorted(pks), sorted(queryset.values_list(
+                'pk', flat=True)))
+            # and back
+            page = paginator.page(page.previous_cursor)
+            self.assertEqual([node.pk for node in page], pks[-4:-2])
+
+    def test_004_invalid_cursor(self):
+        paginator = CursorPaginator(NoCustomFieldsTree.objects.all(), 2)
+        cursor = paginator.page().next_cursor
+        for invalid in ['abc', cursor[:-1] + 'x', cursor.upper()]:
+            self.assertRaises(InvalidCursor, paginator.page, invalid)
+        # cursors of other orders
+        self.assertRaises(InvalidCursor, CursorPaginator(
+            NoCustomFieldsTree.objects.all(), 2, order='bfs').page, cursor)
+        self.assertRaises(ValueError, CursorPaginator,
+                          NoCustomFieldsTree.objects.all(), 0)
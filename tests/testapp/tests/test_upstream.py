@@ -1,4 +1,8 @@
+from django.db.models import Value
 from django.test.testcases import TestCase
+from lsapling.functions import FirstAscendant, FirstDescendant, \
+    FirstPathLike, FirstPathLikeTxt, Lca, LcaAggregate, Ltree2Text, \
+    LtreeConcat, LtreeIndex, Subltree, Text2Ltree
 from testapp.models import NoCustomFieldsTree
 
 
@@ -120,3 +124,78 @@ class UpstreamTestCase(TestCase):
                               'Top.Collections.Pictures.Astronomy.Galaxies',
                               'Top.Collections.Pictures.Astronomy.Astronauts'])
                          )
+
+    def test_005_comparisons(self):
+        '''
+        Test the comparison operators and the ltree2text() transform.
+        '''
+        qs = NoCustomFieldsTree.objects.filter(_path__gt='Top.Science',
+                                               _path__lt='Top.Science.B')
+        self.assertEqual(set(qs.values_list('_path', flat=True)),
+                         set(['Top.Science.Astronomy',
+                              'Top.Science.Astronomy.Astrophysics',
+                              'Top.Science.Astronomy.Cosmology']))
+        self.assertEqual(
+            NoCustomFieldsTree.objects.filter(_path__lte='Top.Collections',
+                                              _path__gte='Top').count(), 2)
+
+        qs = NoCustomFieldsTree.objects.filter(_path__text__endswith='.Stars')
+        self.assertEqual(list(qs.values_list('_path', flat=True)),
+                         ['Top.Collections.Pictures.Astronomy.Stars'])
+
+    def test_006_functions(self):
+        '''
+        Test the functions, with the examples of the documentation.
+        '''
+        node = NoCustomFieldsTree.objects.annotate(
+            subltree=Subltree(Value('Top.Child1.Child2'), 1, 2),
+            index=LtreeIndex(Value('0.1.2.3.5.4.5.6.8.5.6.8'), '5.6'),
+            index_offset=LtreeIndex(Value('0.1.2.3.5.4.5.6.8.5.6.8'), '5.6',
+                                    -4),
+            text2ltree=Text2Ltree(Value('Top.Child1')),
+            ltree2text=Ltree2Text('_path'),
+            concat=LtreeConcat('_path', Text2Ltree(Value('Child1'))),
+            lca=Lca(Value('1.2.3'), Value('1.2.3.4.5.6')),
+            lca_self=Lca('_path', '_path'),
+        ).get(_path='Top.Science')
+        self.assertEqual(node.subltree, 'Child1')
+        self.assertEqual((node.index, node.index_offset), (6, 9))
+        self.assertEqual(node.text2ltree, 'Top.Child1')
+        self.assertEqual(node.ltree2text, 'Top.Science')
+        self.assertEqual(node.concat, 'Top.Science.Child1')
+        self.assertEqual((node.lca, node.lca_self), ('1.2', 'Top'))
+
+        qs = NoCustomFieldsTree.objects.filter(
+            _path__path_like='*.Astronomy.*')
+        self.assertEqual(qs.aggregate(LcaAggregate('_path')),
+                         {'_path__lca': 'Top'})
+        qs = qs.filter(_path__descendant='Top.Science')
+        self.assertEqual(qs.aggregate(lca=LcaAggregate('_path')),
+                         {'lca': 'Top.Science'})
+        self.assertEqual(qs.none().aggregate(lca=LcaAggregate('_path')),
+                         {'lca': None})
+        with self.assertRaises(ValueError):
+            Lca('_path')
+
+    def test_007_first_match(self):
+        '''
+        Test the operators returning the first matching entry of an array.
+        '''
+        sections = ['Top.Science', 'Top.Hobbies', 'Top.Collections']
+        qs = NoCustomFieldsTree.objects.annotate(
+            section=FirstAscendant(sections, '_path'),
+            child=FirstDescendant(['Top.Science.Astronomy.Cosmology',
+                                   'Top.Hobbies.Amateurs_Astronomy'], '_path'),
+            astronomy=FirstPathLike(['Top.Science.Astronomy', 'Top.Hobbies'],
+                                    '*.Astronomy'),
+            hobby=FirstPathLikeTxt(['Top.Science', 'Top.Hobbies'],
+                                   'Hobbies'),
+        )
+        node = qs.get(_path='Top.Science.Astronomy')
+        self.assertEqual(node.section, 'Top.Science')
+        self.assertEqual(node.child, 'Top.Science.Astronomy.Cosmology')
+        self.assertEqual(node.astronomy, 'Top.Science.Astronomy')
+        self.assertEqual(node.hobby, 'Top.Hobbies')
+        node = qs.get(_path='Top')
+        self.assertEqual((node.section, node.child),
+                         (None, 'Top.Science.Astronomy.Cosmology'))